@@ -0,0 +1,196 @@
+"""
+Offline end-to-end benchmark for the /ask pipeline.
+
+Builds a synthetic ARGO database (SQLite by default, or BENCH_DATABASE_URL),
+swaps the Groq client, embedding model and Chroma collection for local
+stand-ins, and drives /ask in-process at several concurrency levels,
+reporting p50/p95/p99 latency, throughput and mean per-stage time.
+
+    python benchmarks/bench_ask.py --profiles 20000 --concurrency 1,4,16 --output ask.json
+    python benchmarks/bench_ask.py --url http://127.0.0.1:5000   # drive a running server instead
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+import synthetic
+import stand_ins
+
+QUERY_TEMPLATES = [
+    "Show profiles in {region} from {start} to {end} with Temperature",
+    "Show profiles in {region} from {start} to {end} with Temperature, Pressure",
+    "Floats in the {region} with thermocline deeper than {depth} dbar",
+    "Where in the {region} is it warmer than {temp} degrees",
+    "Compare temperature profiles in the {region}",
+]
+REGION_NAMES = ['Indian Ocean', 'Arabian Sea', 'Bay of Bengal', 'Equator']
+MONTHS = [('2025-01-01', '2025-03-31'), ('2025-04-01', '2025-06-30'), ('2025-01-01', '2025-08-31')]
+
+def query_mix(n, seed=0):
+    """n queries drawn from the templates, with repeats like real traffic"""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(n):
+        start, end = MONTHS[rng.integers(len(MONTHS))]
+        queries.append(QUERY_TEMPLATES[rng.integers(len(QUERY_TEMPLATES))].format(
+            region=REGION_NAMES[rng.integers(len(REGION_NAMES))], start=start, end=end,
+            depth=int(rng.choice([100, 150, 200])), temp=int(rng.choice([27, 28, 29]))))
+    return queries
+
+def summarize(latencies, wall, errors):
+    latencies = np.asarray(latencies)
+    if len(latencies) == 0:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': int(len(latencies)),
+        'errors': int(errors),
+        'throughput_rps': len(latencies) / wall,
+        'mean_ms': float(latencies.mean() * 1000),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'max_ms': float(latencies.max() * 1000),
+    }
+
+def in_process_sender():
+    """POST /ask through a per-thread Flask test client"""
+    import chatbot
+    local = threading.local()
+
+    def send(query):
+        if not hasattr(local, 'client'):
+            local.client = chatbot.app.test_client()
+        response = local.client.post('/ask', json={'query': query})
+        return response.status_code == 200 and 'error' not in response.get_json()
+    return send
+
+def http_sender(url):
+    def send(query):
+        req = urllib.request.Request(f"{url.rstrip('/')}/ask", data=json.dumps({'query': query}).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout=120) as response:
+                return response.status == 200 and 'error' not in json.loads(response.read())
+        except Exception:
+            return False
+    return send
+
+def run_level(send, queries, concurrency):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def one(query):
+        nonlocal errors
+        start = time.perf_counter()
+        ok = send(query)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            errors += not ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, queries))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+def setup_in_process(args):
+    """Build the fixture and install the stand-ins into chatbot's lazy components"""
+    print(f"Generating {args.profiles} synthetic profiles...")
+    profiles = synthetic.generate_profiles(args.profiles, min_levels=args.min_levels, max_levels=args.max_levels)
+    engine = stand_ins.create_fixture_engine(profiles, args.database_url)
+    embedder = stand_ins.FakeEmbedder(latency=args.embed_latency)
+    collection = stand_ins.InMemoryCollection.from_profiles(profiles, embedder)
+    llm = stand_ins.FakeGroq(latency=args.llm_latency, jitter=args.llm_jitter, error_rate=args.llm_error_rate)
+    work_dir = stand_ins.isolate_outputs()
+    if not args.no_profile_store:
+        import dataset_meta
+        import profile_store
+        profile_store.write_store(profiles, dataset_meta.read_version(engine))
+
+    query_log_path = args.query_log and os.path.abspath(args.query_log)
+    os.chdir(BACKEND_DIR)
+    import chatbot
+    import metrics
+    import query_log
+    query_log.QUERY_LOG_PATH = query_log_path or ''
+    chatbot._components.update(engine=engine, model=embedder, collection=collection, groq=llm)
+    chatbot._ready.set()
+    if args.no_parse_cache:
+        chatbot.PARSE_CACHE_SIZE = 0
+    print(f"Fixture ready: {engine.url.get_backend_name()} with {len(profiles)} profiles, outputs in {work_dir}")
+    return chatbot, metrics, llm
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=5000)
+    parser.add_argument('--min-levels', type=int, default=50)
+    parser.add_argument('--max-levels', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=200, help='requests per concurrency level')
+    parser.add_argument('--concurrency', default='1,2,4,8,16', help='comma-separated sweep')
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='stand-in LLM latency in seconds')
+    parser.add_argument('--llm-jitter', type=float, default=0.1)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--embed-latency', type=float, default=0.005)
+    parser.add_argument('--no-parse-cache', action='store_true', help='force an LLM call per request')
+    parser.add_argument('--no-profile-store', action='store_true', help='read measurement arrays from the database only')
+    parser.add_argument('--database-url', help='fixture database (default: SQLite file, or BENCH_DATABASE_URL)')
+    parser.add_argument('--url', help='benchmark a running backend over HTTP instead of in-process')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--query-log', help='record the generated traffic as a query log (for replay_queries.py)')
+    parser.add_argument('--verbose', action='store_true', help="keep the pipeline's prints and logging")
+    args = parser.parse_args()
+    # The in-process setup changes into the backend directory
+    output = args.output and os.path.abspath(args.output)
+
+    levels = [int(c) for c in args.concurrency.split(',')]
+    queries = query_mix(args.requests)
+    chatbot = metrics = llm = None
+    if args.url:
+        send = http_sender(args.url)
+    else:
+        chatbot, metrics, llm = setup_in_process(args)
+        send = in_process_sender()
+        if not args.verbose:
+            logging.disable(logging.CRITICAL)
+
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'platform': {'python': platform.python_version(), 'machine': platform.machine()},
+        'levels': []
+    }
+    for concurrency in levels:
+        if metrics:
+            metrics.reset()
+        calls_before = llm.calls if llm else 0
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            result = run_level(send, queries, concurrency)
+        result['concurrency'] = concurrency
+        if metrics:
+            result['llm_calls'] = llm.calls - calls_before
+            result['stage_mean_ms'] = {
+                dict(labels)['stage']: total / count * 1000
+                for labels, (count, total) in metrics.histogram_totals('floatchat_stage_duration_seconds').items()
+                if count
+            }
+        report['levels'].append(result)
+        print(f"concurrency={concurrency:3d}  rps={result.get('throughput_rps', 0):8.1f}  "
+              f"p50={result.get('p50_ms', 0):8.1f}ms  p95={result.get('p95_ms', 0):8.1f}ms  "
+              f"p99={result.get('p99_ms', 0):8.1f}ms  errors={result['errors']}")
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {output}")
@@ -0,0 +1,166 @@
+"""
+Ingest and indexing throughput benchmark.
+
+Writes synthetic ARGO CSVs in the ERDDAP layout, runs load_data.load_csv_to_db
+against a fixture database (SQLite by default, or BENCH_DATABASE_URL), then
+embeds and indexes the loaded profiles the way setup_chroma.py does. Records
+per-stage wall time, rows/s and peak RSS for each configuration and appends one
+JSON line per run to the results file, so runs can be compared across commits.
+
+    python benchmarks/bench_ingest.py --rows 100000,1000000 --chunk-sizes 50000,200000
+    python benchmarks/bench_ingest.py --rows 500000 --levels 50-500,500-1500 --real-embeddings
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import pandas as pd
+from sqlalchemy import create_engine
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+import synthetic
+import stand_ins
+import load_data
+import setup_chroma
+
+INGEST_STAGES = ['parse', 'group', 'serialize', 'derive', 'insert', 'index', 'store', 'context', 'climatology', 'trajectories']
+INDEX_STAGES = ['read_profiles', 'embed', 'vector_insert']
+
+# --- Peak memory ---
+def reset_peak_rss():
+    """Reset the kernel's high-water mark so each run reports its own peak (Linux only)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# --- One configuration ---
+def make_index(real):
+    """(collection, model) for indexing: local stand-ins, or Chroma in memory with the real model"""
+    if not real:
+        return stand_ins.InMemoryCollection([], [], []), stand_ins.FakeEmbedder()
+    import chromadb
+    from sentence_transformers import SentenceTransformer
+    client = chromadb.EphemeralClient()
+    name = f"bench_{int(time.time() * 1000)}"
+    return client.create_collection(name), SentenceTransformer('all-MiniLM-L6-v2')
+
+def run_config(args, work_dir, n_rows, chunk_size, min_levels, max_levels):
+    csv_path = os.path.join(work_dir, f"argo_{n_rows}_{min_levels}_{max_levels}.csv")
+    if not os.path.exists(csv_path):
+        print(f"Writing {n_rows} rows ({min_levels}-{max_levels} levels per profile) to {csv_path}...")
+        synthetic.write_argo_csv(csv_path, n_rows, n_floats=args.floats,
+                                 min_levels=min_levels, max_levels=max_levels, seed=args.seed)
+
+    url = args.database_url or os.getenv("BENCH_DATABASE_URL") \
+        or f"sqlite:///{os.path.join(work_dir, 'ingest_bench.db')}"
+    engine = create_engine(url)
+    timings = {}
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+
+    peak_reset = reset_peak_rss()
+    start = time.perf_counter()
+    with quiet:
+        load_data.load_csv_to_db(csv_path, chunk_size=chunk_size, engine=engine, timings=timings,
+                                 stats_path=os.path.join(work_dir, 'load_stats.txt'),
+                                 store_dir=os.path.join(work_dir, 'profile_store'),
+                                 context_stats_path=os.path.join(work_dir, 'db_context_stats.json'),
+                                 climatology_dir=os.path.join(work_dir, 'climatology'))
+    ingest_seconds = time.perf_counter() - start
+    ingest_peak = load_data.peak_rss_mb()
+
+    profiles = None
+    index_seconds = 0.0
+    if not args.skip_index:
+        collection, model = make_index(args.real_embeddings)
+        start = time.perf_counter()
+        with load_data.stage_timer(timings, 'read_profiles'):
+            profiles = pd.read_sql("SELECT * FROM argo_profiles", engine)
+        with quiet:
+            setup_chroma.index_profiles(profiles, collection, model, timings)
+        index_seconds = time.perf_counter() - start
+    n_profiles = len(profiles) if profiles is not None else \
+        int(pd.read_sql("SELECT COUNT(*) AS count FROM argo_profiles", engine)['count'].iloc[0])
+    engine.dispose()
+
+    return {
+        'rows': n_rows,
+        'chunk_size': chunk_size,
+        'min_levels': min_levels,
+        'max_levels': max_levels,
+        'profiles': n_profiles,
+        'csv_mb': os.path.getsize(csv_path) / 1e6,
+        'database': engine.url.get_backend_name(),
+        'embeddings': 'sentence-transformers' if args.real_embeddings else 'stand-in',
+        'stage_seconds': {stage: timings[stage] for stage in INGEST_STAGES + INDEX_STAGES if stage in timings},
+        'ingest_seconds': ingest_seconds,
+        'index_seconds': index_seconds,
+        'ingest_rows_per_s': n_rows / ingest_seconds if ingest_seconds else None,
+        'index_profiles_per_s': n_profiles / index_seconds if index_seconds else None,
+        'peak_rss_mb': load_data.peak_rss_mb(),
+        'ingest_peak_rss_mb': ingest_peak,
+        'peak_rss_per_run': peak_reset,
+    }
+
+def parse_levels(value):
+    ranges = []
+    for part in value.split(','):
+        low, high = part.split('-')
+        ranges.append((int(low), int(high)))
+    return ranges
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', default='100000', help='comma-separated CSV row counts')
+    parser.add_argument('--chunk-sizes', default='50000', help='comma-separated load_data chunk sizes')
+    parser.add_argument('--levels', default='50-500', help='comma-separated min-max levels per profile')
+    parser.add_argument('--floats', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-index', action='store_true', help='only benchmark load_data')
+    parser.add_argument('--real-embeddings', action='store_true',
+                        help='index with all-MiniLM-L6-v2 and an in-memory Chroma collection')
+    parser.add_argument('--database-url', help='fixture database (default: SQLite file, or BENCH_DATABASE_URL)')
+    parser.add_argument('--work-dir', help='where CSVs and the SQLite fixture are written (default: a temp dir)')
+    parser.add_argument('--output', default='ingest_results.jsonl', help='JSON lines file results are appended to')
+    parser.add_argument('--verbose', action='store_true', help="keep load_data's and setup_chroma's prints")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='floatchat_ingest_')
+    os.makedirs(work_dir, exist_ok=True)
+    configs = itertools.product([int(r) for r in args.rows.split(',')],
+                                [int(c) for c in args.chunk_sizes.split(',')],
+                                parse_levels(args.levels))
+    run_info = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_rev': git_revision(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'pandas': pd.__version__,
+    }
+
+    for n_rows, chunk_size, (min_levels, max_levels) in configs:
+        result = run_config(args, work_dir, n_rows, chunk_size, min_levels, max_levels)
+        with open(args.output, 'a') as f:
+            f.write(json.dumps({**run_info, **result}) + '\n')
+        stages = '  '.join(f"{k}={v:.2f}s" for k, v in result['stage_seconds'].items())
+        print(f"rows={n_rows} chunk={chunk_size} levels={min_levels}-{max_levels}  profiles={result['profiles']}  "
+              f"{result['ingest_rows_per_s']:.0f} rows/s  peak={result['peak_rss_mb']:.0f} MB\n  {stages}")
+    print(f"Results appended to {args.output}")
@@ -0,0 +1,134 @@
+"""
+Replay a captured query log against a running backend.
+
+Reads the JSON lines written by query_log.py and re-issues each request
+(/ask with its original cursor/limit/stream options, /ask/batch with its
+original queries) at the recorded inter-arrival times divided by --speed.
+Reports latency percentiles, throughput, how far the replayer fell behind
+schedule and how many answers returned a different row count than logged.
+
+    python benchmarks/replay_queries.py query_log.jsonl --url http://127.0.0.1:5000
+    python benchmarks/replay_queries.py query_log.jsonl --speed 10 --concurrency 64 --output replay.json
+    python benchmarks/replay_queries.py query_log.jsonl --speed 0     # as fast as possible
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+import query_log
+from bench_ask import summarize
+
+REPLAYED_ENDPOINTS = ('ask', 'ask_batch')
+
+def build_requests(records, endpoint=None):
+    """
+    Turn log records into replayable requests, ordered by time. Batch items
+    share a request_id and are folded back into one /ask/batch request.
+    """
+    requests, batches = [], {}
+    for r in sorted(records, key=lambda r: r.get('ts', 0)):
+        kind = r.get('endpoint')
+        if kind not in REPLAYED_ENDPOINTS or (endpoint and kind != endpoint) or not r.get('query'):
+            continue
+        if kind == 'ask':
+            requests.append({'ts': r['ts'], 'path': '/ask', 'body': {'query': r['query'], **r.get('options', {})},
+                             'rows': [r.get('rows')], 'stream': bool(r.get('options', {}).get('stream'))})
+            continue
+        batch = batches.get(r['request_id'])
+        if batch is None:
+            batch = batches[r['request_id']] = {'ts': r['ts'], 'path': '/ask/batch', 'items': {}, 'stream': False}
+            requests.append(batch)
+        batch['ts'] = min(batch['ts'], r['ts'])
+        batch['items'][r.get('batch_index', len(batch['items']))] = (r['query'], r.get('rows'))
+
+    for req in requests:
+        if 'items' in req:
+            by_index = req.pop('items')
+            items = [by_index[i] for i in sorted(by_index)]
+            req['body'] = {'queries': [q for q, _ in items]}
+            req['rows'] = [rows for _, rows in items]
+    return sorted(requests, key=lambda req: req['ts'])
+
+def send(url, req, timeout):
+    """POST one request; returns (ok, row counts per query)"""
+    http_req = urllib.request.Request(url + req['path'], data=json.dumps(req['body']).encode('utf-8'),
+                                      headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(http_req, timeout=timeout) as response:
+            if req['stream']:
+                lines = [json.loads(line) for line in response if line.strip()]
+                return 'error' not in lines[-1], [lines[-1].get('count')]
+            body = json.loads(response.read())
+    except (urllib.error.URLError, OSError, ValueError):
+        return False, [None] * len(req['rows'])
+    if 'results' in body and 'queries' in req['body']:
+        return True, [item.get('count') for item in body['results']]
+    return 'error' not in body, [body.get('count')]
+
+def replay(url, requests, speed, concurrency, timeout):
+    latencies, lags = [], []
+    errors = mismatches = 0
+    lock = threading.Lock()
+
+    def one(req):
+        nonlocal errors, mismatches
+        start = time.perf_counter()
+        ok, rows = send(url, req, timeout)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            errors += not ok
+            mismatches += sum(1 for logged, got in zip(req['rows'], rows)
+                              if ok and logged is not None and got is not None and logged != got)
+
+    first_ts = requests[0]['ts'] if requests else 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for req in requests:
+            due = (req['ts'] - first_ts) / speed if speed else 0.0
+            delay = due - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+            lags.append(max(0.0, -delay))
+            pool.submit(one, req)
+    result = summarize(latencies, time.perf_counter() - start, errors)
+    result['row_count_mismatches'] = mismatches
+    if lags:
+        result['schedule_lag_p95_ms'] = float(np.percentile(lags, 95) * 1000)
+    result['recorded_span_s'] = (requests[-1]['ts'] - first_ts) if requests else 0.0
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('log', help='query log written by the backend (QUERY_LOG_PATH)')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='replay rate relative to the recording (1 = original, 10 = 10x faster, 0 = no waiting)')
+    parser.add_argument('--concurrency', type=int, default=32, help='maximum requests in flight')
+    parser.add_argument('--limit', type=int, help='replay only the first N requests')
+    parser.add_argument('--endpoint', choices=REPLAYED_ENDPOINTS, help='replay only one endpoint')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--output', help='write results as JSON')
+    args = parser.parse_args()
+
+    requests = build_requests(query_log.read(args.log), args.endpoint)[:args.limit]
+    print(f"Replaying {len(requests)} requests against {args.url} at speed {args.speed or 'max'}...")
+    result = replay(args.url.rstrip('/'), requests, args.speed, args.concurrency, args.timeout)
+    print(f"rps={result.get('throughput_rps', 0):.1f}  p50={result.get('p50_ms', 0):.1f}ms  "
+          f"p95={result.get('p95_ms', 0):.1f}ms  p99={result.get('p99_ms', 0):.1f}ms  "
+          f"errors={result['errors']}  row mismatches={result['row_count_mismatches']}  "
+          f"schedule lag p95={result.get('schedule_lag_p95_ms', 0):.1f}ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), **result}, f, indent=2)
+        print(f"Results written to {args.output}")
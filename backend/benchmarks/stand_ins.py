@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+import numpy as np
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import derived
+import dataset_meta
+
+# --- Local stand-ins for the Groq API, the embedding model and Chroma ---
+EMBEDDING_DIM = 384
+
+REGIONS = {
+    'indian ocean': (-30, 30, 20, 120),
+    'arabian sea': (0, 25, 50, 77),
+    'bay of bengal': (5, 23, 80, 95),
+    'equator': (-5, 5, 20, 120),
+}
+
+def templated_parse(user_query):
+    """
+    A {sql, filters} answer in the shape parse_query_with_llm expects, built
+    from keywords in the query. The SQL only uses plain column comparisons so
+    it runs on both PostgreSQL and SQLite.
+    """
+    q = user_query.lower()
+    conditions, filters = [], {}
+
+    for name, (lat_min, lat_max, lon_min, lon_max) in REGIONS.items():
+        if name in q:
+            conditions.append("latitude BETWEEN :lat_min AND :lat_max AND longitude BETWEEN :lon_min AND :lon_max")
+            filters.update(lat_min=lat_min, lat_max=lat_max, lon_min=lon_min, lon_max=lon_max)
+            break
+
+    dates = re.findall(r'\d{4}-\d{2}-\d{2}', q)
+    if len(dates) >= 2:
+        conditions.append("profile_date >= :start_date AND profile_date <= :end_date")
+        filters.update(start_date=f"{dates[0]}T00:00:00Z", end_date=f"{dates[1]}T23:59:59Z")
+
+    match = re.search(r'thermocline deeper than (\d+)', q)
+    if match:
+        conditions.append("thermocline_depth > :depth")
+        filters['depth'] = float(match.group(1))
+
+    match = re.search(r'(?:warmer than|temperature above) (\d+)', q)
+    if match:
+        conditions.append("surface_temperature > :temp")
+        filters['temp'] = float(match.group(1))
+
+    # Always return filters so the PostgreSQL-only fallback SQL is never used
+    if not conditions:
+        conditions.append("latitude BETWEEN :lat_min AND :lat_max")
+        filters.update(lat_min=-90, lat_max=90)
+
+    return {
+        'sql': "SELECT * FROM argo_profiles WHERE " + " AND ".join(conditions) + ";",
+        'filters': filters,
+        'error': None,
+        'warning': None
+    }
+
+class FakeGroq:
+    """
+    Drop-in for groq.Groq: chat.completions.create() sleeps for the configured
+    latency and returns a fenced JSON answer, either templated from the query
+    or cycled from a list of canned responses.
+    """
+    def __init__(self, latency=0.5, jitter=0.1, canned=None, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.canned = canned
+        self.error_rate = error_rate
+        self.calls = 0
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model=None, messages=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+            delay = max(0.0, self.latency + self._rng.normal(0, self.jitter)) if self.jitter else self.latency
+            fail = self._rng.random() < self.error_rate
+        time.sleep(delay)
+
+        if fail:
+            content = "I could not produce JSON for that."
+        else:
+            prompt = messages[-1]['content'] if messages else ''
+            match = re.search(r'User query: (.*)', prompt)
+            user_query = match.group(1).strip() if match else ''
+            answer = self.canned[(call - 1) % len(self.canned)] if self.canned else templated_parse(user_query)
+            content = "```json\n" + json.dumps(answer) + "\n```"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+class FakeEmbedder:
+    """
+    Deterministic feature-hashing embedder with SentenceTransformer's encode()
+    interface; similar texts share tokens and therefore similar vectors.
+    """
+    def __init__(self, dim=EMBEDDING_DIM, latency=0.0):
+        self.dim = dim
+        self.latency = latency
+
+    def _embed(self, text_value):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r'[a-z]+|\d+', text_value.lower()):
+            digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+            h = int.from_bytes(digest, 'little')
+            vector[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        if isinstance(sentences, str):
+            return self._embed(sentences)
+        return np.vstack([self._embed(s) for s in sentences]) if len(sentences) else np.empty((0, self.dim), np.float32)
+
+class InMemoryCollection:
+    """Brute-force cosine kNN with the subset of the Chroma collection API the chatbot uses"""
+    def __init__(self, ids, embeddings, metadatas):
+        self.ids = list(ids)
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.metadatas = list(metadatas)
+
+    @classmethod
+    def from_profiles(cls, profiles, embedder):
+        texts = [
+            f"Float {row.float_id}, date {row.profile_date}, latitude {row.latitude}, longitude {row.longitude}"
+            for row in profiles.itertuples()
+        ]
+        metadatas = [
+            {'profile_id': int(row.profile_id), 'float_id': str(row.float_id), 'profile_date': row.profile_date,
+             'latitude': float(row.latitude), 'longitude': float(row.longitude)}
+            for row in profiles.itertuples()
+        ]
+        return cls([str(pid) for pid in profiles['profile_id']], embedder.encode(texts), metadatas)
+
+    def count(self):
+        return len(self.ids)
+
+    def add(self, ids, embeddings, metadatas=None, **kwargs):
+        self.ids.extend(ids)
+        self.embeddings = np.vstack([self.embeddings.reshape(-1, np.shape(embeddings)[1]),
+                                     np.asarray(embeddings, dtype=np.float32)])
+        self.metadatas.extend(metadatas or [{} for _ in ids])
+
+    def query(self, query_embeddings, n_results=10, **kwargs):
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        scores = queries @ self.embeddings.T
+        k = min(n_results, len(self.ids))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k else np.empty((len(queries), 0), int)
+        result = {'ids': [], 'distances': [], 'metadatas': []}
+        for row, candidates in zip(scores, top):
+            ordered = candidates[np.argsort(-row[candidates])]
+            result['ids'].append([self.ids[i] for i in ordered])
+            result['distances'].append([float(1 - row[i]) for i in ordered])
+            result['metadatas'].append([self.metadatas[i] for i in ordered])
+        return result
+
+# Module-level paths the backend reads its configuration from but never writes
+INPUT_PATHS = {'tune_chroma.CHROMA_PATH'}
+
+def isolate_outputs(work_dir=None):
+    """
+    Point every file the backend writes (context statistics, profile store,
+    climatology, embedding tier, query log, request profiles, chatbot.log) at
+    work_dir, a fresh temporary directory by default, so a benchmark never
+    overwrites the real ones. Returns work_dir.
+    """
+    import climatology
+    import create_context
+    import embedding_tier
+    import profile_store
+    import query_log
+    import request_profiler
+    work_dir = work_dir or tempfile.mkdtemp(prefix='floatchat_bench_')
+    create_context.CONTEXT_STATS_PATH = os.path.join(work_dir, 'db_context_stats.json')
+    profile_store.PROFILE_STORE_DIR = os.path.join(work_dir, 'profile_store')
+    climatology.CLIMATOLOGY_DIR = os.path.join(work_dir, 'climatology')
+    embedding_tier.EMBEDDING_TIER_DIR = os.path.join(work_dir, 'embedding_tier')
+    query_log.QUERY_LOG_PATH = os.path.join(work_dir, 'query_log.jsonl')
+    request_profiler.PROFILE_DIR = os.path.join(work_dir, 'profiles')
+    # Replaces chatbot's own basicConfig (a no-op once this has run)
+    logging.basicConfig(level=logging.INFO, filename=os.path.join(work_dir, 'chatbot.log'), filemode='a',
+                        format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+    return work_dir
+
+def create_fixture_engine(profiles, url=None):
+    """
+    Load synthetic profiles into a database and build the same indexes as
+    load_data.py. Defaults to a SQLite file; pass a PostgreSQL URL (or set
+    BENCH_DATABASE_URL) to benchmark against a local server instead.
+    """
+    url = url or os.getenv("BENCH_DATABASE_URL") \
+        or f"sqlite:///{os.path.join(tempfile.gettempdir(), 'floatchat_bench.db')}"
+    engine = create_engine(url)
+    profiles.to_sql('argo_profiles', engine, if_exists='replace', index=False, chunksize=10000)
+    with engine.connect() as conn:
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS idx_profile_id ON argo_profiles(profile_id);"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_float_id ON argo_profiles(float_id);"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_profile_date ON argo_profiles(profile_date);"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_location ON argo_profiles(latitude, longitude);"))
+        derived.create_derived_indexes(conn)
+        conn.commit()
+    dataset_meta.write_version(engine, len(profiles))
+    return engine
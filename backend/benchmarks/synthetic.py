@@ -0,0 +1,168 @@
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import derived
+
+# --- Synthetic ARGO profile generator ---
+# Floats start somewhere in the Indian Ocean and drift in a random walk,
+# surfacing every 10 days. Temperature follows a mixed layer over a tanh
+# thermocline; salinity is a weak function of depth. A fraction of profiles
+# has no salinity, and some lose temperature/pressure entirely, matching the
+# NaN patterns recorded in load_stats.txt.
+REGION = {'lat_min': -30.0, 'lat_max': 25.0, 'lon_min': 40.0, 'lon_max': 110.0}
+START_DATE = pd.Timestamp('2025-01-01')
+CYCLE_DAYS = 10
+MISSING_SALINITY_FRACTION = 0.15
+EMPTY_PROFILE_FRACTION = 0.05
+
+def synthetic_levels(rng, n_levels, max_pressure=2000.0):
+    """Pressure levels dense near the surface and sparse at depth, like ARGO sampling"""
+    p = np.sort(max_pressure * rng.random(n_levels) ** 2)
+    return np.round(np.maximum(p, 1.0), 1)
+
+def synthetic_temperature(rng, pressure):
+    sst = rng.uniform(24.0, 30.0)
+    mld = rng.uniform(10.0, 120.0)
+    thermocline_width = rng.uniform(50.0, 200.0)
+    deep = rng.uniform(2.0, 5.0)
+    t = deep + (sst - deep) * 0.5 * (1 - np.tanh((pressure - mld - thermocline_width) / thermocline_width))
+    t = np.where(pressure < mld, sst, np.minimum(t, sst))
+    return np.round(t + rng.normal(0, 0.02, len(pressure)), 3)
+
+def synthetic_salinity(rng, pressure):
+    surface = rng.uniform(33.5, 36.5)
+    return np.round(surface + 0.3 * np.tanh(pressure / 500.0) + rng.normal(0, 0.01, len(pressure)), 3)
+
+def generate_profile_arrays(n_profiles, n_floats=None, min_levels=50, max_levels=500, seed=0):
+    """
+    Profile metadata (DataFrame) and ragged measurement arrays (lists of
+    float arrays with NaNs dropped) for n_profiles synthetic profiles.
+    """
+    rng = np.random.default_rng(seed)
+    n_floats = n_floats or max(1, n_profiles // 30)
+    float_ids = 1900000 + rng.choice(8000000, size=n_floats, replace=False)
+
+    # Assign profiles to floats round-robin so every float gets a trajectory
+    owner = np.arange(n_profiles) % n_floats
+    cycle = np.arange(n_profiles) // n_floats
+    start_lat = rng.uniform(REGION['lat_min'], REGION['lat_max'], n_floats)
+    start_lon = rng.uniform(REGION['lon_min'], REGION['lon_max'], n_floats)
+    drift = rng.normal(0, 0.3, (n_profiles, 2))
+    lat = np.zeros(n_profiles)
+    lon = np.zeros(n_profiles)
+    for f in range(n_floats):
+        idx = np.flatnonzero(owner == f)
+        lat[idx] = np.clip(start_lat[f] + np.cumsum(drift[idx, 0]), -60, 30)
+        lon[idx] = np.clip(start_lon[f] + np.cumsum(drift[idx, 1]), 20, 120)
+
+    dates = START_DATE + pd.to_timedelta(cycle * CYCLE_DAYS, unit='D') \
+        + pd.to_timedelta(rng.integers(0, 86400, n_profiles), unit='s')
+
+    pressures, temperatures, salinities = [], [], []
+    for i in range(n_profiles):
+        p = synthetic_levels(rng, int(rng.integers(min_levels, max_levels + 1)))
+        t = synthetic_temperature(rng, p)
+        s = synthetic_salinity(rng, p)
+        if rng.random() < EMPTY_PROFILE_FRACTION:
+            p = t = s = np.empty(0)
+        elif rng.random() < MISSING_SALINITY_FRACTION:
+            s = np.empty(0)
+        pressures.append(p)
+        temperatures.append(t)
+        salinities.append(s)
+
+    meta = pd.DataFrame({
+        'float_id': float_ids[owner],
+        'profile_date': dates.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'latitude': np.round(lat, 4),
+        'longitude': np.round(lon, 4)
+    })
+    return meta, pressures, temperatures, salinities
+
+def generate_profiles(n_profiles, n_floats=None, min_levels=50, max_levels=500, seed=0):
+    """Synthetic rows in the argo_profiles schema written by load_data.py"""
+    meta, pressures, temperatures, salinities = generate_profile_arrays(
+        n_profiles, n_floats, min_levels, max_levels, seed)
+    profiles = meta.assign(
+        pressure_levels=[json.dumps(p.tolist()) for p in pressures],
+        temperature_values=[json.dumps(t.tolist()) for t in temperatures],
+        salinity_values=[json.dumps(s.tolist()) for s in salinities]
+    )
+    profiles = profiles.sort_values(['float_id', 'profile_date'], ignore_index=True)
+    profiles.insert(0, 'profile_id', np.arange(len(profiles), dtype=np.int64))
+    return derived.add_derived_columns(profiles)
+
+# --- Synthetic ARGO CSV (ERDDAP layout read by load_data.py) ---
+CSV_COLUMNS = ['platform_number', 'cycle_number', 'time', 'latitude', 'longitude',
+               'pres_adjusted', 'temp_adjusted', 'psal_adjusted',
+               'pres_adjusted_qc', 'temp_adjusted_qc', 'psal_adjusted_qc']
+CSV_UNITS = ['', '', 'UTC', 'degrees_north', 'degrees_east', 'decibar', 'degree_Celsius', 'PSU', '', '', '']
+BAD_QC_FRACTION = 0.01
+SPORADIC_NAN_FRACTION = 0.01
+
+def write_argo_csv(path, n_rows, n_floats=200, min_levels=50, max_levels=500, seed=0, batch_profiles=500):
+    """
+    Write roughly n_rows measurement rows (one per profile level) to path,
+    including the units row ERDDAP puts on line 2. Whole profiles without
+    data, profiles without salinity, sporadic NaNs and bad QC flags (4) are
+    mixed in; missing values carry QC flag 9. Returns (rows, profiles) written.
+    """
+    rng = np.random.default_rng(seed)
+    float_ids = 1900000 + rng.choice(8000000, size=n_floats, replace=False)
+    lat = rng.uniform(REGION['lat_min'], REGION['lat_max'], n_floats)
+    lon = rng.uniform(REGION['lon_min'], REGION['lon_max'], n_floats)
+    cycles = np.zeros(n_floats, dtype=np.int64)
+    rows_written = profiles_written = 0
+
+    with open(path, 'w') as f:
+        f.write(','.join(CSV_COLUMNS) + '\n')
+        f.write(','.join(CSV_UNITS) + '\n')
+        while rows_written < n_rows:
+            parts = []
+            for _ in range(batch_profiles):
+                if rows_written >= n_rows:
+                    break
+                k = profiles_written % n_floats
+                lat[k] = np.clip(lat[k] + rng.normal(0, 0.3), -60, 30)
+                lon[k] = np.clip(lon[k] + rng.normal(0, 0.3), 20, 120)
+                cycles[k] += 1
+                when = START_DATE + pd.Timedelta(days=int(cycles[k]) * CYCLE_DAYS, seconds=int(rng.integers(86400)))
+
+                n = int(min(rng.integers(min_levels, max_levels + 1), n_rows - rows_written))
+                p = synthetic_levels(rng, n)
+                t = synthetic_temperature(rng, p)
+                s = synthetic_salinity(rng, p)
+                if rng.random() < EMPTY_PROFILE_FRACTION:
+                    p = np.full(n, np.nan)
+                    t = np.full(n, np.nan)
+                    s = np.full(n, np.nan)
+                elif rng.random() < MISSING_SALINITY_FRACTION:
+                    s = np.full(n, np.nan)
+                t = np.where(rng.random(n) < SPORADIC_NAN_FRACTION, np.nan, t)
+
+                qc = {}
+                for name, values in (('pres', p), ('temp', t), ('psal', s)):
+                    flags = np.where(rng.random(n) < BAD_QC_FRACTION, 4, 1)
+                    qc[name] = np.where(np.isnan(values), 9, flags)
+
+                parts.append(pd.DataFrame({
+                    'platform_number': float_ids[k],
+                    'cycle_number': cycles[k],
+                    'time': when.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                    'latitude': round(lat[k], 4),
+                    'longitude': round(lon[k], 4),
+                    'pres_adjusted': p,
+                    'temp_adjusted': t,
+                    'psal_adjusted': s,
+                    'pres_adjusted_qc': qc['pres'],
+                    'temp_adjusted_qc': qc['temp'],
+                    'psal_adjusted_qc': qc['psal']
+                }))
+                rows_written += n
+                profiles_written += 1
+            pd.concat(parts, ignore_index=True).to_csv(f, header=False, index=False)
+    return rows_written, profiles_written
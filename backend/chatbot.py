@@ -1,13 +1,32 @@
-from flask import Flask, request, jsonify
-import chromadb
-from sentence_transformers import SentenceTransformer
+from flask import Flask, request, jsonify, Response, stream_with_context, g
+import numpy as np
 import pandas as pd
 from sqlalchemy import create_engine, text
 import json
-from groq import Groq
+import base64
 import logging
+import math
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import profile_data
+import regrid
+import derived
+import metrics
+import request_profiler
+import query_log
+import spatial_index
+import feature_index
+import climatology
+import trajectories
+import embedding_tier
+import profile_store
+import result_export
+import create_context
+import dataset_meta
 
 app = Flask(__name__)
 
@@ -33,31 +52,204 @@ DB_PORT = '5432'
 DB_NAME = 'floatchat_db'
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-# --- Initialize Chroma and embedding model ---
-try:
+# --- Query pipeline configuration ---
+CHROMA_N_RESULTS = 50
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+HYBRID_NUMERIC_K = 500       # nearest profiles taken from the numeric feature index
+RRF_K = 60                   # reciprocal rank fusion constant
+EMBEDDING_TIER = os.getenv("EMBEDDING_TIER", "0") == "1"   # first-stage search on the quantized tier
+PARSE_CACHE_SIZE = 256
+BATCH_MAX_QUERIES = 500
+BATCH_MAX_WORKERS = 4
+MAX_PAGE_SIZE = 5000
+STREAM_BATCH_SIZE = 500
+MAX_BULK_PROFILES = 1000
+MAX_LEVEL_PROFILES = 5000
+MAX_ANOMALY_PROFILES = 20000
+MAX_TRAJECTORY_FLOATS = 500
+INDEX_MAX_ROWS = 200000      # broader bbox/date bounds are left to the database
+INDEX_MAX_FLOATS = 2000      # largest float list inlined into a narrowed query
+GRID_BASE_DEGREES = 8.0      # /profiles/grid cell size at zoom 0, halved per zoom level
+GRID_MIN_DEGREES = 0.125
+MAX_ZOOM = 22                # deepest web map zoom; larger zooms are clamped
+MAX_GRID_CELLS = 20000       # spatial cells per grid response; coarser cells past this
+GRID_TIME_BINS = {'none': None, 'year': 4, 'month': 7, 'day': 10}   # profile_date prefix length
+GRID_PERIODS = {'year': 'Y', 'month': 'M', 'day': 'D'}
+CONTEXT_CHECK_INTERVAL = 30.0   # seconds between dataset version checks for the LLM context
+
+_parse_cache = OrderedDict()
+_parse_cache_lock = threading.Lock()
+_columns_cache = OrderedDict()
+_columns_cache_lock = threading.Lock()
+
+_context = {'text': None, 'version': None, 'checked': 0.0}
+_context_lock = threading.Lock()
+
+# --- Lazily initialized components ---
+# Chroma, the embedding model and the Groq client are slow to import and
+# construct, so each is built on first use (or by warmup()) rather than at
+# import time. Double-checked locking keeps concurrent first requests from
+# building a component twice.
+_components = {}
+_component_locks = {name: threading.Lock() for name in ('collection', 'model', 'engine', 'groq', 'tier')}
+_component_status = {name: 'pending' if name != 'tier' or EMBEDDING_TIER else 'disabled'
+                     for name in _component_locks}
+# The tier is (re)loaded when the dataset version changes; 'version' is the
+# one the current tier, or the last failed load, was checked against
+_tier_state = {'version': None, 'checked': 0.0}
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+_ready = threading.Event()
+
+def _get_component(name, factory):
+    component = _components.get(name)
+    if component is not None:
+        return component
+    with _component_locks[name]:
+        component = _components.get(name)
+        if component is None:
+            try:
+                component = factory()
+            except Exception as e:
+                _component_status[name] = f"error: {e}"
+                logger.error(f"Initialization error ({name}): {e}")
+                print(f"Initialization failed ({name}): {e}")
+                raise
+            _components[name] = component
+            _component_status[name] = 'ok'
+    return component
+
+def _create_collection():
     print("Initializing ChromaDB...")
+    import chromadb
     client = chromadb.PersistentClient(path="./chroma_db")
-    collection = client.get_or_create_collection("argo_profiles")
+    return client.get_or_create_collection("argo_profiles")
+
+def _create_tier(version):
+    print("Loading quantized embedding tier...")
+    tier = embedding_tier.open_tier()
+    if tier is None:
+        raise FileNotFoundError(f"No embedding tier in {embedding_tier.EMBEDDING_TIER_DIR}")
+    if tier.manifest.get('dataset_version') != version:
+        raise ValueError(f"Embedding tier is for dataset {tier.manifest.get('dataset_version')}, database is "
+                         f"{version}; rebuild it with embedding_tier.py build")
+    count = get_collection().count()
+    if tier.manifest['source_count'] != count:
+        raise ValueError(f"Embedding tier was built from {tier.manifest['source_count']} embeddings, "
+                         f"Chroma has {count}; rebuild it with embedding_tier.py build")
+    return tier
+
+def _create_model():
     print("Initializing embedding model...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer('all-MiniLM-L6-v2')
+
+def _create_engine():
     print("Initializing database engine...")
-    engine = create_engine(DATABASE_URL)
-except Exception as e:
-    logger.error(f"Initialization error: {e}")
-    print(f"Initialization failed: {e}")
-    raise
-
-# --- Groq API Configuration ---
-print("Initializing Groq client...")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    logger.error("GROQ_API_KEY not found in environment variables")
-    print("Error: GROQ_API_KEY not found")
-    raise ValueError("GROQ_API_KEY environment variable is not set")
-groq_client = Groq(api_key=GROQ_API_KEY)
+    return create_engine(DATABASE_URL)
+
+def _create_groq_client():
+    print("Initializing Groq client...")
+    from groq import Groq
+    groq_api_key = os.getenv("GROQ_API_KEY")
+    if not groq_api_key:
+        logger.error("GROQ_API_KEY not found in environment variables")
+        print("Error: GROQ_API_KEY not found")
+        raise ValueError("GROQ_API_KEY environment variable is not set")
+    return Groq(api_key=groq_api_key)
+
+def get_collection():
+    return _get_component('collection', _create_collection)
+
+def get_model():
+    return _get_component('model', _create_model)
+
+def get_engine():
+    return _get_component('engine', _create_engine)
+
+def get_tier():
+    """
+    The quantized embedding tier if it was built for the database's current
+    dataset version, else None (vector search then stays on Chroma). The
+    version is checked at most every CONTEXT_CHECK_INTERVAL seconds; a tier
+    that is missing, stale or fails to load is not retried until the version
+    changes.
+    """
+    if time.monotonic() - _tier_state['checked'] < CONTEXT_CHECK_INTERVAL:
+        return _components.get('tier')
+    with _component_locks['tier']:
+        if time.monotonic() - _tier_state['checked'] < CONTEXT_CHECK_INTERVAL:
+            return _components.get('tier')
+        _tier_state['checked'] = time.monotonic()
+        try:
+            version = dataset_meta.read_version(get_engine())
+        except Exception as e:
+            logger.error(f"Could not read dataset version: {e}")
+            return _components.get('tier')
+        if version == _tier_state['version']:
+            return _components.get('tier')
+        _tier_state['version'] = version
+        _components.pop('tier', None)
+        try:
+            tier = _create_tier(version)
+        except Exception as e:
+            _component_status['tier'] = f"error: {e}"
+            logger.error(f"Initialization error (tier): {e}")
+            print(f"Initialization failed (tier): {e}")
+            return None
+        _components['tier'] = tier
+        _component_status['tier'] = 'ok'
+    return tier
+
+def get_groq_client():
+    return _get_component('groq', _create_groq_client)
+
+def warmup():
+    """
+    Build every component and exercise it once: a dummy encode (loads weights
+    and warms the tokenizer), a Chroma count and a database ping. Marks the
+    service ready only if every step succeeds.
+    """
+    try:
+        get_model().encode("warmup")
+        get_collection().count()
+        with get_engine().connect() as conn:
+            conn.execute(text("SELECT 1"))
+        get_groq_client()
+    except Exception as e:
+        logger.error(f"Warmup failed: {e}")
+        print(f"Warmup failed: {e}")
+        return False
+    # Queries fall back to the database alone if the index cannot be built
+    try:
+        spatial_index.get_index(get_engine())
+    except Exception as e:
+        logger.error(f"Profile index build failed: {e}")
+    if HYBRID_RETRIEVAL:
+        try:
+            feature_index.get_index(get_engine())
+        except Exception as e:
+            logger.error(f"Feature index build failed: {e}")
+    # Without a usable tier, vector search stays on Chroma
+    if EMBEDDING_TIER:
+        get_tier()
+    load_context()
+    _ready.set()
+    logger.info("Warmup complete; service ready")
+    print("Warmup complete; service ready")
+    return True
+
+def start_warmup():
+    """Run warmup() in a background thread once; later calls are no-ops while it runs"""
+    global _warmup_thread
+    with _warmup_lock:
+        if _ready.is_set() or (_warmup_thread is not None and _warmup_thread.is_alive()):
+            return
+        _warmup_thread = threading.Thread(target=warmup, name="warmup", daemon=True)
+        _warmup_thread.start()
 
 # --- Load database context ---
-def load_context():
+def load_static_context():
     print("Loading database context...")
     try:
         with open("db_context.txt", "r") as f:
@@ -67,6 +259,37 @@ def load_context():
         print(f"Error loading db_context.txt: {e}")
         return "Database schema unavailable."
 
+def load_context():
+    """
+    Schema plus data coverage and value ranges for the LLM prompt, rendered
+    from the statistics cached at ingest and kept in memory. The dataset
+    version is checked at most every CONTEXT_CHECK_INTERVAL seconds; a new
+    version reloads the statistics and clears the parse cache, whose answers
+    were made against the old ranges. Falls back to db_context.txt.
+    """
+    if _context['text'] is not None and time.monotonic() - _context['checked'] < CONTEXT_CHECK_INTERVAL:
+        return _context['text']
+    with _context_lock:
+        if _context['text'] is not None and time.monotonic() - _context['checked'] < CONTEXT_CHECK_INTERVAL:
+            return _context['text']
+        _context['checked'] = time.monotonic()
+        try:
+            version = dataset_meta.read_version(get_engine())
+            if version != _context['version']:
+                stats = create_context.load_stats(get_engine(), version)
+                text_context = create_context.render_context(stats)
+                if _context['version'] is not None:
+                    with _parse_cache_lock:
+                        _parse_cache.clear()
+                _context.update(text=text_context, version=version)
+                logger.info(f"Loaded LLM context for dataset {version} "
+                            f"(~{create_context.estimate_tokens(text_context)} tokens)")
+        except Exception as e:
+            logger.error(f"Context statistics unavailable: {e}")
+            if _context['text'] is None:
+                return load_static_context()
+    return _context['text']
+
 # --- Parse query with LLaMA-3.3-70B via Groq ---
 def parse_query_with_llm(user_query):
     context = load_context()
@@ -82,10 +305,11 @@ def parse_query_with_llm(user_query):
     - For locations, interpret named regions (e.g., 'Indian Ocean': latitude -30 to 30, longitude 20 to 120; 'Arabian Sea': latitude 0 to 25, longitude 50 to 77).
     - For time periods, interpret absolute dates (e.g., '2025': profile_date LIKE :year || '%'; 'January 2025': profile_date LIKE :month || '%') or relative periods (e.g., 'last 6 months': profile_date::timestamp >= CURRENT_DATE - INTERVAL '6 months').
     - For parameters (temperature, pressure), use json_array_elements(column::json) with conditions (e.g., for 'temperature above 15C': EXISTS (SELECT 1 FROM json_array_elements(temperature_values::json) t WHERE (t->>'value')::float > :temp); for 'pressure above 100 dbar': EXISTS (SELECT 1 FROM json_array_elements(pressure_levels::json) p WHERE (p->>'value')::float > :pressure)).
-    - Use reasonable thresholds (e.g., temperature > 15C, pressure > 100 dbar) to maximize results.
+    - Use reasonable thresholds (e.g., temperature > 15C, pressure > 100 dbar) to maximize results, keeping thresholds and dates inside the data ranges listed above.
     - For non-empty arrays, use json_array_length(column::json) > 0.
     - For gradient queries (e.g., 'temperature gradient across depths'), select temperature_values and pressure_levels, order by (p->>'value')::float ASC.
-    - For unsupported parameters (e.g., 'salinity'), return an empty SQL query with an error message: 'Salinity not supported in MVP.'
+    - Derived quantities are precomputed, indexed REAL columns: mld_temp (mixed layer depth, dbar), thermocline_depth (dbar), max_temp_gradient (C per dbar), surface_temperature (C), surface_salinity (PSU). Use them directly for mixed layer, thermocline, gradient strength or sea-surface questions (e.g., 'thermocline deeper than 150 dbar': thermocline_depth > :depth) instead of json_array_elements.
+    - Salinity is supported at the sea surface only: answer sea-surface salinity questions with surface_salinity (e.g., 'surface salinity above 35 PSU': surface_salinity > :salinity). For salinity at depth or salinity profiles, return an empty SQL query with an error message: 'Only sea-surface salinity is supported.'
     - Ensure SQL is valid PostgreSQL, uses parameterized queries (e.g., :lat_min, :temp) for safety, and avoids SQL injection.
     - Avoid DATE_PART or DATE_TRUNC unless profile_date is cast to timestamp.
     - If ambiguous, generate a broad SQL query (e.g., select all fields with float_id = ANY(:ids)).
@@ -116,15 +340,17 @@ def parse_query_with_llm(user_query):
     """
     
     try:
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=1500,
-            temperature=0.7
-        )
+        with metrics.stage_timer('llm'):
+            response = get_groq_client().chat.completions.create(
+                model="llama-3.3-70b-versatile",
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=1500,
+                temperature=0.7
+            )
         json_str = response.choices[0].message.content.split("```json\n")[1].split("\n```")[0]
         return json.loads(json_str)
     except Exception as e:
+        metrics.inc('floatchat_llm_errors_total')
         logger.error(f"LLM parsing error: {e}")
         print(f"LLM parsing error: {e}")
         return {
@@ -135,89 +361,429 @@ def parse_query_with_llm(user_query):
         }
 
 # --- Query function ---
-def query_profiles(user_query):
-    try:
-        print(f"Processing query: {user_query}")
-        logger.info(f"Processing query: {user_query}")
+def normalize_query(user_query):
+    """Canonical form of a query used to deduplicate identical questions"""
+    return " ".join(user_query.lower().split()).rstrip("?.! ")
+
+def cached_parse(user_query):
+    """
+    Parse a query with the LLM, reusing earlier parses of the same normalized
+    query. Returns (query_info, source) where source is 'llm' or 'cache'.
+    """
+    key = normalize_query(user_query)
+    with _parse_cache_lock:
+        if key in _parse_cache:
+            _parse_cache.move_to_end(key)
+            metrics.inc('floatchat_parse_cache_hits_total')
+            return _parse_cache[key], 'cache'
+    
+    metrics.inc('floatchat_parse_cache_misses_total')
+    query_info = parse_query_with_llm(user_query)
+    
+    # Only successful parses are worth reusing; errors may be transient
+    if not query_info.get("error"):
+        with _parse_cache_lock:
+            _parse_cache[key] = query_info
+            while len(_parse_cache) > PARSE_CACHE_SIZE:
+                _parse_cache.popitem(last=False)
+    return query_info, 'llm'
+
+def build_sql(user_query, query_info, profile_ids):
+    """
+    Turn an LLM parse into SQL and params, falling back to rule-based SQL
+    (marked with parse_source 'rule')
+    """
+    sql = query_info.get('sql')
+    params = {'ids': profile_ids}
+    params.update(query_info.get('filters', {}))
+    
+    # Fallback SQL if LLM fails or returns empty/invalid SQL
+    if not sql or not query_info.get('filters'):
+        logger.info("Using fallback SQL query")
+        print("Using fallback SQL query")
+        metrics.inc('floatchat_fallback_sql_total')
+        sql = """
+        SELECT profile_id, float_id, profile_date, latitude, longitude,
+               temperature_values, pressure_levels
+        FROM argo_profiles
+        WHERE float_id = ANY(:ids)
+          AND json_array_length(temperature_values::json) > 0
+        """
         
-        # Get embedding and query Chroma
-        query_embedding = model.encode(user_query).tolist()
-        results = collection.query(query_embeddings=[query_embedding], n_results=50)
-        profile_ids = [int(m['float_id']) for m in results['metadatas'][0]]
-        logger.info(f"Chroma returned float_ids: {profile_ids}")
-        print(f"Chroma returned {len(profile_ids)} profile IDs")
+        if "pressure" in user_query.lower():
+            sql += " AND json_array_length(pressure_levels::json) > 0"
         
-        # Get LLM-generated query parameters
-        query_info = parse_query_with_llm(user_query)
-        if query_info.get("error"):
-            logger.warning(f"Query failed: {query_info['error']}")
-            print(f"Query error: {query_info['error']}")
-            return {'error': query_info['error']}
+        # Only sea-surface salinity is available, as the surface_salinity column
+        if "salinity" in user_query.lower():
+            if "surface" not in user_query.lower():
+                return {'error': 'Only sea-surface salinity is supported.', 'parse_source': 'rule'}
+            sql = sql.replace("temperature_values, pressure_levels", "temperature_values, pressure_levels, surface_salinity", 1)
+            sql += " AND surface_salinity IS NOT NULL"
         
-        sql = query_info.get('sql')
-        params = {'ids': profile_ids}
-        params.update(query_info.get('filters', {}))
+        if "last" in user_query.lower() and ("month" in user_query.lower() or "year" in user_query.lower()):
+            sql += " AND profile_date::timestamp >= CURRENT_DATE - INTERVAL :interval"
+            params['interval'] = '6 months' if "month" in user_query.lower() else '1 year'
         
-        # Fallback SQL if LLM fails or returns empty/invalid SQL
-        if not sql or not query_info.get('filters'):
-            logger.info("Using fallback SQL query")
-            print("Using fallback SQL query")
-            sql = """
-            SELECT float_id, profile_date, latitude, longitude,
-                   temperature_values, pressure_levels
-            FROM argo_profiles
-            WHERE float_id = ANY(:ids)
-              AND json_array_length(temperature_values::json) > 0
-            """
-            
-            if "pressure" in user_query.lower():
-                sql += " AND json_array_length(pressure_levels::json) > 0"
-            
-            if "salinity" in user_query.lower():
-                return {'error': 'Salinity not supported in MVP.'}
-            
-            if "last" in user_query.lower() and ("month" in user_query.lower() or "year" in user_query.lower()):
-                sql += " AND profile_date::timestamp >= CURRENT_DATE - INTERVAL :interval"
-                params['interval'] = '6 months' if "month" in user_query.lower() else '1 year'
-            
-            if "temperature" in user_query.lower() and "gradient" not in user_query.lower():
-                sql += " AND EXISTS (SELECT 1 FROM json_array_elements(temperature_values::json) t WHERE (t->>'value')::float > :temp)"
-                params['temp'] = 15
+        if "temperature" in user_query.lower() and "gradient" not in user_query.lower():
+            sql += " AND EXISTS (SELECT 1 FROM json_array_elements(temperature_values::json) t WHERE (t->>'value')::float > :temp)"
+            params['temp'] = 15
         
+        return {'sql': sql, 'params': params, 'parse_source': 'rule'}
+    
+    return {'sql': sql, 'params': params}
+
+def nearest_floats(query_embeddings):
+    """
+    Float ids of the CHROMA_N_RESULTS nearest profiles for each query
+    embedding. With EMBEDDING_TIER on, the quantized tier answers (compact
+    scan, float32 re-rank); Chroma answers otherwise or if the tier fails.
+    """
+    tier = get_tier() if EMBEDDING_TIER else None
+    if tier is not None:
+        try:
+            with metrics.stage_timer('tier'):
+                return [tier.search(embedding, CHROMA_N_RESULTS)[1].tolist() for embedding in query_embeddings]
+        except Exception as e:
+            logger.error(f"Embedding tier error, using Chroma: {e}")
+    with metrics.stage_timer('chroma'):
+        results = get_collection().query(query_embeddings=query_embeddings, n_results=CHROMA_N_RESULTS)
+    return [[int(m['float_id']) for m in metadatas] for metadatas in results['metadatas']]
+
+def hybrid_candidates(text_ids, query_info):
+    """
+    Fuse the Chroma ranking of float ids with the numeric feature index's
+    ranking for the constraints in the parsed SQL (reciprocal rank fusion).
+    The text ranking is returned unchanged when the SQL has no usable
+    constraints or the feature index is unavailable.
+    """
+    constraints = feature_index.constraints_from_sql(query_info.get('sql'), query_info.get('filters') or {})
+    if not HYBRID_RETRIEVAL or not constraints:
+        return text_ids
+    try:
+        with metrics.stage_timer('features'):
+            numeric_ids = feature_index.get_index(get_engine()).ranked_floats(constraints, HYBRID_NUMERIC_K)
+    except Exception as e:
+        logger.error(f"Feature index error: {e}")
+        return text_ids
+    fused = feature_index.fuse_rankings([text_ids, numeric_ids], k=RRF_K, limit=CHROMA_N_RESULTS)
+    logger.info(f"Hybrid retrieval on {sorted(constraints)}: {len(fused)} floats")
+    query_log.note(hybrid_features=sorted(constraints))
+    return fused
+
+def projected_columns(sql, params):
+    """
+    Names of the columns profile SQL returns, from a LIMIT 0 probe the
+    database only plans. Cached per SQL text, since generated SQL repeats;
+    an empty set when the probe fails.
+    """
+    key = sql.strip().rstrip(';')
+    with _columns_cache_lock:
+        if key in _columns_cache:
+            _columns_cache.move_to_end(key)
+            return _columns_cache[key]
+    try:
+        with get_engine().connect() as conn:
+            columns = frozenset(conn.execute(text(f"SELECT * FROM ({key}) AS probe LIMIT 0"), params).keys())
+    except Exception as e:
+        logger.error(f"Could not read the columns of the profile SQL: {e}")
+        return frozenset()
+    with _columns_cache_lock:
+        _columns_cache[key] = columns
+        while len(_columns_cache) > PARSE_CACHE_SIZE:
+            _columns_cache.popitem(last=False)
+    return columns
+
+def narrow_with_index(plan):
+    """
+    Restrict a plan's SQL to the floats the in-memory spatiotemporal index
+    finds inside its lat/lon/date bounds. Plans without usable bounds, with
+    too many candidates, or whose SQL does not return float_id are returned
+    unchanged; plans that cannot match anything get sql None and never reach
+    the database.
+    """
+    bounds = spatial_index.bounds_from_sql(plan.get('sql'), plan.get('params', {}))
+    if not bounds or 'float_id' not in projected_columns(plan['sql'], plan.get('params', {})):
+        return plan
+    try:
+        with metrics.stage_timer('index'):
+            index = spatial_index.get_index(get_engine())
+            floats = index.candidate_floats(max_rows=INDEX_MAX_ROWS, **bounds)
+    except Exception as e:
+        logger.error(f"Profile index error: {e}")
+        return plan
+    if floats is None or len(floats) > INDEX_MAX_FLOATS:
+        return plan
+    if len(floats) == 0:
+        # The index may predate an ingest by up to VERSION_CHECK_INTERVAL; only
+        # skip the database when it was built from the current data
+        try:
+            current = dataset_meta.read_version(get_engine()) == index.version
+        except Exception as e:
+            logger.error(f"Could not read dataset version: {e}")
+            current = False
+        if not current:
+            return plan
+        return {**plan, 'sql': None, 'planned_sql': plan['sql'], 'index_candidates': 0, 'index_version': index.version}
+    # Candidates are integers from the index, so inlining them is safe
+    sql = (f"SELECT * FROM ({plan['sql'].strip().rstrip(';')}) AS indexed "
+           f"WHERE float_id IN ({', '.join(str(int(f)) for f in floats)})")
+    return {**plan, 'sql': sql, 'planned_sql': plan['sql'], 'index_candidates': len(floats),
+            'index_version': index.version}
+
+def format_profile(row, counts=None):
+    """
+    Summarize one argo_profiles row (DataFrame row or result mapping) for the
+    API. counts, when given, is (temperature_count, pressure_count) from the
+    profile store and saves decoding the JSON arrays.
+    """
+    profile_id = row.get('profile_id')
+    if counts is None:
+        counts = (len(json.loads(row.get('temperature_values') or '[]')),
+                  len(json.loads(row.get('pressure_levels') or '[]')))
+    return {
+        'profile_id': int(profile_id) if profile_id is not None and pd.notna(profile_id) else None,
+        'float_id': row['float_id'],
+        'date': str(row['profile_date']),
+        'latitude': float(row['latitude']),
+        'longitude': float(row['longitude']),
+        'temperature_count': counts[0],
+        'pressure_count': counts[1],
+        **{col: float(row[col]) for col in derived.DERIVED_COLUMNS
+           if col in row and row[col] is not None and pd.notna(row[col])}
+    }
+
+def measurement_counts(profiles):
+    """
+    (temperature_count, pressure_count) per DataFrame row from the profile
+    store, or None for rows it cannot answer (no store, no profile_id).
+    """
+    if len(profiles) == 0 or 'profile_id' not in profiles.columns:
+        return [None] * len(profiles)
+    store = profile_store.current(get_engine())
+    if store is None:
+        return [None] * len(profiles)
+    positions = store.positions(profiles['profile_id'].fillna(-1).astype('int64'))
+    temperature = store.counts('temperature')[positions]
+    pressure = store.counts('pressure')[positions]
+    return [(int(t), int(p)) if pos >= 0 else None for pos, t, p in zip(positions, temperature, pressure)]
+
+# Page keys: (float_id, profile_date) is not unique, so profile_id breaks ties.
+# Results without profile_id are paged by row offset instead.
+PAGE_KEY = ('float_id', 'profile_date', 'profile_id')
+OFFSET_ORDER = ('float_id', 'profile_date', 'latitude', 'longitude')
+
+def encode_cursor(profile, offset=None):
+    """
+    Opaque cursor pointing just after a formatted profile: its page key, or
+    for rows without profile_id the number of rows already returned (offset).
+    None for rows without a key.
+    """
+    if profile.get('float_id') is None or profile.get('date') in (None, 'None'):
+        return None
+    if profile.get('profile_id') is not None:
+        key = [profile['float_id'], profile['date'], profile['profile_id']]
+    elif offset is not None:
+        key = {'offset': int(offset)}
+    else:
+        return None
+    key = json.dumps(key, default=lambda v: v.item())
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """{'float_id', 'profile_date', 'profile_id'} of a keyset cursor, or {'offset'} of an offset cursor"""
+    key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    if isinstance(key, dict):
+        offset = int(key['offset'])
+        if offset < 0:
+            raise ValueError('Negative cursor offset')
+        return {'offset': offset}
+    float_id, profile_date, profile_id = key
+    return {'float_id': float_id, 'profile_date': profile_date, 'profile_id': profile_id}
+
+def page_offset(cursor):
+    """Rows before the page a cursor points to (0 for keyset cursors)"""
+    return decode_cursor(cursor).get('offset', 0) if cursor else 0
+
+def paginate_sql(sql, params, cursor=None, limit=None):
+    """
+    Wrap profile SQL in a keyset page ordered by (float_id, profile_date,
+    profile_id). Callers ask for one row more than the page size so they can
+    tell whether another page follows. SQL without profile_id is paged by
+    OFFSET instead, ordered by whichever of OFFSET_ORDER it returns. SQL that
+    does not return float_id and profile_date is only limited, and cannot be
+    continued with a cursor.
+    """
+    params = dict(params)
+    paged = f"SELECT * FROM ({sql.strip().rstrip(';')}) AS page"
+    columns = projected_columns(sql, params)
+    if not {'float_id', 'profile_date'} <= columns:
+        if cursor:
+            raise ValueError('This query does not return float_id and profile_date, so it cannot be paged')
+        if limit:
+            paged += " LIMIT :page_limit"
+            params['page_limit'] = limit
+            return paged, params
+        return sql, params
+    key = decode_cursor(cursor) if cursor else {}
+    if 'profile_id' in columns:
+        order = PAGE_KEY
+        if 'profile_id' in key:
+            params.update({f"cursor_{column}": key[column] for column in PAGE_KEY})
+            paged += (f" WHERE ({', '.join(PAGE_KEY)}) > "
+                      f"({', '.join(f':cursor_{column}' for column in PAGE_KEY)})")
+    else:
+        if 'profile_id' in key:
+            raise ValueError('This query does not return profile_id, so it cannot continue from a keyset cursor')
+        order = [column for column in OFFSET_ORDER if column in columns]
+    paged += f" ORDER BY {', '.join(order)}"
+    if limit:
+        paged += " LIMIT :page_limit"
+        params['page_limit'] = limit
+    if key.get('offset'):
+        paged += " OFFSET :page_offset"
+        params['page_offset'] = key['offset']
+    return paged, params
+
+def _iter_profile_rows(sql, params):
+    """Result rows from a server-side cursor (none when the index ruled everything out)"""
+    if sql is None:
+        logger.info("Profile index found no candidates; skipping SQL")
+        return
+    print(f"Streaming SQL: {sql} with params: {params}")
+    logger.info(f"Streaming SQL: {sql} with params: {params}")
+    request_profiler.record_sql(sql, params)
+    with get_engine().connect() as conn:
+        with metrics.stage_timer('sql'):
+            result = conn.execution_options(stream_results=True, yield_per=STREAM_BATCH_SIZE).execute(text(sql), params)
+        yield from result.mappings()
+
+def stream_profile_rows(sql, params, warning=None, limit=None, query_id=None, offset=0):
+    """
+    Yield NDJSON lines as the database cursor produces rows. A server-side
+    cursor (stream_results) keeps memory flat and the first row is sent
+    before the rest of the result has been read. The last line is a summary
+    with the row count, the export query id and, for paginated requests, the
+    next cursor (offset is the number of rows before this page).
+    """
+    count = 0
+    last = None
+    next_cursor = None
+    try:
+        for row in _iter_profile_rows(sql, params):
+            if limit and count == limit:
+                next_cursor = encode_cursor(last, offset + limit)
+                break
+            last = format_profile(row)
+            count += 1
+            yield json.dumps(last, default=str) + "\n"
+    except Exception as e:
+        logger.error(f"Streaming error: {e}")
+        print(f"Streaming error: {e}")
+        query_log.note(error=str(e))
+        yield json.dumps({'error': str(e)}) + "\n"
+        return
+    
+    metrics.inc('floatchat_rows_returned_total', count)
+    metrics.observe('floatchat_rows_per_query', count, buckets=metrics.ROW_BUCKETS)
+    query_log.note(rows=count)
+    if count == 0:
+        yield json.dumps({'warning': warning or 'No profiles found, possibly due to sparse data or restrictive filters.'}) + "\n"
+    logger.info(f"Streamed {count} profiles")
+    summary = {'count': count}
+    if query_id:
+        summary['query_id'] = query_id
+    if limit:
+        summary['next_cursor'] = next_cursor
+    yield json.dumps(summary) + "\n"
+
+def run_profile_query(sql, params, warning=None):
+    """Execute profile SQL and format the rows for the API response"""
+    # Execute SQL safely (sql is None when the index showed nothing can match)
+    if sql is None:
+        logger.info("Profile index found no candidates; skipping SQL")
+        profiles = pd.DataFrame()
+    else:
         print(f"Executing SQL: {sql} with params: {params}")
         logger.info(f"Executing SQL: {sql} with params: {params}")
-        
-        # Execute SQL safely
-        with engine.connect() as conn:
+        request_profiler.record_sql(sql, params)
+        with metrics.stage_timer('sql'), get_engine().connect() as conn:
             profiles = pd.read_sql(text(sql), conn, params=params)
-        
-        # Ensure required columns exist
-        required_columns = ['float_id', 'profile_date', 'latitude', 'longitude', 'temperature_values', 'pressure_levels']
-        for col in required_columns:
-            if col not in profiles.columns:
-                if col in ['temperature_values', 'pressure_levels']:
-                    profiles[col] = '[]'  # Default empty JSON array
-                else:
-                    profiles[col] = None  # Default None for other columns
-        
-        # Format results
-        formatted = []
-        for _, row in profiles.iterrows():
-            formatted.append({
-                'float_id': row['float_id'],
-                'date': str(row['profile_date']),
-                'latitude': float(row['latitude']),
-                'longitude': float(row['longitude']),
-                'temperature_count': len(json.loads(row['temperature_values'])),
-                'pressure_count': len(json.loads(row['pressure_levels']))
-            })
-        
-        # Handle zero results
-        if not formatted:
-            warning = query_info.get('warning', 'No profiles found, possibly due to sparse data or restrictive filters.')
-            formatted.append({'warning': warning})
-            logger.warning(warning)
-            print(warning)
+    
+    # Ensure required columns exist
+    required_columns = ['float_id', 'profile_date', 'latitude', 'longitude', 'temperature_values', 'pressure_levels']
+    for col in required_columns:
+        if col not in profiles.columns:
+            if col in ['temperature_values', 'pressure_levels']:
+                profiles[col] = '[]'  # Default empty JSON array
+            else:
+                profiles[col] = None  # Default None for other columns
+    
+    # Format results
+    with metrics.stage_timer('format'):
+        counts = measurement_counts(profiles)
+        formatted = [format_profile(row, c) for (_, row), c in zip(profiles.iterrows(), counts)]
+    metrics.inc('floatchat_rows_returned_total', len(formatted))
+    metrics.observe('floatchat_rows_per_query', len(formatted), buckets=metrics.ROW_BUCKETS)
+    
+    # Handle zero results
+    if not formatted:
+        warning = warning or 'No profiles found, possibly due to sparse data or restrictive filters.'
+        formatted.append({'warning': warning})
+        logger.warning(warning)
+        print(warning)
+    
+    return formatted
+
+def plan_query(user_query):
+    """Embed, search Chroma and parse a query into {'sql', 'params', 'warning'} or {'error'}"""
+    print(f"Processing query: {user_query}")
+    logger.info(f"Processing query: {user_query}")
+    
+    # Get embedding and query Chroma
+    with metrics.stage_timer('embed'):
+        query_embedding = get_model().encode(user_query).tolist()
+    profile_ids = nearest_floats([query_embedding])[0]
+    logger.info(f"Chroma returned float_ids: {profile_ids}")
+    print(f"Chroma returned {len(profile_ids)} profile IDs")
+    
+    # Get LLM-generated query parameters
+    query_info, source = cached_parse(user_query)
+    if query_info.get("error"):
+        logger.warning(f"Query failed: {query_info['error']}")
+        print(f"Query error: {query_info['error']}")
+        query_log.note(parse_source=source)
+        return {'error': query_info['error']}
+    
+    plan = build_sql(user_query, query_info, hybrid_candidates(profile_ids, query_info))
+    plan.setdefault('parse_source', source)
+    query_log.note(parse_source=plan['parse_source'], sql=plan.get('sql'), params=plan.get('params'))
+    if 'error' not in plan:
+        plan['warning'] = query_info.get('warning')
+        plan = narrow_with_index(plan)
+        if 'index_candidates' in plan:
+            query_log.note(index_candidates=plan['index_candidates'])
+        plan['query_id'] = result_export.register(user_query, plan, get_engine())
+        query_log.note(query_id=plan['query_id'])
+    return plan
+
+def query_profiles(user_query, cursor=None, limit=None):
+    try:
+        plan = plan_query(user_query)
+    except Exception as e:
+        logger.error(f"Query error: {e}")
+        print(f"Query error: {e}")
+        return {'error': str(e)}
+    if 'error' in plan:
+        return plan
+    return execute_plan(user_query, plan, cursor, limit)
+
+def execute_plan(user_query, plan, cursor=None, limit=None):
+    """Run a plan from plan_query, optionally as one page"""
+    try:
+        sql, params = plan['sql'], plan['params']
+        if sql and (cursor or limit):
+            sql, params = paginate_sql(sql, params, cursor, limit and limit + 1)
+        formatted = run_profile_query(sql, params, plan['warning'])
         
         logger.info(f"Query returned {len([r for r in formatted if 'warning' not in r])} profiles for: {user_query}")
         print(f"Query returned {len([r for r in formatted if 'warning' not in r])} profiles")
@@ -228,8 +794,99 @@ def query_profiles(user_query):
         print(f"Query error: {e}")
         return {'error': str(e)}
 
+# --- Batch query function ---
+def query_profiles_batch(user_queries):
+    """
+    Answer many queries at once: one embedding call, one multi-query Chroma
+    search, one LLM parse per distinct normalized query and one execution per
+    distinct SQL plan. Results are returned in input order with per-item errors.
+    """
+    try:
+        print(f"Processing batch of {len(user_queries)} queries")
+        logger.info(f"Processing batch of {len(user_queries)} queries")
+        
+        # Embed and search each distinct query text once
+        unique_texts = list(dict.fromkeys(user_queries))
+        with metrics.stage_timer('embed'):
+            embeddings = get_model().encode(unique_texts)
+        ids_by_text = dict(zip(unique_texts, nearest_floats(embeddings.tolist())))
+    except Exception as e:
+        logger.error(f"Batch query error: {e}")
+        print(f"Batch query error: {e}")
+        return {'error': str(e)}
+    
+    def execute(plan):
+        try:
+            return run_profile_query(plan['sql'], plan['params'], plan['warning'])
+        except Exception as e:
+            logger.error(f"Batch SQL error: {e}")
+            return {'error': str(e)}
+    
+    with ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS) as pool:
+        # One LLM parse per distinct normalized query
+        representative = {}
+        for q in unique_texts:
+            representative.setdefault(normalize_query(q), q)
+        parses = dict(zip(representative, pool.map(cached_parse, representative.values())))
+        
+        # Plan each query on its own: a failure becomes that item's error, and
+        # fields noted while planning (e.g. hybrid features) stay with the item
+        plans = {}
+        notes = {}
+        for q in unique_texts:
+            query_info, source = parses[normalize_query(q)]
+            if query_info.get("error"):
+                plans[q] = {'error': query_info['error'], 'parse_source': source}
+                continue
+            with query_log.collect() as notes[q]:
+                try:
+                    plan = build_sql(q, query_info, hybrid_candidates(ids_by_text[q], query_info))
+                    plan.setdefault('parse_source', source)
+                    plan['warning'] = query_info.get('warning')
+                    if 'error' not in plan:
+                        plan = narrow_with_index(plan)
+                        plan['query_id'] = result_export.register(q, plan, get_engine())
+                except Exception as e:
+                    logger.error(f"Batch planning error: {e}")
+                    plan = {'error': str(e), 'parse_source': source}
+            plans[q] = plan
+        
+        # One execution per distinct SQL plan
+        plan_keys = {
+            q: (plan['sql'], json.dumps(plan['params'], sort_keys=True, default=str))
+            for q, plan in plans.items() if 'sql' in plan
+        }
+        distinct = {}
+        for q, key in plan_keys.items():
+            distinct.setdefault(key, plans[q])
+        executed = dict(zip(distinct, pool.map(execute, distinct.values())))
+    
+    answers = []
+    for index, q in enumerate(user_queries):
+        outcome = executed[plan_keys[q]] if q in plan_keys else plans[q]
+        plan = plans[q]
+        if isinstance(outcome, dict) and 'error' in outcome:
+            answers.append({'query': q, 'error': outcome['error']})
+        else:
+            answers.append({
+                'query': q,
+                'query_id': plan['query_id'],
+                'results': outcome,
+                'count': len([r for r in outcome if 'warning' not in r])
+            })
+        query_log.record(**notes.get(q, {}), query=q, normalized_query=normalize_query(q), batch_index=index,
+                         batch_size=len(user_queries), parse_source=plan.get('parse_source'),
+                         sql=plan.get('planned_sql', plan.get('sql')), params=plan.get('params'),
+                         index_candidates=plan.get('index_candidates'), query_id=plan.get('query_id'),
+                         rows=answers[-1].get('count'), error=answers[-1].get('error'))
+    
+    logger.info(f"Batch answered {len(user_queries)} queries with {len(distinct)} distinct SQL executions")
+    print(f"Batch answered {len(user_queries)} queries with {len(distinct)} distinct SQL executions")
+    return answers
+
 # --- Stats endpoint for Page 1 ---
 @app.route('/stats', methods=['GET'])
+@request_profiler.profiled
 def stats():
     try:
         sql = """
@@ -241,7 +898,8 @@ def stats():
           AND profile_date::timestamp >= CURRENT_DATE - INTERVAL '6 months'
         """
         
-        with engine.connect() as conn:
+        request_profiler.record_sql(sql)
+        with metrics.stage_timer('sql'), get_engine().connect() as conn:
             profiles = pd.read_sql(text(sql), conn).to_dict(orient="records")
         
         return jsonify({
@@ -258,6 +916,7 @@ def stats():
 
 # --- Flask endpoint ---
 @app.route('/ask', methods=['POST'])
+@request_profiler.profiled
 def ask():
     data = request.get_json()
     if not data or 'query' not in data:
@@ -266,18 +925,513 @@ def ask():
         return jsonify({'error': 'Missing query'}), 400
     
     user_query = data['query']
-    results = query_profiles(user_query)
+    cursor = data.get('cursor')
+    limit = data.get('limit')
+    stream = bool(data.get('stream')) or request.args.get('stream') == '1' \
+        or request.accept_mimetypes.best == 'application/x-ndjson'
+    
+    if limit is not None and (not isinstance(limit, int) or not 1 <= limit <= MAX_PAGE_SIZE):
+        return jsonify({'error': f'limit must be an integer between 1 and {MAX_PAGE_SIZE}'}), 400
+    if cursor is not None:
+        try:
+            decode_cursor(cursor)
+        except Exception:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    # Options needed to replay the request from the query log
+    options = {k: v for k, v in (('cursor', cursor), ('limit', limit), ('stream', stream)) if v}
+    
+    try:
+        plan = plan_query(user_query)
+    except Exception as e:
+        logger.error(f"Query error: {e}")
+        print(f"Query error: {e}")
+        plan = {'error': str(e)}
+    if 'error' in plan:
+        query_log.record(query=user_query, normalized_query=normalize_query(user_query),
+                         options=options, rows=None, error=plan['error'])
+        return jsonify({'error': plan['error']}), 500
+    
+    if stream:
+        sql, params = plan['sql'], plan['params']
+        if sql and (cursor or limit):
+            try:
+                sql, params = paginate_sql(sql, params, cursor, limit and limit + 1)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        def logged_stream():
+            try:
+                yield from stream_profile_rows(sql, params, plan['warning'], limit, plan['query_id'],
+                                               page_offset(cursor))
+            finally:
+                query_log.record(query=user_query, normalized_query=normalize_query(user_query), options=options)
+        return Response(stream_with_context(logged_stream()), mimetype='application/x-ndjson')
+    
+    results = execute_plan(user_query, plan, cursor, limit)
+    
+    if isinstance(results, dict) and 'error' in results:
+        query_log.record(query=user_query, normalized_query=normalize_query(user_query),
+                         options=options, rows=None, error=results['error'])
+        return jsonify({'error': results['error']}), 500
+    
+    response = {'query': user_query, 'query_id': plan['query_id']}
+    if cursor or limit:
+        next_cursor = None
+        if limit and len(results) > limit:
+            results = results[:limit]
+            next_cursor = encode_cursor(results[-1], page_offset(cursor) + limit)
+        response['next_cursor'] = next_cursor
+    
+    response['results'] = results
+    response['count'] = len([r for r in results if 'warning' not in r])
+    query_log.record(query=user_query, normalized_query=normalize_query(user_query),
+                     options=options, rows=response['count'], error=None)
+    return jsonify(response)
+
+@app.route('/ask/batch', methods=['POST'])
+def ask_batch():
+    data = request.get_json()
+    queries = data.get('queries') if isinstance(data, dict) else None
+    if not isinstance(queries, list) or not queries:
+        logger.error("Missing or invalid queries in batch request")
+        print("Error: Missing or invalid queries")
+        return jsonify({'error': 'Missing queries'}), 400
+    if not all(isinstance(q, str) and q.strip() for q in queries):
+        return jsonify({'error': 'Every query must be a non-empty string'}), 400
+    if len(queries) > BATCH_MAX_QUERIES:
+        return jsonify({'error': f'Too many queries (max {BATCH_MAX_QUERIES})'}), 400
+    
+    results = query_profiles_batch(queries)
     
     if isinstance(results, dict) and 'error' in results:
         return jsonify({'error': results['error']}), 500
     
     return jsonify({
-        'query': user_query,
         'results': results,
-        'count': len([r for r in results if 'warning' not in r])
+        'count': len(results)
     })
 
+# --- Measurement array endpoints ---
+def profile_data_response(profile_ids):
+    """Binary (or Arrow) payload of measurement arrays for the requested profiles"""
+    fmt = request.args.get('format', 'binary')
+    if fmt not in ('binary', 'arrow'):
+        return jsonify({'error': "format must be 'binary' or 'arrow'"}), 400
+    try:
+        min_pressure = request.args.get('min_pressure', type=float)
+        max_pressure = request.args.get('max_pressure', type=float)
+        max_levels = request.args.get('max_levels', type=int)
+        
+        arrays = profile_store.fetch_profile_arrays(get_engine(), profile_ids)
+        profiles = [
+            (pid, profile_data.slice_profile(arrays[pid], min_pressure, max_pressure, max_levels))
+            for pid in profile_ids if pid in arrays
+        ]
+        if fmt == 'arrow':
+            payload = profile_data.pack_profiles_arrow(profiles)
+            mimetype = 'application/vnd.apache.arrow.stream'
+        else:
+            payload = profile_data.pack_profiles(profiles)
+            mimetype = 'application/octet-stream'
+    except Exception as e:
+        logger.error(f"Profile data error: {e}")
+        print(f"Profile data error: {e}")
+        return jsonify({'error': str(e)}), 400
+    
+    response = Response(payload, mimetype=mimetype)
+    response.headers['X-Profile-Count'] = str(len(profiles))
+    return response
+
+@app.route('/profiles/<int:profile_id>/data', methods=['GET'])
+def profile_data_single(profile_id):
+    return profile_data_response([profile_id])
+
+@app.route('/profiles/data', methods=['GET', 'POST'])
+def profile_data_bulk():
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if ids is None and request.args.get('ids'):
+        ids = request.args['ids'].split(',')
+    try:
+        profile_ids = list(dict.fromkeys(int(i) for i in ids))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'ids must be a list of profile ids'}), 400
+    if not profile_ids:
+        return jsonify({'error': 'Missing ids'}), 400
+    if len(profile_ids) > MAX_BULK_PROFILES:
+        return jsonify({'error': f'Too many profiles (max {MAX_BULK_PROFILES})'}), 400
+    return profile_data_response(profile_ids)
+
+# --- Standard-level statistics endpoint ---
+@app.route('/profiles/levels', methods=['POST'])
+def profile_levels():
+    """
+    Regrid profiles onto standard pressure levels and return level-wise
+    statistics. Profiles are given by {"ids": [...]} or selected by a
+    natural-language {"query": "..."}; "variable" and "levels" are optional.
+    """
+    data = request.get_json(silent=True) or {}
+    variable = data.get('variable', 'temperature')
+    if variable not in ('temperature', 'salinity'):
+        return jsonify({'error': "variable must be 'temperature' or 'salinity'"}), 400
+    try:
+        levels = regrid.STANDARD_LEVELS if data.get('levels') is None else sorted(float(l) for l in data['levels'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'levels must be a list of pressures in dbar'}), 400
+    
+    if data.get('ids') is not None:
+        try:
+            profile_ids = list(dict.fromkeys(int(i) for i in data['ids']))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'ids must be a list of profile ids'}), 400
+    elif data.get('query'):
+        results = query_profiles(data['query'])
+        if isinstance(results, dict) and 'error' in results:
+            return jsonify({'error': results['error']}), 500
+        profile_ids = list(dict.fromkeys(r['profile_id'] for r in results if r.get('profile_id') is not None))
+    else:
+        return jsonify({'error': 'Missing ids or query'}), 400
+    
+    if len(profile_ids) > MAX_LEVEL_PROFILES:
+        return jsonify({'error': f'Too many profiles (max {MAX_LEVEL_PROFILES})'}), 400
+    
+    try:
+        matrix = regrid.regridded_matrix(get_engine(), profile_ids, variable, levels)
+        stats = regrid.level_statistics(matrix, levels)
+    except Exception as e:
+        logger.error(f"Level statistics error: {e}")
+        print(f"Level statistics error: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    # NaN is not valid JSON; levels without data come back as null
+    response = {'variable': variable, 'profile_count': len(profile_ids)}
+    for key, values in stats.items():
+        response[key] = [None if pd.isna(v) else float(v) for v in values]
+    response['count'] = [int(v) for v in stats['count']]
+    return jsonify(response)
+
+# --- Climatology anomaly endpoint ---
+@app.route('/profiles/anomalies', methods=['GET', 'POST'])
+@request_profiler.profiled
+def profile_anomalies():
+    """
+    Per-profile anomalies against the precomputed climatology cube: every
+    profile is regridded onto the cube's levels and the mean of its cell and
+    calendar month is subtracted. Profiles are given by "ids", a
+    natural-language "query", or lat_min/lat_max/lon_min/lon_max/start/end
+    bounds resolved by the in-memory spatiotemporal index.
+    """
+    data = request.get_json(silent=True) or request.args.to_dict()
+    variable = data.get('variable', 'temperature')
+    if variable not in climatology.VARIABLES:
+        return jsonify({'error': f"variable must be one of {', '.join(climatology.VARIABLES)}"}), 400
+    cube = climatology.current(get_engine())
+    if cube is None:
+        return jsonify({'error': 'No climatology for the current dataset; run python climatology.py'}), 503
+    
+    bound_keys = ('lat_min', 'lat_max', 'lon_min', 'lon_max', 'start', 'end')
+    if data.get('ids') is not None:
+        ids = data['ids'].split(',') if isinstance(data['ids'], str) else data['ids']
+        try:
+            profile_ids = list(dict.fromkeys(int(i) for i in ids))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'ids must be a list of profile ids'}), 400
+    elif data.get('query'):
+        results = query_profiles(data['query'])
+        if isinstance(results, dict) and 'error' in results:
+            return jsonify({'error': results['error']}), 500
+        profile_ids = list(dict.fromkeys(r['profile_id'] for r in results if r.get('profile_id') is not None))
+    elif any(data.get(key) is not None for key in bound_keys):
+        bounds = {}
+        try:
+            for key in bound_keys[:4]:
+                if data.get(key) is not None:
+                    bounds[key] = float(data[key])
+            for key in ('start', 'end'):
+                if data.get(key) is not None:
+                    stamp = pd.Timestamp(data[key], tz='UTC')
+                    # A bare end date covers its whole day
+                    if key == 'end' and len(str(data[key])) == 10:
+                        stamp += pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+                    bounds[key] = int(stamp.value // 10**9)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'bounds must be numbers and start/end dates (YYYY-MM-DD)'}), 400
+        with metrics.stage_timer('index'):
+            index = spatial_index.get_index(get_engine())
+            positions = index.query(max_rows=INDEX_MAX_ROWS, **bounds)
+        if positions is None:
+            return jsonify({'error': 'Bounds too broad; narrow the region or date range'}), 400
+        profile_ids = index.profile_id[positions].tolist()
+    else:
+        return jsonify({'error': 'Missing ids, query or bounds'}), 400
+    
+    if len(profile_ids) > MAX_ANOMALY_PROFILES:
+        return jsonify({'error': f'Too many profiles (max {MAX_ANOMALY_PROFILES})'}), 400
+    
+    try:
+        with metrics.stage_timer('climatology'):
+            profiles, result = climatology.profile_anomalies(get_engine(), cube, profile_ids, variable)
+    except Exception as e:
+        logger.error(f"Anomaly error: {e}")
+        print(f"Anomaly error: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    # NaN is not valid JSON; levels without data or climatology come back as null
+    with metrics.stage_timer('format'):
+        def rows(matrix):
+            return [[None if math.isnan(v) else round(v, 3) for v in row] for row in matrix.tolist()]
+        anomaly = result['anomaly']
+        counts = (~np.isnan(anomaly)).sum(axis=1)
+        with np.errstate(invalid='ignore'):
+            mean_anomaly = np.where(counts > 0, np.nansum(anomaly, axis=1) / np.maximum(counts, 1), np.nan)
+        times = profiles['time'].to_numpy(dtype='int64').astype('datetime64[s]')
+        response = {
+            'variable': variable,
+            'levels': cube.levels.tolist(),
+            'cell_degrees': cube.cell_degrees,
+            'profile_count': len(profiles),
+            'profile_id': profiles['profile_id'].astype(int).tolist(),
+            'float_id': profiles['float_id'].astype(int).tolist(),
+            'latitude': profiles['latitude'].astype(float).tolist(),
+            'longitude': profiles['longitude'].astype(float).tolist(),
+            'profile_date': [None if missing else str(t) + 'Z'
+                             for t, missing in zip(times, profiles['missing_time'])],
+            'anomaly': rows(anomaly),
+            'zscore': rows(result['zscore']),
+            'mean_anomaly': [None if math.isnan(v) else round(v, 3) for v in mean_anomaly.tolist()]
+        }
+    return jsonify(response)
+
+# --- Float trajectory endpoints ---
+def trajectory_response(float_ids, zoom):
+    """Trajectories at the level of detail for the zoom, read from argo_trajectories in one query"""
+    zoom = None if zoom is None else min(max(zoom, 0), trajectories.MAX_ZOOM)
+    level = trajectories.level_for_zoom(zoom)
+    try:
+        with metrics.stage_timer('sql'):
+            found = trajectories.fetch_trajectories(get_engine(), float_ids, level)
+    except Exception as e:
+        logger.error(f"Trajectory error: {e}")
+        print(f"Trajectory error: {e}")
+        return None, (jsonify({'error': 'Trajectories unavailable; run python trajectories.py'}), 503)
+    return {'zoom': zoom, 'level': level, 'tolerance': trajectories.TRAJECTORY_TOLERANCES[level],
+            'trajectories': [found[f] for f in float_ids if f in found]}, None
+
+@app.route('/floats/<int:float_id>/trajectory', methods=['GET'])
+def float_trajectory(float_id):
+    """
+    Whole path of one float in date order, simplified for the map zoom
+    (?zoom=, web map zoom levels; full detail without it).
+    """
+    response, error = trajectory_response([float_id], request.args.get('zoom', type=int))
+    if error:
+        return error
+    if not response['trajectories']:
+        return jsonify({'error': f'Unknown float {float_id}'}), 404
+    trajectory = response.pop('trajectories')[0]
+    return jsonify({**response, **trajectory})
+
+@app.route('/floats/trajectories', methods=['GET', 'POST'])
+def float_trajectories():
+    """Bulk variant: ?ids=1,2&zoom=4 or {"ids": [...], "zoom": 4}; unknown floats are left out"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if ids is None and request.args.get('ids'):
+        ids = request.args['ids'].split(',')
+    zoom = data.get('zoom', request.args.get('zoom'))
+    try:
+        float_ids = list(dict.fromkeys(int(i) for i in ids))
+        zoom = None if zoom is None else int(zoom)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'ids must be a list of float ids and zoom an integer'}), 400
+    if not float_ids:
+        return jsonify({'error': 'Missing ids'}), 400
+    if len(float_ids) > MAX_TRAJECTORY_FLOATS:
+        return jsonify({'error': f'Too many floats (max {MAX_TRAJECTORY_FLOATS})'}), 400
+    response, error = trajectory_response(float_ids, zoom)
+    return error or jsonify(response)
+
+# --- Bulk export endpoint ---
+@app.route('/export/<query_id>', methods=['GET'])
+def export_query(query_id):
+    """
+    Full result of an earlier /ask query as CSV or Parquet, one row per
+    measurement level. The query is re-run on a server-side cursor and written
+    out batch by batch, so memory stays flat however many profiles match.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in result_export.FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(result_export.FORMATS)}"}), 400
+    if fmt == 'parquet' and result_export.pq is None:
+        return jsonify({'error': 'Parquet export requires pyarrow to be installed'}), 400
+    entry = result_export.lookup(query_id, get_engine())
+    if entry is None:
+        return jsonify({'error': f"Unknown or expired query id (ids can be exported for "
+                                 f"{result_export.EXPORT_TTL:.0f} seconds after the query)"}), 404
+    
+    sql, params = result_export.export_sql(entry, get_engine())
+    writer = result_export.stream_parquet if fmt == 'parquet' else result_export.stream_csv
+    mimetype, extension = result_export.FORMATS[fmt]
+    
+    def export_stream():
+        try:
+            yield from writer(get_engine(), _iter_profile_rows(sql, params))
+        except Exception as e:
+            # Headers are already sent; the truncated download is the only signal left
+            logger.error(f"Export error for {query_id}: {e}")
+            print(f"Export error for {query_id}: {e}")
+            raise
+        logger.info(f"Exported query {query_id} as {fmt}")
+    
+    return Response(stream_with_context(export_stream()), mimetype=mimetype,
+                     headers={'Content-Disposition': f'attachment; filename="argo_{query_id}.{extension}"'})
+
+# --- Gridded aggregate endpoint ---
+def grid_resolution(zoom, resolution, lat_span, lon_span, time_bins=1):
+    """
+    Cell size in degrees: explicit, or GRID_BASE_DEGREES halved per zoom
+    level, then doubled until the box (times the number of time bins) holds
+    at most MAX_GRID_CELLS cells.
+    """
+    if resolution is None:
+        resolution = GRID_BASE_DEGREES / 2 ** min(max(zoom, 0), MAX_ZOOM)
+    resolution = min(max(resolution, GRID_MIN_DEGREES), 180.0)
+    while math.ceil(lat_span / resolution) * math.ceil(lon_span / resolution) * time_bins > MAX_GRID_CELLS \
+            and resolution < 180.0:
+        resolution *= 2
+    return resolution
+
+@app.route('/profiles/grid', methods=['GET'])
+@request_profiler.profiled
+def profile_grid():
+    """
+    Profile counts and surface temperature binned into lat/lon cells (and
+    optionally year/month/day), computed with GROUP BY over the indexed
+    latitude, longitude and profile_date columns. Cells come back as columns
+    with their centre coordinates; empty cells are omitted.
+    """
+    args = request.args
+    time_bin = args.get('time_bin', 'none')
+    if time_bin not in GRID_TIME_BINS:
+        return jsonify({'error': f"time_bin must be one of {', '.join(GRID_TIME_BINS)}"}), 400
+    bounds = {key: args.get(key, type=float) for key in ('lat_min', 'lat_max', 'lon_min', 'lon_max')}
+    for key in ('start', 'end'):
+        bounds[key] = args.get(key)
+        if bounds[key] is not None:
+            try:
+                pd.Timestamp(bounds[key])
+            except ValueError:
+                return jsonify({'error': f'{key} must be a date (YYYY-MM-DD)'}), 400
+    zoom = args.get('zoom', 3, type=int)
+    resolution = args.get('resolution', type=float)
+    if resolution is not None and not (math.isfinite(resolution) and resolution > 0):
+        return jsonify({'error': 'resolution must be positive'}), 400
+    
+    lat_span = (90.0 if bounds['lat_max'] is None else bounds['lat_max']) \
+        - (-90.0 if bounds['lat_min'] is None else bounds['lat_min'])
+    lon_span = (180.0 if bounds['lon_max'] is None else bounds['lon_max']) \
+        - (-180.0 if bounds['lon_min'] is None else bounds['lon_min'])
+    time_bins = 1
+    if time_bin in GRID_PERIODS and bounds['start'] and bounds['end']:
+        time_bins = max(len(pd.period_range(pd.Timestamp(bounds['start']), pd.Timestamp(bounds['end']),
+                                            freq=GRID_PERIODS[time_bin])), 1)
+    resolution = grid_resolution(zoom, resolution, max(lat_span, 0.0), max(lon_span, 0.0), time_bins)
+    
+    conditions, params = [], {'res': resolution}
+    for column, low, high in (('latitude', 'lat_min', 'lat_max'), ('longitude', 'lon_min', 'lon_max'),
+                              ('profile_date', 'start', 'end')):
+        if bounds[low] is not None:
+            conditions.append(f"{column} >= :{low}")
+            params[low] = bounds[low]
+        if bounds[high] is not None:
+            conditions.append(f"{column} <= :{high}")
+            params[high] = bounds[high]
+    # profile_date is compared as text, so a bare end date must cover its whole day
+    if len(params.get('end', '')) == 10:
+        params['end'] += 'T23:59:59Z'
+    
+    prefix = GRID_TIME_BINS[time_bin]
+    time_column = f"SUBSTR(profile_date, 1, {prefix}) AS time_bin," if prefix else ""
+    group_by, order_by = ("1, 2, 3", "3, 1, 2") if prefix else ("1, 2", "1, 2")
+    # Grouped by position: PostgreSQL does not treat two uses of :res as the same expression
+    sql = f"""
+    SELECT CAST(FLOOR(latitude / :res) AS INTEGER) AS lat_cell,
+           CAST(FLOOR(longitude / :res) AS INTEGER) AS lon_cell,
+           {time_column}
+           COUNT(*) AS profile_count,
+           COUNT(DISTINCT float_id) AS float_count,
+           AVG(surface_temperature) AS mean_surface_temperature,
+           MAX(surface_temperature) AS max_surface_temperature
+    FROM argo_profiles
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL{''.join(' AND ' + c for c in conditions)}
+    GROUP BY {group_by}
+    ORDER BY {order_by}
+    """
+    try:
+        request_profiler.record_sql(sql, params)
+        with metrics.stage_timer('sql'), get_engine().connect() as conn:
+            cells = pd.read_sql(text(sql), conn, params=params)
+    except Exception as e:
+        logger.error(f"Grid error: {e}")
+        print(f"Grid error: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    with metrics.stage_timer('format'):
+        def floats(column):
+            return [None if pd.isna(v) else round(float(v), 3) for v in cells[column]]
+        response = {
+            'resolution': resolution,
+            'time_bin': time_bin,
+            'cells': len(cells),
+            'latitude': ((cells['lat_cell'] + 0.5) * resolution).tolist(),
+            'longitude': ((cells['lon_cell'] + 0.5) * resolution).tolist(),
+            'profile_count': cells['profile_count'].astype(int).tolist(),
+            'float_count': cells['float_count'].astype(int).tolist(),
+            'mean_surface_temperature': floats('mean_surface_temperature'),
+            'max_surface_temperature': floats('max_surface_temperature'),
+            'total_profiles': int(cells['profile_count'].sum())
+        }
+        if prefix:
+            response['time'] = cells['time_bin'].tolist()
+    return jsonify(response)
+
+# --- Request metrics ---
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    if 'request_start' in g:
+        metrics.observe('floatchat_request_duration_seconds', time.perf_counter() - g.request_start, endpoint=endpoint)
+    metrics.inc('floatchat_requests_total', endpoint=endpoint, status=str(response.status_code))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# --- Health endpoints ---
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: every component has been built and exercised by warmup()"""
+    if _ready.is_set():
+        return jsonify({'status': 'ready', 'components': _component_status})
+    start_warmup()
+    return jsonify({'status': 'starting', 'components': _component_status}), 503
+
 # --- Run app ---
 if __name__ == '__main__':
     print("Server starting on http://0.0.0.0:5000...")
+    # With debug=True the reloader's parent process only watches files; warm
+    # up in the child that actually serves requests.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warmup()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
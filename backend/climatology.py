@@ -0,0 +1,321 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text, bindparam
+import dataset_meta
+import profile_store
+import regrid
+from spatial_index import to_epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+# Database configuration
+DB_USER = 'postgres'
+DB_PASSWORD = 'anushka'
+DB_HOST = 'localhost'
+DB_PORT = '5432'
+DB_NAME = 'floatchat_db'
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# --- Cube layout ---
+# CLIMATOLOGY_DIR holds the cube for one dataset version:
+#   manifest.json      dataset version, cell size, levels, variables, shape
+#   mean.f32, std.f32  float32 (n_variables, n_lat, n_lon, 12 months, n_levels)
+#   count.i32          int32, same shape: regridded values behind each cell
+# Cells with fewer than CLIMATOLOGY_MIN_COUNT values have NaN mean and std.
+# Populated cells are also written to the argo_climatology table for SQL.
+CLIMATOLOGY_DIR = os.getenv("CLIMATOLOGY_DIR", "./climatology")
+CLIMATOLOGY_TABLE = 'argo_climatology'
+CELL_DEGREES = float(os.getenv("CLIMATOLOGY_CELL_DEGREES", "2.0"))
+MIN_COUNT = int(os.getenv("CLIMATOLOGY_MIN_COUNT", "3"))
+# A subset of the standard levels in regrid.py: anomalies regrid onto the standard
+# levels and take these columns, so they share cached rows with /profiles/levels
+CLIMATOLOGY_LEVELS = np.array([5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 400, 500, 700, 1000, 1500, 2000],
+                              dtype=np.float64)
+VARIABLES = ('temperature', 'salinity')
+BUILD_BATCH_SIZE = 5000
+VERSION_CHECK_INTERVAL = 30.0
+
+_cube = None
+_cube_lock = threading.Lock()
+_last_check = 0.0
+
+def grid_shape(cell_degrees=CELL_DEGREES):
+    return int(np.ceil(180 / cell_degrees)), int(np.ceil(360 / cell_degrees))
+
+def cell_index(latitudes, longitudes, times, missing=None, cell_degrees=CELL_DEGREES):
+    """
+    Flat (lat row, lon column, month) cell of each profile from its position
+    and epoch-second time; -1 where the position or date is missing.
+    """
+    n_lat, n_lon = grid_shape(cell_degrees)
+    lat = np.asarray(latitudes, dtype=np.float64)
+    lon = np.asarray(longitudes, dtype=np.float64)
+    invalid = np.isnan(lat) | np.isnan(lon)
+    if missing is not None:
+        invalid |= np.asarray(missing, dtype=bool)
+    rows = np.clip(np.floor((np.nan_to_num(lat) + 90) / cell_degrees), 0, n_lat - 1).astype(np.int64)
+    cols = np.clip(np.floor(((np.nan_to_num(lon) + 180) % 360) / cell_degrees), 0, n_lon - 1).astype(np.int64)
+    months = np.asarray(times, dtype=np.int64).astype('datetime64[s]').astype('datetime64[M]').astype(np.int64) % 12
+    return np.where(invalid, -1, (rows * n_lon + cols) * 12 + months)
+
+# --- Building the cube ---
+def compute_cube(profile_ids, cells, fetch_arrays, levels=CLIMATOLOGY_LEVELS, n_cells=None,
+                 batch_size=BUILD_BATCH_SIZE):
+    """
+    (mean, std, count) arrays of shape (n_variables, n_cells, n_levels).
+    Profiles are regridded batch by batch and their values summed into dense
+    per-cell accumulators with np.bincount, so memory is bounded by the grid,
+    not the number of profiles.
+    """
+    n_levels = len(levels)
+    n_cells = n_cells or int(np.prod(grid_shape())) * 12
+    size = n_cells * n_levels
+    sums = np.zeros((len(VARIABLES), size))
+    squares = np.zeros((len(VARIABLES), size))
+    counts = np.zeros((len(VARIABLES), size), dtype=np.int64)
+    ids = np.asarray(profile_ids, dtype=np.int64)
+    cells = np.asarray(cells, dtype=np.int64)
+    empty = np.empty(0, dtype=np.float32)
+
+    for start in range(0, len(ids), batch_size):
+        keep = cells[start:start + batch_size] >= 0
+        batch = ids[start:start + batch_size][keep]
+        if not len(batch):
+            continue
+        arrays = fetch_arrays(batch.tolist())
+        pressures = [arrays.get(int(pid), {}).get('pressure', empty) for pid in batch]
+        flat = (cells[start:start + batch_size][keep][:, None] * n_levels + np.arange(n_levels)).ravel()
+        for j, var in enumerate(VARIABLES):
+            values = regrid.regrid_profiles(pressures, [arrays.get(int(pid), {}).get(var, empty) for pid in batch],
+                                            levels).ravel()
+            ok = ~np.isnan(values)
+            sums[j] += np.bincount(flat[ok], weights=values[ok], minlength=size)
+            squares[j] += np.bincount(flat[ok], weights=values[ok] ** 2, minlength=size)
+            counts[j] += np.bincount(flat[ok], minlength=size)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = sums / counts
+        variance = (squares - counts * mean ** 2) / (counts - 1)
+    enough = counts >= MIN_COUNT
+    mean = np.where(enough, mean, np.nan).astype(np.float32)
+    std = np.where(enough, np.sqrt(np.maximum(variance, 0.0)), np.nan).astype(np.float32)
+    shape = (len(VARIABLES), n_cells, n_levels)
+    return mean.reshape(shape), std.reshape(shape), counts.astype(np.int32).reshape(shape)
+
+def climatology_frame(mean, std, count, levels=CLIMATOLOGY_LEVELS, cell_degrees=CELL_DEGREES):
+    """argo_climatology rows: one per populated (cell, month, level), cell centres in degrees"""
+    n_lat, n_lon = grid_shape(cell_degrees)
+    populated = (count >= MIN_COUNT).any(axis=0)
+    cells, level_index = np.nonzero(populated)
+    rows, rest = np.divmod(cells, n_lon * 12)
+    cols, months = np.divmod(rest, 12)
+    frame = pd.DataFrame({
+        'latitude': -90 + (rows + 0.5) * cell_degrees,
+        'longitude': -180 + (cols + 0.5) * cell_degrees,
+        'month': months + 1,
+        'pressure': levels[level_index]
+    })
+    for j, var in enumerate(VARIABLES):
+        frame[f"{var}_mean"] = mean[j][populated]
+        frame[f"{var}_std"] = std[j][populated]
+        frame[f"{var}_count"] = count[j][populated]
+    return frame
+
+def write_climatology(engine, version, profiles=None, store=None, root=None, write_table=True):
+    """
+    Build the climatology for a dataset version (positions and dates from the
+    ingested DataFrame when given, else the database; arrays from the store
+    when given, else the current store or the database), write the cube to
+    root and the populated cells to argo_climatology. Returns the directory.
+    """
+    root = root or CLIMATOLOGY_DIR
+    if profiles is None:
+        profiles = pd.read_sql("SELECT profile_id, profile_date, latitude, longitude FROM argo_profiles", engine)
+    times, missing = to_epoch_seconds(profiles['profile_date'])
+    cells = cell_index(profiles['latitude'], profiles['longitude'], times, missing)
+    fetch_arrays = store.arrays if store is not None else \
+        (lambda ids: profile_store.fetch_profile_arrays(engine, ids))
+    mean, std, count = compute_cube(profiles['profile_id'], cells, fetch_arrays)
+
+    n_lat, n_lon = grid_shape()
+    shape = (len(VARIABLES), n_lat, n_lon, 12, len(CLIMATOLOGY_LEVELS))
+    tmp_dir = root.rstrip('/') + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    mean.astype('<f4').tofile(os.path.join(tmp_dir, 'mean.f32'))
+    std.astype('<f4').tofile(os.path.join(tmp_dir, 'std.f32'))
+    count.astype('<i4').tofile(os.path.join(tmp_dir, 'count.i32'))
+    manifest = {
+        'dataset_version': version,
+        'cell_degrees': CELL_DEGREES,
+        'levels': CLIMATOLOGY_LEVELS.tolist(),
+        'variables': list(VARIABLES),
+        'shape': list(shape),
+        'min_count': MIN_COUNT,
+        'profiles': int((cells >= 0).sum()),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    }
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(root, ignore_errors=True)
+    os.replace(tmp_dir, root)
+
+    if write_table:
+        frame = climatology_frame(mean, std, count)
+        frame.to_sql(CLIMATOLOGY_TABLE, engine, if_exists='replace', index=False, chunksize=10000)
+        with engine.connect() as conn:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_climatology_cell "
+                              f"ON {CLIMATOLOGY_TABLE}(month, latitude, longitude);"))
+            conn.commit()
+        logger.info(f"Wrote {len(frame)} climatology rows for dataset {version}")
+    return root
+
+# --- Reading the cube ---
+class Climatology:
+    """
+    Memory-mapped cube. lookup() and anomalies() are pure fancy indexing:
+    one (n_profiles, n_levels) gather per statistic, no loops over profiles.
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.version = self.manifest['dataset_version']
+        self.cell_degrees = self.manifest['cell_degrees']
+        self.levels = np.array(self.manifest['levels'], dtype=np.float64)
+        self.variables = tuple(self.manifest['variables'])
+        shape = tuple(self.manifest['shape'])
+        flat = (shape[0], int(np.prod(shape[1:4])), shape[4])
+        self.mean = np.memmap(os.path.join(path, 'mean.f32'), dtype='<f4', mode='r', shape=flat)
+        self.std = np.memmap(os.path.join(path, 'std.f32'), dtype='<f4', mode='r', shape=flat)
+        self.count = np.memmap(os.path.join(path, 'count.i32'), dtype='<i4', mode='r', shape=flat)
+
+    def lookup(self, variable, latitudes, longitudes, times, missing=None):
+        """(mean, std, count) of each profile's cell and month, (n_profiles, n_levels); NaN/0 when unknown"""
+        j = self.variables.index(variable)
+        cells = cell_index(latitudes, longitudes, times, missing, self.cell_degrees)
+        known = cells >= 0
+        safe = np.where(known, cells, 0)
+        mean = np.where(known[:, None], self.mean[j][safe], np.nan)
+        std = np.where(known[:, None], self.std[j][safe], np.nan)
+        count = np.where(known[:, None], self.count[j][safe], 0)
+        return mean, std, count
+
+    def anomalies(self, variable, values, latitudes, longitudes, times, missing=None):
+        """Anomaly (value - climatological mean) and z-score for (n_profiles, n_levels) values"""
+        mean, std, count = self.lookup(variable, latitudes, longitudes, times, missing)
+        anomaly = np.asarray(values, dtype=np.float64) - mean
+        with np.errstate(divide='ignore', invalid='ignore'):
+            zscore = np.where(std > 0, anomaly / std, np.nan)
+        return {'anomaly': anomaly, 'zscore': zscore, 'mean': mean, 'std': std, 'count': count}
+
+def open_climatology(root=None):
+    """The cube under root, or None when none has been built"""
+    root = root or CLIMATOLOGY_DIR
+    if not os.path.exists(os.path.join(root, 'manifest.json')):
+        return None
+    return Climatology(root)
+
+def current(engine, root=None):
+    """
+    The cube if it was built for the database's dataset version, else None.
+    Checked at most every VERSION_CHECK_INTERVAL seconds.
+    """
+    global _cube, _last_check
+    if time.monotonic() - _last_check < VERSION_CHECK_INTERVAL:
+        return _cube
+    with _cube_lock:
+        if time.monotonic() - _last_check < VERSION_CHECK_INTERVAL:
+            return _cube
+        _last_check = time.monotonic()
+        try:
+            version = dataset_meta.read_version(engine)
+        except Exception as e:
+            logger.error(f"Could not read dataset version: {e}")
+            return _cube
+        if _cube is None or _cube.version != version:
+            try:
+                cube = open_climatology(root)
+            except Exception as e:
+                logger.error(f"Could not open climatology: {e}")
+                cube = None
+            if cube is not None and cube.version != version:
+                logger.warning(f"Climatology is for dataset {cube.version}, database is {version}; not using it")
+                cube = None
+            _cube = cube
+    return _cube
+
+def clear():
+    global _cube, _last_check
+    with _cube_lock:
+        _cube = None
+        _last_check = 0.0
+
+# --- Per-profile anomalies ---
+def profile_metadata(engine, profile_ids):
+    """
+    profile_id, float_id, time (epoch seconds), missing_time, latitude and
+    longitude for the ids found, from the profile store when it matches the
+    database, else the database.
+    """
+    ids = np.asarray(list(profile_ids), dtype=np.int64)
+    store = profile_store.current(engine)
+    parts = []
+    if store is not None and len(ids):
+        positions = store.positions(ids)
+        rows = store.metadata[positions[positions >= 0]]
+        # The store writes 0 for dates it could not parse
+        parts.append(pd.DataFrame({'profile_id': rows['profile_id'], 'float_id': rows['float_id'],
+                                   'time': rows['time'], 'missing_time': rows['time'] == 0,
+                                   'latitude': rows['latitude'], 'longitude': rows['longitude']}))
+        ids = ids[positions < 0]
+    if len(ids):
+        sql = text("SELECT profile_id, float_id, profile_date, latitude, longitude FROM argo_profiles "
+                   "WHERE profile_id IN :ids").bindparams(bindparam('ids', expanding=True))
+        with engine.connect() as conn:
+            rows = pd.read_sql(sql, conn, params={'ids': ids.tolist()})
+        times, missing = to_epoch_seconds(rows['profile_date'])
+        parts.append(pd.DataFrame({'profile_id': rows['profile_id'].to_numpy(dtype=np.int64),
+                                   'float_id': rows['float_id'].to_numpy(dtype=np.int64),
+                                   'time': times, 'missing_time': missing,
+                                   'latitude': rows['latitude'].to_numpy(dtype=np.float64),
+                                   'longitude': rows['longitude'].to_numpy(dtype=np.float64)}))
+    if not parts:
+        return pd.DataFrame(columns=['profile_id', 'float_id', 'time', 'missing_time', 'latitude', 'longitude'])
+    return pd.concat(parts, ignore_index=True)
+
+def profile_anomalies(engine, cube, profile_ids, variable='temperature'):
+    """
+    (metadata, anomalies) for profiles: each is regridded onto the cube's
+    levels (through the regrid cache) and compared with its cell and month.
+    """
+    metadata = profile_metadata(engine, profile_ids)
+    ids = metadata['profile_id'].tolist()
+    if np.isin(cube.levels, regrid.STANDARD_LEVELS).all():
+        # Interpolation at a level does not depend on the other levels, so the
+        # standard-level rows sliced to the cube's levels are exact
+        columns = np.searchsorted(regrid.STANDARD_LEVELS, cube.levels)
+        values = regrid.regridded_matrix(engine, ids, variable)[:, columns]
+    else:
+        values = regrid.regridded_matrix(engine, ids, variable, cube.levels)
+    return metadata, cube.anomalies(variable, values, metadata['latitude'].to_numpy(dtype=np.float64),
+                                    metadata['longitude'].to_numpy(dtype=np.float64),
+                                    metadata['time'].to_numpy(dtype=np.int64),
+                                    metadata['missing_time'].to_numpy(dtype=bool))
+
+# --- To run this script ---
+if __name__ == '__main__':
+    engine = create_engine(DATABASE_URL)
+    version = dataset_meta.read_version(engine)
+    print(f"Building climatology for dataset {version}...")
+    start = time.perf_counter()
+    path = write_climatology(engine, version)
+    cube = open_climatology(path)
+    populated = int((np.asarray(cube.count) >= MIN_COUNT).any(axis=(0, 2)).sum())
+    print(f"Climatology in {path}: {cube.manifest['profiles']} profiles, {populated} populated cell-months "
+          f"at {CELL_DEGREES} degrees, {len(cube.levels)} levels, in {time.perf_counter() - start:.1f}s")
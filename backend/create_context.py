@@ -1,64 +1,248 @@
+import json
+import os
+import numpy as np
+import pandas as pd
 from sqlalchemy import create_engine, inspect
+import derived
+import profile_store
 
 # --- DATABASE CONFIGURATION ---
 # IMPORTANT: Replace 'YOUR_PASSWORD' with your PostgreSQL password.
 DB_USER = 'postgres'
-DB_PASSWORD = 'anushka' 
+DB_PASSWORD = 'anushka'
 DB_HOST = 'localhost'
 DB_PORT = '5432'
 DB_NAME = 'floatchat_db'
 
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-engine = create_engine(DATABASE_URL)
 
-def get_db_schema_and_context():
+# --- Context statistics ---
+# load_data.py computes column statistics once per ingest and writes them to
+# CONTEXT_STATS_PATH with the dataset version. The chatbot renders them into
+# a compact prompt context and only rebuilds it when the version changes.
+CONTEXT_STATS_PATH = os.getenv("CONTEXT_STATS_PATH", "./db_context_stats.json")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "700"))
+CHARS_PER_TOKEN = 4              # rough size of an English/SQL token for budgeting
+STAT_QUANTILES = [0.05, 0.5, 0.95]
+STAT_COLUMNS = ['latitude', 'longitude'] + derived.DERIVED_COLUMNS
+
+COLUMN_DESCRIPTIONS = {
+    'profile_id': "A unique integer identifier for each profile.",
+    'float_id': "The unique identifier for each ARGO float.",
+    'profile_date': "The timestamp (UTC) when the profile was taken. Format is YYYY-MM-DD HH:MM:SS.",
+    'latitude': "The latitude of the float in degrees north.",
+    'longitude': "The longitude of the float in degrees east.",
+    'pressure_levels': "A JSON array of pressure levels (depths) in decibars.",
+    'temperature_values': "A JSON array of temperature readings in Celsius, corresponding to the pressure_levels.",
+    'salinity_values': "A JSON array of salinity readings (PSU), corresponding to the pressure_levels.",
+    'mld_temp': "Mixed layer depth in decibars (temperature differs by more than 0.2 C from its value at 10 dbar). Indexed.",
+    'thermocline_depth': "Pressure in decibars of the strongest temperature decrease with depth (maximum -dT/dp, above 1000 dbar). Indexed.",
+    'max_temp_gradient': "Strength of the thermocline: maximum temperature decrease with depth in C per decibar. Indexed.",
+    'surface_temperature': "Temperature in Celsius at the shallowest level within 10 dbar of the surface. Indexed.",
+    'surface_salinity': "Salinity (PSU) at the shallowest level within 10 dbar of the surface. Indexed."
+}
+
+def get_db_schema_and_context(engine=None):
     """
     Connects to the database and generates a text description of the
     argo_profiles table's schema and purpose.
     """
     try:
+        engine = engine or create_engine(DATABASE_URL)
         inspector = inspect(engine)
         columns = inspector.get_columns('argo_profiles')
-        
+
         context = "This database contains ARGO float data in a table named 'argo_profiles'.\n"
         context += "Each row represents a unique measurement profile from a specific float at a specific time.\n\n"
         context += "The table has the following columns:\n"
-        
+
         for column in columns:
             column_name = column['name']
-            description = ""
-            if column_name == 'float_id':
-                description = "The unique identifier for each ARGO float."
-            elif column_name == 'profile_date':
-                description = "The timestamp (UTC) when the profile was taken. Format is YYYY-MM-DD HH:MM:SS."
-            elif column_name == 'latitude':
-                description = "The latitude of the float in degrees north."
-            elif column_name == 'longitude':
-                description = "The longitude of the float in degrees east."
-            elif column_name == 'pressure_levels':
-                description = "A JSON array of pressure levels (depths) in decibars."
-            elif column_name == 'temperature_values':
-                description = "A JSON array of temperature readings in Celsius, corresponding to the pressure_levels."
-            elif column_name == 'salinity_values':
-                description = "A JSON array of salinity readings (PSU), corresponding to the pressure_levels."
-            
+            description = COLUMN_DESCRIPTIONS.get(column_name, "")
             context += f"- {column_name}: {description}\n"
-            
+
         return context
 
     except Exception as e:
         print(f"An error occurred: {e}")
         return None
 
+# --- Column statistics ---
+def _summary(values):
+    """min, quantiles, max and null fraction of a numeric column (None when it is all null)"""
+    values = np.asarray(values, dtype=np.float64)
+    present = values[~np.isnan(values)]
+    if len(present) == 0:
+        return None
+    quantiles = np.quantile(present, STAT_QUANTILES)
+    return {
+        'min': float(present.min()),
+        'quantiles': {f"p{int(q * 100):02d}": float(v) for q, v in zip(STAT_QUANTILES, quantiles)},
+        'max': float(present.max()),
+        'null_fraction': round(1 - len(present) / len(values), 4)
+    }
+
+def column_stats(profiles, max_pressure=None):
+    """
+    Coverage and value distribution of argo_profiles rows: profile and float
+    counts, date range, and a summary of every scalar column present.
+    max_pressure (deepest level per profile) is summarized when given.
+    """
+    dates = profiles['profile_date'].dropna().astype(str)
+    stats = {
+        'profiles': int(len(profiles)),
+        'floats': int(profiles['float_id'].nunique()),
+        'date_min': dates.min() if len(dates) else None,
+        'date_max': dates.max() if len(dates) else None,
+        'columns': {}
+    }
+    for col in STAT_COLUMNS:
+        if col in profiles.columns:
+            summary = _summary(pd.to_numeric(profiles[col], errors='coerce'))
+            if summary is not None:
+                stats['columns'][col] = summary
+    if max_pressure is not None:
+        summary = _summary(max_pressure)
+        if summary is not None:
+            stats['columns']['max_pressure'] = summary
+    return stats
+
+def table_schema(engine):
+    """Column names/types and indexes of argo_profiles"""
+    inspector = inspect(engine)
+    return {
+        'column_types': {c['name']: str(c['type']) for c in inspector.get_columns('argo_profiles')},
+        'indexes': [{'name': i['name'], 'columns': i['column_names'], 'unique': bool(i.get('unique'))}
+                    for i in inspector.get_indexes('argo_profiles')]
+    }
+
+def stats_from_database(engine, store=None):
+    """column_stats for the database as it is now, reading only the scalar columns"""
+    available = {c['name'] for c in inspect(engine).get_columns('argo_profiles')}
+    columns = ['float_id', 'profile_date'] + [c for c in STAT_COLUMNS if c in available]
+    profiles = pd.read_sql(f"SELECT {', '.join(columns)} FROM argo_profiles", engine)
+    store = store or profile_store.current(engine)
+    max_pressure = store.reduce('pressure') if store is not None else None
+    return column_stats(profiles, max_pressure)
+
+def write_stats(engine, version, profiles=None, store=None, path=None):
+    """
+    Compute the context statistics for a dataset version (from the ingested
+    DataFrame when given, else from the database) and write them to path.
+    Returns the statistics.
+    """
+    path = path or CONTEXT_STATS_PATH
+    if profiles is not None:
+        stats = column_stats(profiles, store.reduce('pressure') if store is not None else None)
+    else:
+        stats = stats_from_database(engine, store)
+    stats.update(table_schema(engine))
+    stats['dataset_version'] = version
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(stats, f, indent=2)
+    os.replace(tmp_path, path)
+    return stats
+
+def load_stats(engine, version, path=None):
+    """
+    Statistics for a dataset version: from path when it was written for that
+    version, else recomputed from the database (and written back).
+    """
+    path = path or CONTEXT_STATS_PATH
+    try:
+        with open(path) as f:
+            stats = json.load(f)
+        if stats.get('dataset_version') == version:
+            return stats
+    except (OSError, ValueError):
+        pass
+    try:
+        return write_stats(engine, version, path=path)
+    except OSError:
+        stats = stats_from_database(engine)
+        stats.update(table_schema(engine))
+        stats['dataset_version'] = version
+        return stats
+
+# --- Prompt context ---
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _number(value):
+    return f"{value:.4g}"
+
+def _render(stats, detail):
+    """Context text at a level of detail: 3 full, 2 no min/max, 1 short descriptions, 0 names only"""
+    lines = ["Table argo_profiles: one row per ARGO profile (one float at one time)."]
+    coverage = f"Data: {stats['profiles']} profiles from {stats['floats']} floats"
+    if stats.get('date_min'):
+        coverage += f", profile_date {stats['date_min']} to {stats['date_max']}"
+    for col, label in (('latitude', 'latitude'), ('longitude', 'longitude')):
+        summary = stats['columns'].get(col)
+        if summary:
+            coverage += f", {label} {_number(summary['min'])} to {_number(summary['max'])}"
+    lines.append(coverage + ". Conditions outside these ranges match nothing.")
+
+    indexed = [i['columns'][0] if len(i['columns']) == 1 else f"({', '.join(i['columns'])})"
+               for i in stats.get('indexes', [])]
+    if indexed:
+        lines.append(f"Indexed: {', '.join(indexed)}. Prefer these columns in filters.")
+
+    lines.append("Columns:")
+    for col, col_type in stats.get('column_types', {}).items():
+        line = f"- {col} {col_type}"
+        # The Indexed line above already says which columns are indexed
+        description = COLUMN_DESCRIPTIONS.get(col, "").replace(" Indexed.", "") if indexed \
+            else COLUMN_DESCRIPTIONS.get(col, "")
+        if detail >= 1 and description:
+            line += ": " + (description if detail >= 3 else description.split('.')[0].split(' (')[0])
+        summary = stats['columns'].get(col)
+        if detail >= 1 and summary and col not in ('latitude', 'longitude'):
+            values = [f"{name} {_number(v)}" for name, v in summary['quantiles'].items()]
+            if detail >= 2:
+                values = [f"min {_number(summary['min'])}"] + values + [f"max {_number(summary['max'])}"]
+            if summary['null_fraction'] > 0:
+                values.append(f"{summary['null_fraction']:.0%} null")
+            line += f" [{', '.join(values)}]"
+        lines.append(line)
+
+    summary = stats['columns'].get('max_pressure')
+    if summary and detail >= 1:
+        lines.append("Deepest pressure level per profile (dbar): " +
+                     ", ".join(f"{name} {_number(v)}" for name, v in summary['quantiles'].items()) + ".")
+    return "\n".join(lines) + "\n"
+
+def render_context(stats, budget=None):
+    """
+    Compact prompt context from the statistics: the most detailed rendering
+    whose estimated token count fits the budget (names only if none does).
+    """
+    budget = budget or CONTEXT_TOKEN_BUDGET
+    for detail in (3, 2, 1):
+        text = _render(stats, detail)
+        if estimate_tokens(text) <= budget:
+            return text
+    return _render(stats, 0)
+
 # --- To run this script ---
 if __name__ == '__main__':
-    schema_context = get_db_schema_and_context()
-    
+    import dataset_meta
+    engine = create_engine(DATABASE_URL)
+    schema_context = get_db_schema_and_context(engine)
+
     if schema_context:
         print("--- Generated Database Context (AI Cheat Sheet) ---")
         print(schema_context)
-        
+
         # Save this context to a file for our AI to use later
         with open("db_context.txt", "w") as f:
             f.write(schema_context)
-        print("\nContext has been saved to 'db_context.txt'")
\ No newline at end of file
+        print("\nContext has been saved to 'db_context.txt'")
+
+        # Statistics for databases loaded before load_data.py wrote them
+        stats = write_stats(engine, dataset_meta.read_version(engine))
+        context = render_context(stats)
+        print(f"--- Statistics context (~{estimate_tokens(context)} tokens) ---")
+        print(context)
+        print(f"Statistics saved to '{CONTEXT_STATS_PATH}'")
@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+import pandas as pd
+from sqlalchemy import text
+
+# --- Dataset version ---
+# load_data.py stamps every ingest with a new version in a one-row table.
+# Anything derived from argo_profiles outside the database (in-memory
+# indexes, files next to the backend) records the version it was built from
+# and rebuilds when the stamp changes.
+DATASET_META_TABLE = 'dataset_meta'
+
+def new_version(profile_count):
+    return f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')}-{profile_count}"
+
+def write_version(engine, profile_count, version=None):
+    """Record a new dataset version after an ingest; returns the version string"""
+    version = version or new_version(profile_count)
+    pd.DataFrame([{
+        'version': version,
+        'profile_count': int(profile_count),
+        'loaded_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    }]).to_sql(DATASET_META_TABLE, engine, if_exists='replace', index=False)
+    return version
+
+def read_version(engine):
+    """
+    Current dataset version. Databases loaded before versioning existed get
+    one derived from the row count and largest profile_id.
+    """
+    with engine.connect() as conn:
+        try:
+            row = conn.execute(text(f"SELECT version FROM {DATASET_META_TABLE}")).first()
+            if row is not None:
+                return row[0]
+        except Exception:
+            conn.rollback()
+        count, max_id = conn.execute(text("SELECT COUNT(*), MAX(profile_id) FROM argo_profiles")).first()
+    return f"unversioned-{count}-{max_id}"
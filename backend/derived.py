@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+import profile_data
+import regrid
+
+# --- DATABASE CONFIGURATION ---
+DB_USER = 'postgres'
+DB_PASSWORD = 'anushka'
+DB_HOST = 'localhost'
+DB_PORT = '5432'
+DB_NAME = 'floatchat_db'
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# --- Analysis settings ---
+# Profiles are regridded onto a fine regular grid before differentiating
+FINE_LEVELS = np.arange(0, 2001, 5, dtype=np.float64)
+MLD_REFERENCE_PRESSURE = 10.0    # dbar, de Boyer Montegut et al. (2004)
+MLD_TEMP_THRESHOLD = 0.2         # degC
+SURFACE_MAX_PRESSURE = 10.0      # shallowest level must be within this depth
+THERMOCLINE_MAX_PRESSURE = 1000.0
+MAX_GAP = 100.0                  # dbar; wider gaps are not interpolated
+BATCH_SIZE = 5000
+
+DERIVED_COLUMNS = [
+    'mld_temp',
+    'thermocline_depth',
+    'max_temp_gradient',
+    'surface_temperature',
+    'surface_salinity'
+]
+
+def vertical_gradient(matrix, levels=FINE_LEVELS):
+    """d(value)/dp along each row, NaN wherever either neighbour is missing"""
+    levels = np.asarray(levels, dtype=np.float64)
+    gradient = np.full(matrix.shape, np.nan)
+    if matrix.shape[1] < 2:
+        return gradient
+    # Centred differences in the interior, one-sided at the ends
+    dp = np.diff(levels)
+    forward = np.diff(matrix, axis=1) / dp
+    gradient[:, 0] = forward[:, 0]
+    gradient[:, -1] = forward[:, -1]
+    gradient[:, 1:-1] = (matrix[:, 2:] - matrix[:, :-2]) / (levels[2:] - levels[:-2])
+    return gradient
+
+def mixed_layer_depth(temperature, levels=FINE_LEVELS,
+                      threshold=MLD_TEMP_THRESHOLD, reference=MLD_REFERENCE_PRESSURE):
+    """
+    Mixed layer depth by temperature threshold: the pressure where temperature
+    first differs from its value at the reference pressure by more than the
+    threshold, linearly interpolated between grid levels. NaN if the profile
+    has no reference value or never crosses the threshold.
+    """
+    levels = np.asarray(levels, dtype=np.float64)
+    ref = int(np.searchsorted(levels, reference))
+    if ref >= len(levels):
+        return np.full(len(temperature), np.nan)
+    t_ref = temperature[:, ref]
+    deviation = np.abs(temperature - t_ref[:, None])
+    crossed = deviation > threshold
+    crossed[:, :ref + 1] = False
+
+    k = crossed.argmax(axis=1)
+    found = crossed[np.arange(len(k)), k] & ~np.isnan(t_ref)
+    k = np.maximum(k, 1)
+
+    rows = np.arange(len(k))
+    d0, d1 = deviation[rows, k - 1], deviation[rows, k]
+    p0, p1 = levels[k - 1], levels[k]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where(d1 > d0, (threshold - d0) / (d1 - d0), 0.0)
+    mld = np.where(np.isnan(d0), p1, p0 + np.clip(weight, 0.0, 1.0) * (p1 - p0))
+    return np.where(found, mld, np.nan)
+
+def thermocline(temperature, levels=FINE_LEVELS, max_pressure=THERMOCLINE_MAX_PRESSURE):
+    """Depth and strength (degC/dbar, positive = cooling with depth) of the maximum -dT/dp"""
+    levels = np.asarray(levels, dtype=np.float64)
+    cooling = -vertical_gradient(temperature, levels)
+    cooling[:, levels > max_pressure] = np.nan
+    has_data = ~np.isnan(cooling).all(axis=1)
+    k = np.nanargmax(np.where(has_data[:, None], cooling, 0.0), axis=1)
+    strength = cooling[np.arange(len(k)), k]
+    return np.where(has_data, levels[k], np.nan), np.where(has_data, strength, np.nan)
+
+def surface_value(matrix, levels=FINE_LEVELS, max_pressure=SURFACE_MAX_PRESSURE):
+    """Shallowest non-NaN value within max_pressure of the surface"""
+    levels = np.asarray(levels, dtype=np.float64)
+    near = matrix[:, levels <= max_pressure]
+    valid = ~np.isnan(near)
+    if near.shape[1] == 0:
+        return np.full(len(matrix), np.nan)
+    k = valid.argmax(axis=1)
+    return np.where(valid.any(axis=1), near[np.arange(len(k)), k], np.nan)
+
+def compute_features(pressures, temperatures, salinities, batch_size=BATCH_SIZE):
+    """
+    Derived quantities for ragged profiles, as a DataFrame with DERIVED_COLUMNS.
+    Profiles are processed in batches so the fine-grid matrices stay bounded.
+    """
+    parts = []
+    for start in range(0, len(pressures), batch_size):
+        stop = start + batch_size
+        temp = regrid.regrid_profiles(pressures[start:stop], temperatures[start:stop], FINE_LEVELS, MAX_GAP)
+        psal = regrid.regrid_profiles(pressures[start:stop], salinities[start:stop], FINE_LEVELS, MAX_GAP)
+        depth, strength = thermocline(temp)
+        parts.append(pd.DataFrame({
+            'mld_temp': mixed_layer_depth(temp),
+            'thermocline_depth': depth,
+            'max_temp_gradient': strength,
+            'surface_temperature': surface_value(temp),
+            'surface_salinity': surface_value(psal)
+        }))
+    if not parts:
+        return pd.DataFrame(columns=DERIVED_COLUMNS, dtype=np.float64)
+    return pd.concat(parts, ignore_index=True).astype(np.float32)
+
+def add_derived_columns(profiles):
+    """Append DERIVED_COLUMNS to a DataFrame of profiles with JSON TEXT measurement columns"""
+    features = compute_features(
+        [profile_data.decode_array(v) for v in profiles['pressure_levels']],
+        [profile_data.decode_array(v) for v in profiles['temperature_values']],
+        [profile_data.decode_array(v) for v in profiles['salinity_values']]
+    )
+    for col in DERIVED_COLUMNS:
+        profiles[col] = features[col].to_numpy()
+    return profiles
+
+def create_derived_indexes(conn):
+    """B-tree indexes so derived-quantity filters are index scans"""
+    for col in DERIVED_COLUMNS:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{col} ON argo_profiles({col});"))
+
+def backfill(engine):
+    """Compute derived columns for an existing argo_profiles table in place"""
+    print("Loading profiles...")
+    profiles = pd.read_sql(
+        "SELECT profile_id, pressure_levels, temperature_values, salinity_values FROM argo_profiles",
+        engine
+    )
+    print(f"Computing derived quantities for {len(profiles)} profiles...")
+    features = add_derived_columns(profiles)[['profile_id'] + DERIVED_COLUMNS]
+    features.to_sql('argo_derived_tmp', engine, if_exists='replace', index=False, chunksize=10000)
+
+    with engine.connect() as conn:
+        for col in DERIVED_COLUMNS:
+            conn.execute(text(f"ALTER TABLE argo_profiles ADD COLUMN IF NOT EXISTS {col} REAL;"))
+        assignments = ", ".join(f"{col} = d.{col}" for col in DERIVED_COLUMNS)
+        conn.execute(text(f"""
+            UPDATE argo_profiles AS p SET {assignments}
+            FROM argo_derived_tmp AS d
+            WHERE p.profile_id = d.profile_id;
+        """))
+        conn.execute(text("DROP TABLE argo_derived_tmp;"))
+        create_derived_indexes(conn)
+        conn.commit()
+    print("Derived columns updated.")
+
+# --- To run this script ---
+if __name__ == '__main__':
+    backfill(create_engine(DATABASE_URL))
@@ -0,0 +1,235 @@
+"""
+Quantized embedding tier for first-stage vector search.
+
+    python embedding_tier.py build --mode int8
+    python embedding_tier.py eval --queries 200 --k 50
+
+build copies the profile embeddings out of Chroma into EMBEDDING_TIER_DIR:
+an int8 (per-dimension scale) or float16 copy that is loaded into memory, and
+the float32 originals that stay memory-mapped on disk. A search scans the
+compact copy for the top k * RERANK_FACTOR candidates and re-ranks only those
+with the full-precision rows. eval reports the resident memory of each tier
+and recall@k against exact float32 search.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+import numpy as np
+from tune_chroma import exact_knn, read_collection
+
+logger = logging.getLogger(__name__)
+
+# Database configuration (build records the dataset version of the database)
+DB_USER = 'postgres'
+DB_PASSWORD = 'anushka'
+DB_HOST = 'localhost'
+DB_PORT = '5432'
+DB_NAME = 'floatchat_db'
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# --- Tier layout ---
+# EMBEDDING_TIER_DIR holds:
+#   manifest.json      mode, count, dimension, source collection size and the
+#                      dataset version it was built for (the backend ignores a
+#                      tier built for another version)
+#   ids.npy            profile ids (Chroma ids) and float ids, row-aligned
+#   quantized.bin      int8 or float16 (n, dim), read into memory
+#   scales.f32         int8 only: per-dimension scale (value = code * scale)
+#   full.f32           float32 (n, dim), memory-mapped for re-ranking
+#   norms.f32          squared L2 norm of every full-precision row
+EMBEDDING_TIER_DIR = os.getenv("EMBEDDING_TIER_DIR", "./embedding_tier")
+MODES = {'int8': np.int8, 'float16': np.float16}
+RERANK_FACTOR = 4                # first-stage candidates per requested result
+SCAN_CHUNK_ROWS = 65536          # rows upcast to float32 at a time during the scan
+
+def quantize(embeddings, mode):
+    """(codes, scales) for float32 embeddings; scales is None for float16"""
+    if mode == 'float16':
+        return embeddings.astype(np.float16), None
+    scales = np.abs(embeddings).max(axis=0) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(embeddings / scales), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def write_tier(ids, float_ids, embeddings, mode, root=None, source_count=None, dataset_version=None):
+    """Write a tier for (n, dim) float32 embeddings, replacing any previous one. Returns the directory."""
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    root = root or EMBEDDING_TIER_DIR
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    tmp_dir = root.rstrip('/') + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    codes, scales = quantize(embeddings, mode)
+    codes.tofile(os.path.join(tmp_dir, 'quantized.bin'))
+    if scales is not None:
+        scales.tofile(os.path.join(tmp_dir, 'scales.f32'))
+    embeddings.astype('<f4').tofile(os.path.join(tmp_dir, 'full.f32'))
+    np.einsum('ij,ij->i', embeddings, embeddings).astype('<f4').tofile(os.path.join(tmp_dir, 'norms.f32'))
+    np.save(os.path.join(tmp_dir, 'ids.npy'), np.column_stack([np.asarray(ids, dtype=np.int64),
+                                                              np.asarray(float_ids, dtype=np.int64)]))
+    manifest = {
+        'mode': mode,
+        'count': int(len(embeddings)),
+        'dim': int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        'source_count': int(len(embeddings) if source_count is None else source_count),
+        'dataset_version': dataset_version,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    }
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(root, ignore_errors=True)
+    os.replace(tmp_dir, root)
+    return root
+
+class EmbeddingTier:
+    """
+    Compact codes in memory, float32 rows on disk. search() returns the k
+    nearest (profile ids, float ids, squared L2 distances) like a Chroma
+    query in its default l2 space.
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.mode = self.manifest['mode']
+        n, dim = self.manifest['count'], self.manifest['dim']
+        self.codes = np.fromfile(os.path.join(path, 'quantized.bin'), dtype=MODES[self.mode]).reshape(n, dim)
+        self.scales = np.fromfile(os.path.join(path, 'scales.f32'), dtype='<f4') if self.mode == 'int8' else None
+        self.norms = np.fromfile(os.path.join(path, 'norms.f32'), dtype='<f4')
+        ids = np.load(os.path.join(path, 'ids.npy'))
+        self.profile_id, self.float_id = ids[:, 0], ids[:, 1]
+        self.full = np.memmap(os.path.join(path, 'full.f32'), dtype='<f4', mode='r', shape=(n, dim)) \
+            if n else np.empty((0, dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.profile_id)
+
+    def resident_bytes(self):
+        """Bytes held in memory for the first stage (codes, scales, norms, ids)"""
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0) \
+            + self.norms.nbytes + self.profile_id.nbytes + self.float_id.nbytes
+
+    def approximate_distances(self, query):
+        """||q - x||^2 for every row with x taken from the compact codes, scanned in chunks"""
+        query = np.asarray(query, dtype=np.float32)
+        weights = query * self.scales if self.scales is not None else query
+        dots = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCAN_CHUNK_ROWS):
+            chunk = self.codes[start:start + SCAN_CHUNK_ROWS].astype(np.float32)
+            dots[start:start + len(chunk)] = chunk @ weights
+        return float(query @ query) + self.norms - 2.0 * dots
+
+    def search(self, query, k, rerank_factor=RERANK_FACTOR):
+        """Top k rows: first stage on the codes, re-ranked with the float32 rows when rerank_factor > 0"""
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32)
+        k = min(k, len(self))
+        approximate = self.approximate_distances(query)
+        n_candidates = min(max(k * rerank_factor, k), len(self))
+        candidates = np.argpartition(approximate, n_candidates - 1)[:n_candidates]
+        if rerank_factor > 0:
+            # Sorted positions keep the memmap reads in file order
+            candidates = np.sort(candidates)
+            distances = ((self.full[candidates] - query) ** 2).sum(axis=1)
+        else:
+            distances = approximate[candidates]
+        best = np.argsort(distances, kind='stable')[:k]
+        rows = candidates[best]
+        return self.profile_id[rows], self.float_id[rows], distances[best]
+
+def open_tier(root=None):
+    """The tier under root, or None when none has been built"""
+    root = root or EMBEDDING_TIER_DIR
+    if not os.path.exists(os.path.join(root, 'manifest.json')):
+        return None
+    return EmbeddingTier(root)
+
+def build_from_collection(collection, mode, root=None, dataset_version=None):
+    """Write a tier from every embedding in a Chroma collection, recording the dataset version it belongs to"""
+    ids, embeddings, metadatas = read_collection(collection)
+    float_ids = [int(m['float_id']) for m in metadatas]
+    return write_tier([int(i) for i in ids], float_ids, embeddings, mode, root, source_count=collection.count(),
+                      dataset_version=dataset_version)
+
+# --- Evaluation ---
+def evaluate(tier, queries, k):
+    """Recall@k against exact float32 search, with and without re-ranking, and search latency"""
+    truth = exact_knn(np.asarray(tier.full), queries, k)
+    report = {}
+    for name, factor in (('first_stage', 0), ('reranked', RERANK_FACTOR)):
+        recalls, latencies = [], []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            found, _, _ = tier.search(query, k, rerank_factor=factor)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(set(found.tolist()) & set(tier.profile_id[expected].tolist())) / len(expected))
+        report[name] = {'recall': float(np.mean(recalls)),
+                        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+                        'p95_ms': float(np.percentile(latencies, 95) * 1000)}
+    return report
+
+# --- To run this script ---
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--path', default=EMBEDDING_TIER_DIR, help='tier directory')
+    parser.add_argument('--chroma-path', default='./chroma_db')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='write the tier from the Chroma collection')
+    build_parser.add_argument('--mode', choices=list(MODES), default='int8')
+    eval_parser = commands.add_parser('eval', help='memory and recall@k of each mode on the built tier')
+    eval_parser.add_argument('--queries', type=int, default=200, help='stored embeddings (with noise) used as queries')
+    eval_parser.add_argument('--noise', type=float, default=0.05, help='query perturbation relative to vector norm')
+    eval_parser.add_argument('--k', type=int, default=50)
+    eval_parser.add_argument('--output', help='write the report as JSON')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        import chromadb
+        from sqlalchemy import create_engine
+        import dataset_meta
+        version = dataset_meta.read_version(create_engine(DATABASE_URL))
+        collection = chromadb.PersistentClient(path=args.chroma_path).get_collection('argo_profiles')
+        print(f"Writing {args.mode} tier for {collection.count()} embeddings of dataset {version}...")
+        build_from_collection(collection, args.mode, args.path, dataset_version=version)
+        tier = open_tier(args.path)
+        print(f"Tier in {args.path}: {len(tier)} x {tier.manifest['dim']}, "
+              f"{tier.resident_bytes() / 1e6:.1f} MB resident, {tier.full.nbytes / 1e6:.1f} MB float32 on disk")
+    else:
+        tier = open_tier(args.path)
+        if tier is None:
+            raise SystemExit(f"No tier in {args.path}; run 'python embedding_tier.py build' first")
+        full = np.asarray(tier.full)
+        rng = np.random.default_rng(0)
+        picks = rng.choice(len(tier), min(args.queries, len(tier)), replace=False)
+        noise = rng.normal(size=(len(picks), full.shape[1])).astype(np.float32)
+        noise *= args.noise * np.linalg.norm(full[picks], axis=1, keepdims=True) / np.sqrt(full.shape[1])
+        queries = full[picks] + noise
+
+        float32_bytes = full.nbytes + tier.norms.nbytes + tier.profile_id.nbytes + tier.float_id.nbytes
+        report = {'count': len(tier), 'dim': full.shape[1], 'k': args.k, 'float32_resident_mb': float32_bytes / 1e6,
+                  'modes': {}}
+        print(f"{len(tier)} embeddings x {full.shape[1]}: float32 resident {float32_bytes / 1e6:.1f} MB")
+        scratch = args.path.rstrip('/') + '.eval'
+        for mode in MODES:
+            candidate = open_tier(write_tier(tier.profile_id, tier.float_id, full, mode, scratch,
+                                             dataset_version=tier.manifest.get('dataset_version')))
+            result = {'resident_mb': candidate.resident_bytes() / 1e6,
+                      'saved': 1 - candidate.resident_bytes() / float32_bytes,
+                      **evaluate(candidate, queries, args.k)}
+            report['modes'][mode] = result
+            print(f"{mode:<8} resident {result['resident_mb']:.1f} MB ({result['saved']:.0%} saved)  "
+                  f"recall@{args.k} first stage {result['first_stage']['recall']:.4f}, "
+                  f"re-ranked {result['reranked']['recall']:.4f}  "
+                  f"p50 {result['reranked']['p50_ms']:.2f} ms")
+            del candidate
+        shutil.rmtree(scratch, ignore_errors=True)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"Report written to {args.output}")
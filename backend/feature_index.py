@@ -0,0 +1,222 @@
+import logging
+import re
+import threading
+import time
+import numpy as np
+import pandas as pd
+import dataset_meta
+import derived
+import profile_store
+import regrid
+import spatial_index
+
+logger = logging.getLogger(__name__)
+
+# --- Feature configuration ---
+# One numeric vector per profile, standardized per feature so distances in
+# different units are comparable. Text embeddings handle wording; this index
+# handles "where, when and how warm/deep", which MiniLM embeds poorly.
+SUMMARY_LEVELS = [200.0, 1000.0]     # dbar; regridded temperature and salinity summaries
+FEATURES = (['latitude', 'longitude', 'time'] + derived.DERIVED_COLUMNS
+            + [f"{var}_{int(level)}" for var in ('temperature', 'salinity') for level in SUMMARY_LEVELS]
+            + ['temperature_max', 'temperature_min', 'pressure_max'])
+BUILD_BATCH_SIZE = 5000
+MISSING_PENALTY = 3.0                # standardized distance for a constrained feature the profile lacks
+VERSION_CHECK_INTERVAL = 30.0
+
+_index = None
+_index_lock = threading.Lock()
+_last_check = 0.0
+
+def profile_summaries(arrays):
+    """
+    {feature: values} for the array-derived features of a list of profiles
+    ({variable: array} dicts): temperature and salinity regridded onto
+    SUMMARY_LEVELS, temperature extremes and the deepest pressure.
+    """
+    empty = np.empty(0, dtype=np.float32)
+    pressures = [a.get('pressure', empty) for a in arrays]
+    features = {}
+    for var in ('temperature', 'salinity'):
+        matrix = regrid.regrid_profiles(pressures, [a.get(var, empty) for a in arrays], SUMMARY_LEVELS)
+        for j, level in enumerate(SUMMARY_LEVELS):
+            features[f"{var}_{int(level)}"] = matrix[:, j]
+
+    def reduce(values, ufunc):
+        values = values[~np.isnan(values)] if len(values) else values
+        return float(ufunc.reduce(values)) if len(values) else np.nan
+    features['temperature_max'] = np.array([reduce(a.get('temperature', empty), np.maximum) for a in arrays])
+    features['temperature_min'] = np.array([reduce(a.get('temperature', empty), np.minimum) for a in arrays])
+    features['pressure_max'] = np.array([reduce(p, np.maximum) for p in pressures])
+    return features
+
+class FeatureIndex:
+    """
+    Standardized (n_profiles, n_features) float32 matrix with NaN for missing
+    values. search() is a brute-force masked kNN: only the features a query
+    constrains contribute, and each contributes its distance outside the
+    query's interval, so profiles that satisfy every constraint score 0.
+    """
+    def __init__(self, profile_ids, float_ids, columns, version=None):
+        self.profile_id = np.asarray(profile_ids, dtype=np.int64)
+        self.float_id = np.asarray(float_ids, dtype=np.int64)
+        self.version = version
+        raw = np.column_stack([np.asarray(columns[f], dtype=np.float64) for f in FEATURES]) \
+            if len(self.profile_id) else np.empty((0, len(FEATURES)))
+        with np.errstate(invalid='ignore'):
+            self.mean = np.nan_to_num(np.nanmean(raw, axis=0)) if len(raw) else np.zeros(len(FEATURES))
+            std = np.nanstd(raw, axis=0) if len(raw) else np.ones(len(FEATURES))
+        self.scale = np.where(np.nan_to_num(std) > 0, np.nan_to_num(std), 1.0)
+        self.matrix = ((raw - self.mean) / self.scale).astype(np.float32)
+        self.time = raw[:, FEATURES.index('time')] if len(raw) else np.empty(0)
+
+    @classmethod
+    def from_engine(cls, engine, version=None):
+        """Scalar columns from the database, array summaries from the profile store (else the database)"""
+        available = set(pd.read_sql("SELECT * FROM argo_profiles LIMIT 0", engine).columns)
+        derived_columns = [c for c in derived.DERIVED_COLUMNS if c in available]
+        profiles = pd.read_sql(
+            f"SELECT {', '.join(['profile_id', 'float_id', 'profile_date', 'latitude', 'longitude'] + derived_columns)} "
+            f"FROM argo_profiles ORDER BY profile_id", engine)
+        times, missing = spatial_index.to_epoch_seconds(profiles['profile_date'])
+        columns = {'latitude': profiles['latitude'], 'longitude': profiles['longitude'],
+                   'time': np.where(missing, np.nan, times)}
+        for col in derived.DERIVED_COLUMNS:
+            columns[col] = profiles[col] if col in profiles.columns else np.full(len(profiles), np.nan)
+
+        ids = profiles['profile_id'].to_numpy(dtype=np.int64)
+        parts = []
+        for start in range(0, len(ids), BUILD_BATCH_SIZE):
+            batch = ids[start:start + BUILD_BATCH_SIZE]
+            arrays = profile_store.fetch_profile_arrays(engine, batch.tolist())
+            parts.append(profile_summaries([arrays.get(int(pid), {}) for pid in batch]))
+        for feature in FEATURES:
+            if feature not in columns:
+                columns[feature] = np.concatenate([p[feature] for p in parts]) if parts else np.empty(0)
+        return cls(ids, profiles['float_id'], columns, version=version)
+
+    def __len__(self):
+        return len(self.profile_id)
+
+    def distances(self, constraints):
+        """Squared standardized distance of every profile to {feature: (low, high)} intervals"""
+        total = np.zeros(len(self), dtype=np.float32)
+        for feature, (low, high) in constraints.items():
+            j = FEATURES.index(feature)
+            column = self.matrix[:, j]
+            gap = np.zeros(len(self), dtype=np.float32)
+            if low is not None:
+                gap = np.maximum(gap, np.float32((low - self.mean[j]) / self.scale[j]) - column)
+            if high is not None:
+                gap = np.maximum(gap, column - np.float32((high - self.mean[j]) / self.scale[j]))
+            gap[np.isnan(column)] = MISSING_PENALTY
+            total += gap * gap
+        return total
+
+    def search(self, constraints, k):
+        """
+        Row positions of the k profiles closest to the constraints, nearest
+        first; among equally close profiles the newest come first.
+        """
+        if not len(self) or not constraints:
+            return np.empty(0, dtype=np.int64)
+        distance = self.distances(constraints)
+        k = min(k, len(self))
+        cutoff = np.partition(distance, k - 1)[k - 1]
+        candidates = np.flatnonzero(distance <= cutoff)
+        order = np.lexsort((-np.nan_to_num(self.time[candidates], nan=-np.inf), distance[candidates]))
+        return candidates[order[:k]]
+
+    def ranked_floats(self, constraints, k):
+        """Distinct float ids of the k nearest profiles, in order of their best profile"""
+        floats = self.float_id[self.search(constraints, k)]
+        return list(dict.fromkeys(int(f) for f in floats))
+
+def get_index(engine):
+    """The feature index for the database's current dataset version, built on first use"""
+    global _index, _last_check
+    if _index is not None and time.monotonic() - _last_check < VERSION_CHECK_INTERVAL:
+        return _index
+    with _index_lock:
+        if _index is not None and time.monotonic() - _last_check < VERSION_CHECK_INTERVAL:
+            return _index
+        _last_check = time.monotonic()
+        version = dataset_meta.read_version(engine)
+        if _index is None or _index.version != version:
+            start = time.perf_counter()
+            _index = FeatureIndex.from_engine(engine, version)
+            logger.info(f"Built feature index for dataset {version}: {len(_index)} profiles "
+                        f"in {time.perf_counter() - start:.2f}s")
+    return _index
+
+def clear():
+    global _index, _last_check
+    with _index_lock:
+        _index = None
+        _last_check = 0.0
+
+# --- Constraints from profile SQL ---
+# Same trust rule as spatial_index: only plain AND-ed comparisons count.
+_ARRAY_FEATURES = {
+    ('temperature_values', '>'): ('temperature_max', 0),
+    ('temperature_values', '<'): ('temperature_min', 1),
+    ('pressure_levels', '>'): ('pressure_max', 0),
+}
+
+def constraints_from_sql(sql, params):
+    """
+    {feature: (low, high)} implied by the SQL: latitude/longitude/date bounds,
+    comparisons on the derived columns, and EXISTS conditions on array values
+    (any temperature above t means temperature_max >= t). None when nothing
+    usable is found.
+    """
+    if not sql or 'argo_profiles' not in sql or spatial_index._UNSAFE.search(sql):
+        return None
+    constraints = {}
+    bounds = spatial_index.bounds_from_sql(sql, params) or {}
+    for feature, low_key, high_key in (('latitude', 'lat_min', 'lat_max'), ('longitude', 'lon_min', 'lon_max'),
+                                       ('time', 'start', 'end')):
+        if low_key in bounds or high_key in bounds:
+            constraints[feature] = (bounds.get(low_key), bounds.get(high_key))
+
+    def value(name):
+        try:
+            return float(params.get(name))
+        except (TypeError, ValueError):
+            return None
+
+    def tighten(feature, low=None, high=None):
+        old_low, old_high = constraints.get(feature, (None, None))
+        if low is not None:
+            old_low = low if old_low is None else max(old_low, low)
+        if high is not None:
+            old_high = high if old_high is None else min(old_high, high)
+        constraints[feature] = (old_low, old_high)
+
+    for col in derived.DERIVED_COLUMNS:
+        for low, high in re.findall(rf'\b{col}\s+BETWEEN\s+:(\w+)\s+AND\s+:(\w+)', sql, re.IGNORECASE):
+            tighten(col, value(low), value(high))
+        for op, name in re.findall(rf'\b{col}\s*([<>]=?)\s*:(\w+)', sql, re.IGNORECASE):
+            if value(name) is not None:
+                tighten(col, **({'low': value(name)} if op.startswith('>') else {'high': value(name)}))
+
+    pattern = r"json_array_elements\((\w+)::json\)\s+(\w+)\s+WHERE\s+\(\2->>'value'\)::float\s*([<>])=?\s*:(\w+)"
+    for column, _, op, name in re.findall(pattern, sql, re.IGNORECASE):
+        target = _ARRAY_FEATURES.get((column, op))
+        if target and value(name) is not None:
+            feature, side = target
+            tighten(feature, **({'low': value(name)} if side == 0 else {'high': value(name)}))
+    return constraints or None
+
+# --- Hybrid ranking ---
+def fuse_rankings(rankings, k=60, limit=None):
+    """
+    Reciprocal rank fusion: each id scores sum(1 / (k + rank)) over the
+    rankings it appears in (first occurrence counts). Returns ids by score.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(dict.fromkeys(ranking)):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return fused[:limit] if limit else fused
@@ -1,9 +1,17 @@
 import pandas as pd
 from sqlalchemy import create_engine, text
-import json
 import numpy as np
 import os
-import gc
+import resource
+import sys
+import time
+from contextlib import contextmanager
+import derived
+import dataset_meta
+import profile_store
+import create_context
+import climatology
+import trajectories
 
 # --- DATABASE CONFIGURATION ---
 DB_USER = 'postgres'
@@ -25,7 +33,194 @@ def test_db_connection():
         print(f"Database connection failed: {e}")
         return None
 
-def load_csv_to_db(csv_path, chunk_size=50000):
+@contextmanager
+def stage_timer(timings, stage):
+    """Accumulate wall time for an ingest stage into timings (if given)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+def timed_chunks(reader, timings):
+    """Iterate CSV chunks, counting the time spent reading them as the 'parse' stage"""
+    iterator = iter(reader)
+    while True:
+        with stage_timer(timings, 'parse'):
+            chunk = next(iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+# --- CSV reading ---
+# Only the columns the ingest uses are read, with compact dtypes: measurements
+# as float32 (the precision the profile store keeps), QC flags as int8 and
+# time as datetime64. Latitude/longitude stay float64 so stored positions are
+# unchanged. read_csv is much slower with parse_dates or a nullable Int8
+# dtype than with plain columns, so time is converted and QC flags cast after
+# the read (see compact_chunk).
+MEASUREMENT_COLUMNS = ['pres_adjusted', 'temp_adjusted', 'psal_adjusted']
+PROFILE_ARRAYS = {'pres_adjusted': 'pressure_levels', 'temp_adjusted': 'temperature_values',
+                  'psal_adjusted': 'salinity_values'}
+CSV_DTYPES = {'platform_number': 'int32', 'latitude': 'float64', 'longitude': 'float64',
+              **{col: 'float32' for col in MEASUREMENT_COLUMNS}}
+# ARGO QC flags whose values are kept: 0 no QC performed, 1 good, 2 probably
+# good, 5 value changed, 8 estimated. A missing flag counts as 0.
+GOOD_QC_FLAGS = [0, 1, 2, 5, 8]
+
+def proc_status_mb(field):
+    """A memory field of /proc/self/status (e.g. VmRSS) in MB, or None where there is no /proc"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def rss_mb():
+    """Current resident set size in MB (VmRSS), or None where there is no /proc"""
+    return proc_status_mb('VmRSS')
+
+def peak_rss_mb():
+    """Peak resident set size over the process lifetime: VmHWM, falling back to ru_maxrss"""
+    peak = proc_status_mb('VmHWM')
+    if peak is not None:
+        return peak
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+def csv_columns(csv_path):
+    """
+    usecols/dtype arguments for read_csv and {measurement: QC column} for the
+    QC columns the file has (matched case-insensitively)
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns
+    missing = [col for col in ['time', *CSV_DTYPES] if col not in header]
+    if missing:
+        raise ValueError(f"CSV is missing columns: {missing}")
+    qc_columns = {}
+    for col in header:
+        name = col.lower()
+        if name.endswith('_qc') and name[:-3] in MEASUREMENT_COLUMNS:
+            qc_columns[name[:-3]] = col
+    dtype = {**CSV_DTYPES, 'time': 'str', **{col: 'float32' for col in qc_columns.values()}}
+    return {'usecols': list(dtype), 'dtype': dtype, 'qc': qc_columns}
+
+def compact_chunk(chunk, qc_columns):
+    """Parse time to datetime64 and cast QC flags to int8, in place"""
+    chunk['time'] = pd.to_datetime(chunk['time'], format='ISO8601', errors='coerce')
+    for qc_col in qc_columns.values():
+        chunk[qc_col] = chunk[qc_col].fillna(0).astype(np.int8)
+    return chunk
+
+def apply_qc(chunk, qc_columns):
+    """Set measurements whose QC flag is not in GOOD_QC_FLAGS to NaN, in place. Returns {column: values dropped}."""
+    dropped = {}
+    for col, qc_col in qc_columns.items():
+        flags = chunk[qc_col].to_numpy()
+        values = chunk[col].to_numpy(dtype=np.float32, copy=True)
+        bad = ~np.isin(flags, GOOD_QC_FLAGS) & ~np.isnan(values)
+        values[bad] = np.nan
+        chunk[col] = values
+        dropped[col] = int(bad.sum())
+    return dropped
+
+def group_profiles(chunk):
+    """
+    One row per (platform_number, time) in key order, with the first non-null
+    latitude/longitude. Also returns the row order that sorts the chunk by key
+    (stable, so levels keep their file order) and each sorted row's profile
+    position, for building the measurement arrays without a per-group pass.
+    """
+    rows = np.flatnonzero(chunk['time'].notna().to_numpy())
+    chunk = chunk.iloc[rows]
+    platform = chunk['platform_number'].to_numpy()
+    times = chunk['time'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    order = np.lexsort((times, platform))
+    platform, times = platform[order], times[order]
+    new_key = np.empty(len(order), dtype=bool)
+    new_key[:1] = True
+    new_key[1:] = (platform[1:] != platform[:-1]) | (times[1:] != times[:-1])
+    starts = np.flatnonzero(new_key)
+    ends = np.append(starts[1:], len(order))
+    group_ids = np.cumsum(new_key) - 1
+
+    profiles = pd.DataFrame({
+        'float_id': platform[starts].astype(np.int64),
+        'profile_date': chunk['time'].iloc[order[starts]].dt.strftime('%Y-%m-%dT%H:%M:%SZ').to_numpy()
+    })
+    for col in ['latitude', 'longitude']:
+        values = chunk[col].to_numpy()[order]
+        positions = np.where(np.isnan(values), len(values), np.arange(len(values)))
+        first = np.minimum.reduceat(positions, starts) if len(starts) else starts
+        profiles[col] = np.where(first < ends, values[np.minimum(first, max(len(values) - 1, 0))], np.nan)
+    return profiles, rows[order], group_ids
+
+def json_arrays(values, group_ids, n_groups):
+    """
+    JSON array text of the non-NaN values of each group (values sorted by
+    group), formatted as json.dumps formats a list of floats. Values are
+    printed at their shortest float32 repr: the CSV text for values with up
+    to ~7 significant digits (ARGO adjusted values have 3 decimals), rounded
+    to float32 precision beyond that. Also returns the number of values per
+    group.
+    """
+    valid = ~np.isnan(values)
+    counts = np.bincount(group_ids[valid], minlength=n_groups)
+    tokens = values[valid].astype(str).tolist()
+    bounds = np.concatenate([[0], np.cumsum(counts)]).tolist()
+    return ['[' + ', '.join(tokens[start:end]) + ']' for start, end in zip(bounds[:-1], bounds[1:])], counts
+
+# --- Profile ids ---
+# profile_id is derived from the profile key rather than numbered, so a
+# profile keeps its id across re-ingests whatever else is added or removed
+# (Chroma ids, the profile store and cached regridded rows all key on it):
+# the float id followed by PROFILE_ID_TIME_DIGITS digits of the profile time
+# in epoch seconds. Ids sort like (float_id, profile_date).
+PROFILE_ID_TIME_DIGITS = 10
+
+def profile_ids(float_ids, profile_dates):
+    """Deterministic profile ids for (float_id, profile_date) pairs"""
+    floats = np.asarray(float_ids, dtype=np.int64)
+    times = pd.to_datetime(pd.Series(profile_dates), format='ISO8601', utc=True)
+    seconds = ((times - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+    scale = 10 ** PROFILE_ID_TIME_DIGITS
+    if len(floats) and (seconds.min() < 0 or seconds.max() >= scale
+                        or floats.min() < 0 or floats.max() >= np.iinfo(np.int64).max // scale):
+        raise ValueError("float_id or profile_date out of range for profile ids")
+    return floats * scale + seconds
+
+def join_json_arrays(texts):
+    """One JSON array text from several, in order (as written by json_arrays)"""
+    items = [text[1:-1] for text in texts if text != '[]']
+    return '[' + ', '.join(items) + ']'
+
+def merge_split_profiles(profiles):
+    """
+    Combine the rows of profiles that straddled a chunk boundary (same
+    float_id and profile_date) into one, the later chunk's levels appended.
+    """
+    key = ['float_id', 'profile_date']
+    split = profiles.duplicated(key, keep=False).to_numpy()
+    if not split.any():
+        return profiles
+    merged = profiles[split].groupby(key, sort=False).agg({
+        'latitude': 'first',
+        'longitude': 'first',
+        **{col: join_json_arrays for col in PROFILE_ARRAYS.values()}
+    }).reset_index()
+    return pd.concat([profiles[~split], merged], ignore_index=True)
+
+def load_csv_to_db(csv_path, chunk_size=50000, engine=None, timings=None, stats_path='load_stats.txt',
+                   store_dir=None, context_stats_path=None, climatology_dir=None):
+    """
+    Load an ARGO CSV into argo_profiles. Pass a dict as timings to collect
+    per-stage wall time (parse, group, serialize, derive, insert, index, store,
+    context, climatology, trajectories).
+    """
     print(f"Step 1: Loading CSV '{csv_path}'...")
     
     # Check if file exists
@@ -34,7 +229,7 @@ def load_csv_to_db(csv_path, chunk_size=50000):
         return
     
     # Test DB connection
-    engine = test_db_connection()
+    engine = engine or test_db_connection()
     if not engine:
         return
     
@@ -44,13 +239,17 @@ def load_csv_to_db(csv_path, chunk_size=50000):
     total_unique_pairs = 0
     
     try:
-        # Check for QC columns (case-insensitive)
-        first_chunk = pd.read_csv(csv_path, skiprows=[1], nrows=1000)
-        qc_columns = [col for col in first_chunk.columns if col.lower().endswith('_qc')]
-        stats_log.append(f"QC columns detected: {qc_columns}")
-        print(f"QC columns in CSV: {qc_columns}")
+        columns = csv_columns(csv_path)
+        qc_columns = columns['qc']
+        stats_log.append(f"QC columns detected: {list(qc_columns.values())}")
+        print(f"QC columns in CSV: {list(qc_columns.values())}")
         
-        for chunk_idx, chunk in enumerate(pd.read_csv(csv_path, skiprows=[1], chunksize=chunk_size, low_memory=False)):
+        reader = pd.read_csv(csv_path, skiprows=[1], chunksize=chunk_size, usecols=columns['usecols'],
+                             dtype=columns['dtype'])
+        read_start = chunk_start = time.perf_counter()
+        for chunk_idx, chunk in enumerate(timed_chunks(reader, timings)):
+            with stage_timer(timings, 'parse'):
+                chunk = compact_chunk(chunk, qc_columns)
             print(f"\nProcessing chunk {chunk_idx + 1} ({len(chunk)} rows)...")
             total_rows_read += len(chunk)
             
@@ -58,60 +257,69 @@ def load_csv_to_db(csv_path, chunk_size=50000):
             nan_temp = chunk['temp_adjusted'].isna().sum()
             nan_pres = chunk['pres_adjusted'].isna().sum()
             nan_psal = chunk['psal_adjusted'].isna().sum()
-            unique_pairs = len(chunk[['platform_number', 'time']].drop_duplicates())
-            total_unique_pairs += unique_pairs
             chunk_stats = (f"Chunk {chunk_idx + 1}: {len(chunk)} rows, "
                          f"NaNs: temp={nan_temp} ({nan_temp/len(chunk)*100:.1f}%), "
                          f"pres={nan_pres} ({nan_pres/len(chunk)*100:.1f}%), "
-                         f"psal={nan_psal} ({nan_psal/len(chunk)*100:.1f}%), "
-                         f"Unique (platform, time): {unique_pairs}")
+                         f"psal={nan_psal} ({nan_psal/len(chunk)*100:.1f}%)")
             print(chunk_stats)
             stats_log.append(chunk_stats)
             
-            # No row-level dropna; rely on array filtering
-            chunk_clean = chunk
-            print(f"  - Valid rows in chunk: {len(chunk_clean)} (no rows dropped)")
-            stats_log.append(f"Chunk {chunk_idx + 1}: Dropped 0, Valid {len(chunk_clean)}")
+            # Values with a bad QC flag are dropped from the arrays; rows are kept
+            dropped = apply_qc(chunk, qc_columns)
+            qc_stats = ", ".join(f"{col}={n}" for col, n in dropped.items())
+            print(f"  - Values dropped by QC: {qc_stats or 'none (no QC columns)'}")
+            stats_log.append(f"Chunk {chunk_idx + 1}: QC dropped {qc_stats or 'nothing'}")
             
-            if len(chunk_clean) == 0:
+            if len(chunk) == 0:
                 stats_log.append(f"Chunk {chunk_idx + 1}: Skipped (no valid rows)")
                 continue
             
             # Group into profiles
             print("  - Grouping into profiles...")
-            agg_functions = {
-                'latitude': 'first',
-                'longitude': 'first',
-                'pres_adjusted': lambda x: json.dumps([v for v in x if pd.notna(v)]),
-                'temp_adjusted': lambda x: json.dumps([v for v in x if pd.notna(v)]),
-                'psal_adjusted': lambda x: json.dumps([v for v in x if pd.notna(v)])
-            }
-            chunk_profiles = chunk_clean.groupby(['platform_number', 'time']).agg(agg_functions).reset_index()
-            
-            chunk_profiles.rename(columns={
-                'platform_number': 'float_id',
-                'time': 'profile_date',
-                'pres_adjusted': 'pressure_levels',
-                'temp_adjusted': 'temperature_values',
-                'psal_adjusted': 'salinity_values'
-            }, inplace=True)
-            
-            # Check for empty arrays
-            empty_temp = sum(len(json.loads(row['temperature_values'])) == 0 for _, row in chunk_profiles.iterrows())
-            empty_pres = sum(len(json.loads(row['pressure_levels'])) == 0 for _, row in chunk_profiles.iterrows())
-            empty_psal = sum(len(json.loads(row['salinity_values'])) == 0 for _, row in chunk_profiles.iterrows())
-            print(f"  - Profiles in chunk: {len(chunk_profiles)}, Empty temp: {empty_temp}, pres: {empty_pres}, psal: {empty_psal}")
-            stats_log.append(f"Chunk {chunk_idx + 1}: {len(chunk_profiles)} profiles, Empty temp: {empty_temp}, pres: {empty_pres}, psal: {empty_psal}")
+            with stage_timer(timings, 'group'):
+                chunk_profiles, order, group_ids = group_profiles(chunk)
+            unique_pairs = len(chunk_profiles)
+            total_unique_pairs += unique_pairs
             
-            all_profiles.append(chunk_profiles)
+            # Measurement arrays are stored as JSON TEXT
+            empty = {}
+            with stage_timer(timings, 'serialize'):
+                for col, array_col in PROFILE_ARRAYS.items():
+                    chunk_profiles[array_col], counts = json_arrays(chunk[col].to_numpy()[order], group_ids, unique_pairs)
+                    empty[array_col] = int((counts == 0).sum())
             
-            # Clear memory
-            del chunk, chunk_clean, chunk_profiles
-            gc.collect()
+            # RSS is sampled after the chunk; the peak is the process high-water mark so far
+            chunk_rate = len(chunk) / max(time.perf_counter() - chunk_start, 1e-9)
+            chunk_rss = rss_mb()
+            memory = (f"RSS {chunk_rss:.0f} MB" if chunk_rss is not None else "RSS n/a") + \
+                f" (process peak {peak_rss_mb():.0f} MB)"
+            print(f"  - Profiles in chunk: {unique_pairs}, Empty temp: {empty['temperature_values']}, "
+                  f"pres: {empty['pressure_levels']}, psal: {empty['salinity_values']}")
+            print(f"  - {chunk_rate:.0f} rows/s, {memory}")
+            stats_log.append(f"Chunk {chunk_idx + 1}: {unique_pairs} profiles, Empty temp: {empty['temperature_values']}, "
+                             f"pres: {empty['pressure_levels']}, psal: {empty['salinity_values']}, "
+                             f"{chunk_rate:.0f} rows/s, {memory}")
+            
+            all_profiles.append(chunk_profiles)
+            chunk_start = time.perf_counter()
+        
+        read_rate = total_rows_read / max(time.perf_counter() - read_start, 1e-9)
+        print(f"\nStep 2: Read {total_rows_read} rows at {read_rate:.0f} rows/s, process peak RSS {peak_rss_mb():.0f} MB")
+        stats_log.append(f"Read: {total_rows_read} rows, {read_rate:.0f} rows/s, process peak RSS {peak_rss_mb():.0f} MB")
         
         # Combine and insert
         if all_profiles:
-            profiles = pd.concat(all_profiles, ignore_index=True)
+            profiles = merge_split_profiles(pd.concat(all_profiles, ignore_index=True))
+            
+            # Stable integer key used by the API and the vector index
+            profiles = profiles.sort_values(['float_id', 'profile_date'], ignore_index=True)
+            profiles.insert(0, 'profile_id', profile_ids(profiles['float_id'], profiles['profile_date']))
+            
+            # Derived quantities are stored as columns so they can be filtered by index
+            print("  - Computing mixed layer depth, thermocline and surface values...")
+            with stage_timer(timings, 'derive'):
+                profiles = derived.add_derived_columns(profiles)
+            stats_log.append(f"Derived columns: {derived.DERIVED_COLUMNS}")
             final_profiles = len(profiles)
             print(f"\nStep 3: Combined {final_profiles} unique profiles from {total_rows_read} rows.")
             stats_log.append(f"Final: {final_profiles} profiles from {total_rows_read} rows (Total unique pairs: {total_unique_pairs})")
@@ -129,7 +337,8 @@ def load_csv_to_db(csv_path, chunk_size=50000):
             
             # Insert to DB
             print("Step 4: Inserting profiles to database...")
-            profiles.to_sql('argo_profiles', engine, if_exists='replace', index=False, chunksize=10000)
+            with stage_timer(timings, 'insert'):
+                profiles.to_sql('argo_profiles', engine, if_exists='replace', index=False, chunksize=10000)
             
             # Verify DB count
             db_count = pd.read_sql("SELECT COUNT(*) as count FROM argo_profiles", engine)['count'].iloc[0]
@@ -138,12 +347,46 @@ def load_csv_to_db(csv_path, chunk_size=50000):
             
             # Add indexes
             print("Step 5: Adding indexes for performance...")
-            with engine.connect() as conn:
+            with stage_timer(timings, 'index'), engine.connect() as conn:
+                conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS idx_profile_id ON argo_profiles(profile_id);"))
                 conn.execute(text("CREATE INDEX IF NOT EXISTS idx_float_id ON argo_profiles(float_id);"))
                 conn.execute(text("CREATE INDEX IF NOT EXISTS idx_profile_date ON argo_profiles(profile_date);"))
                 conn.execute(text("CREATE INDEX IF NOT EXISTS idx_location ON argo_profiles(latitude, longitude);"))
+                derived.create_derived_indexes(conn)
                 conn.commit()
             
+            # New version stamp so in-memory indexes and caches rebuild
+            version = dataset_meta.write_version(engine, len(profiles))
+            print(f"Dataset version: {version}")
+            stats_log.append(f"Dataset version: {version}")
+            
+            # Memory-mapped copy of the measurement arrays for analytics reads
+            print("Step 6: Writing memory-mapped profile store...")
+            with stage_timer(timings, 'store'):
+                store_dir = profile_store.write_store(profiles, version, store_dir)
+            stats_log.append(f"Profile store: {store_dir}")
+            
+            # Column statistics for the LLM context, reloaded by the chatbot on the new version
+            print("Step 7: Computing context statistics...")
+            with stage_timer(timings, 'context'):
+                create_context.write_stats(engine, version, profiles, profile_store.ProfileStore(store_dir),
+                                           path=context_stats_path)
+            stats_log.append(f"Context statistics: {context_stats_path or create_context.CONTEXT_STATS_PATH}")
+            
+            # Reference field for anomaly queries: cell x month x level mean and std of T and S
+            print("Step 8: Building climatology cube...")
+            with stage_timer(timings, 'climatology'):
+                climatology_dir = climatology.write_climatology(engine, version, profiles,
+                                                                profile_store.ProfileStore(store_dir),
+                                                                root=climatology_dir)
+            stats_log.append(f"Climatology: {climatology_dir} and table {climatology.CLIMATOLOGY_TABLE}")
+            
+            # Whole-float tracks at several levels of detail for the map
+            print("Step 9: Building float trajectories...")
+            with stage_timer(timings, 'trajectories'):
+                n_floats = trajectories.write_trajectories(engine, profiles)
+            stats_log.append(f"Trajectories: {n_floats} floats in table {trajectories.TRAJECTORY_TABLE}")
+            
             print("\n--- ✅ Success! Loaded profiles into 'argo_profiles' table. ---")
         else:
             print("--- ❌ No valid profiles found! ---")
@@ -155,9 +398,9 @@ def load_csv_to_db(csv_path, chunk_size=50000):
     
     finally:
         # Save stats even if error occurs
-        with open('load_stats.txt', 'w') as f:
+        with open(stats_path, 'w') as f:
             f.write("\n".join(stats_log))
-        print("Stats saved to 'load_stats.txt'.")
+        print(f"Stats saved to '{stats_path}'.")
 
 # --- To run this script ---
 if __name__ == '__main__':
@@ -0,0 +1,119 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_app_context
+
+# --- Metric definitions ---
+# Latency buckets in seconds, from a cached parse up to a slow LLM call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+HELP = {
+    'floatchat_stage_duration_seconds': ('histogram', 'Time spent in each query pipeline stage'),
+    'floatchat_request_duration_seconds': ('histogram', 'Time to produce an HTTP response, by endpoint'),
+    'floatchat_rows_per_query': ('histogram', 'Profiles returned per executed query'),
+    'floatchat_requests_total': ('counter', 'HTTP requests by endpoint and status'),
+    'floatchat_parse_cache_hits_total': ('counter', 'LLM parses served from the parse cache'),
+    'floatchat_parse_cache_misses_total': ('counter', 'LLM parses that required an LLM call'),
+    'floatchat_fallback_sql_total': ('counter', 'Queries answered with the rule-based fallback SQL'),
+    'floatchat_llm_errors_total': ('counter', 'LLM calls that failed or returned unparseable output'),
+    'floatchat_rows_returned_total': ('counter', 'Profiles returned across all queries'),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def inc(name, amount=1, **labels):
+    """Increment a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """Record one observation in a histogram"""
+    key = _key(name, labels)
+    index = bisect.bisect_left(buckets, value)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': buckets, 'counts': [0] * (len(buckets) + 1), 'sum': 0.0}
+        histogram['counts'][index] += 1
+        histogram['sum'] += value
+
+def request_timings():
+    """Stage timings recorded so far for the current request ({} outside a request)"""
+    if not has_app_context():
+        return {}
+    return g.setdefault('stage_timings', {})
+
+@contextmanager
+def stage_timer(stage):
+    """
+    Time a pipeline stage into floatchat_stage_duration_seconds and, inside a
+    request, into that request's stage timings (repeated stages accumulate).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe('floatchat_stage_duration_seconds', elapsed, stage=stage)
+        if has_app_context():
+            timings = request_timings()
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: {'buckets': h['buckets'], 'counts': list(h['counts']), 'sum': h['sum']}
+                      for key, h in _histograms.items()}
+
+    lines = []
+    names = sorted({name for name, _ in counters} | {name for name, _ in histograms})
+    for name in names:
+        metric_type, help_text = HELP.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(histogram['buckets']) + [float('inf')], histogram['counts']):
+                cumulative += count
+                le = _format_labels(labels, [('le', _format_value(float(bound)))])
+                lines.append(f'{name}_bucket{le} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(histogram["sum"])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+def histogram_totals(name):
+    """{label dict as tuple: (count, sum)} for one histogram, e.g. per-stage totals"""
+    with _lock:
+        return {labels: (sum(h['counts']), h['sum']) for (metric, labels), h in _histograms.items() if metric == name}
+
+def reset():
+    """Clear all metrics (used when benchmarking)"""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
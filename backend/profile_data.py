@@ -0,0 +1,81 @@
+import json
+import numpy as np
+from sqlalchemy import text, bindparam
+# The binary payload format lives in profile_payload.py
+from profile_payload import VARIABLES, pack_profiles
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+COLUMNS = {
+    'pressure': 'pressure_levels',
+    'temperature': 'temperature_values',
+    'salinity': 'salinity_values'
+}
+
+def decode_array(value):
+    """Decode a JSON TEXT measurement column into a float32 array"""
+    if value is None:
+        return np.empty(0, dtype=np.float32)
+    items = json.loads(value) if isinstance(value, str) else value
+    return np.array([v.get('value') if isinstance(v, dict) else v for v in items], dtype=np.float32)
+
+def fetch_profile_arrays(engine, profile_ids):
+    """Load measurement arrays for the given profile ids as {profile_id: {variable: array}}"""
+    sql = text(f"""
+        SELECT profile_id, {', '.join(COLUMNS.values())}
+        FROM argo_profiles
+        WHERE profile_id IN :ids
+    """).bindparams(bindparam('ids', expanding=True))
+
+    with engine.connect() as conn:
+        rows = conn.execute(sql, {'ids': list(profile_ids)}).mappings().all()
+    return {
+        int(row['profile_id']): {var: decode_array(row[col]) for var, col in COLUMNS.items()}
+        for row in rows
+    }
+
+def slice_profile(arrays, min_pressure=None, max_pressure=None, max_levels=None):
+    """
+    Align, depth-slice and decimate one profile.
+
+    Arrays are stored with NaNs dropped per variable, so a variable whose
+    length differs from pressure can no longer be paired with its levels;
+    it is returned as NaNs rather than silently misaligned.
+    """
+    pressure = arrays['pressure']
+    n = len(pressure)
+    aligned = {
+        var: arrays[var] if len(arrays[var]) == n else np.full(n, np.nan, dtype=np.float32)
+        for var in VARIABLES
+    }
+
+    keep = np.ones(n, dtype=bool)
+    if min_pressure is not None:
+        keep &= pressure >= min_pressure
+    if max_pressure is not None:
+        keep &= pressure <= max_pressure
+    index = np.flatnonzero(keep)
+
+    # Evenly spaced levels, always keeping the shallowest and deepest
+    if max_levels and len(index) > max_levels:
+        index = index[np.unique(np.linspace(0, len(index) - 1, max_levels).round().astype(np.int64))]
+
+    return {var: aligned[var][index] for var in VARIABLES}
+
+def pack_profiles_arrow(profiles):
+    """Encode profiles as an Arrow IPC stream with one list<float32> column per variable"""
+    if pa is None:
+        raise RuntimeError("Arrow output requires pyarrow to be installed")
+
+    columns = {'profile_id': pa.array([pid for pid, _ in profiles], type=pa.int64())}
+    for var in VARIABLES:
+        columns[var] = pa.array([arrays[var] for _, arrays in profiles], type=pa.list_(pa.float32()))
+    table = pa.table(columns)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
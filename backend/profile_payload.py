@@ -0,0 +1,57 @@
+import struct
+import numpy as np
+
+# --- Binary payload layout ---
+# Used by /profiles/data. The frontend keeps its own copy of the decoder in
+# frontend/profile_payload.py; tests/test_profile_payload.py checks they agree.
+# All values are little-endian:
+#   magic b'ARGO', uint32 version, uint32 n_profiles, uint32 n_variables
+#   int64   profile_ids[n_profiles]
+#   int64   offsets[n_profiles + 1]        (shared by every variable)
+#   float32 values[offsets[-1]]            (one block per variable, in VARIABLES order)
+MAGIC = b'ARGO'
+FORMAT_VERSION = 1
+VARIABLES = ('pressure', 'temperature', 'salinity')
+
+def pack_profiles(profiles):
+    """Pack [(profile_id, {variable: array}), ...] into the float32 + offsets layout"""
+    lengths = [len(arrays['pressure']) for _, arrays in profiles]
+    offsets = np.zeros(len(profiles) + 1, dtype='<i8')
+    np.cumsum(lengths, out=offsets[1:])
+
+    parts = [
+        MAGIC,
+        struct.pack('<III', FORMAT_VERSION, len(profiles), len(VARIABLES)),
+        np.array([pid for pid, _ in profiles], dtype='<i8').tobytes(),
+        offsets.tobytes()
+    ]
+    for var in VARIABLES:
+        values = [arrays[var] for _, arrays in profiles]
+        block = np.concatenate(values) if values else np.empty(0)
+        parts.append(block.astype('<f4').tobytes())
+    return b''.join(parts)
+
+def unpack_profiles(payload):
+    """Inverse of pack_profiles; returns {profile_id: {variable: array}} of zero-copy views"""
+    if payload[:4] != MAGIC:
+        raise ValueError("Not an ARGO profile payload")
+    version, n_profiles, n_variables = struct.unpack_from('<III', payload, 4)
+    if version != FORMAT_VERSION or n_variables != len(VARIABLES):
+        raise ValueError(f"Unsupported payload version {version}")
+
+    pos = 16
+    ids = np.frombuffer(payload, dtype='<i8', count=n_profiles, offset=pos)
+    pos += 8 * n_profiles
+    offsets = np.frombuffer(payload, dtype='<i8', count=n_profiles + 1, offset=pos)
+    pos += 8 * (n_profiles + 1)
+    total = int(offsets[-1])
+
+    blocks = {}
+    for var in VARIABLES:
+        blocks[var] = np.frombuffer(payload, dtype='<f4', count=total, offset=pos)
+        pos += 4 * total
+
+    return {
+        int(pid): {var: blocks[var][offsets[i]:offsets[i + 1]] for var in VARIABLES}
+        for i, pid in enumerate(ids)
+    }
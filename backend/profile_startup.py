@@ -0,0 +1,73 @@
+"""
+Measure chatbot startup cost.
+
+Reports the import-time profile of `chatbot` (python -X importtime) and the
+time warmup() takes to build and exercise each component. Run it from the
+backend directory on two checkouts to compare startup before and after a
+change:
+
+    python profile_startup.py --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+def import_profile(module='chatbot'):
+    """Run `python -X importtime -c 'import <module>'` and return (wall seconds, [(cumulative_us, name)])"""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "import failed")
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        entries.append((int(cumulative), name.rstrip()))
+    return wall, entries
+
+def warmup_profile():
+    """Time each warmup step in-process"""
+    import chatbot
+    steps = [
+        ('embedding model (load + dummy encode)', lambda: chatbot.get_model().encode("warmup")),
+        ('chroma collection', lambda: chatbot.get_collection().count()),
+        ('database ping', lambda: chatbot.get_engine().connect().close()),
+        ('groq client', chatbot.get_groq_client),
+    ]
+    timings = []
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+            timings.append((name, time.perf_counter() - start, None))
+        except Exception as e:
+            timings.append((name, time.perf_counter() - start, str(e)))
+    return timings
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--top', type=int, default=10, help='number of slowest imports to list')
+    parser.add_argument('--skip-warmup', action='store_true', help='only profile the import')
+    args = parser.parse_args()
+
+    wall, entries = import_profile()
+    total = max((c for c, name in entries if name.strip() == 'chatbot'), default=0)
+    print(f"import chatbot: {total / 1e6:.3f}s cumulative ({wall:.3f}s wall including interpreter start)")
+    print(f"Top {args.top} imports by cumulative time:")
+    for cumulative, name in sorted(entries, reverse=True)[:args.top]:
+        print(f"  {cumulative / 1e6:8.3f}s  {name.strip()}")
+
+    if not args.skip_warmup:
+        print("\nWarmup steps:")
+        for name, seconds, error in warmup_profile():
+            status = f"failed: {error}" if error else "ok"
+            print(f"  {seconds:8.3f}s  {name} ({status})")
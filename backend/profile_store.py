@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+import dataset_meta
+import profile_data
+from spatial_index import to_epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+# Database configuration
+DB_USER = 'postgres'
+DB_PASSWORD = 'anushka'
+DB_HOST = 'localhost'
+DB_PORT = '5432'
+DB_NAME = 'floatchat_db'
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# --- Store layout ---
+# PROFILE_STORE_DIR/CURRENT names the active version directory, which holds:
+#   manifest.json           dataset version, profile count, dtype/shape of every file
+#   metadata.bin            one record per profile, sorted by profile_id
+#   offsets.bin             int64 (n_variables, n_profiles + 1); variables are
+#                           stored with NaNs dropped, so each has its own offsets
+#   pressure.f32, temperature.f32, salinity.f32
+#                           all values of one variable, profile after profile
+# Every file is raw little-endian data opened with numpy.memmap.
+PROFILE_STORE_DIR = os.getenv("PROFILE_STORE_DIR", "./profile_store")
+STORE_FORMAT_VERSION = 1
+WRITE_BATCH_SIZE = 5000
+VERSION_CHECK_INTERVAL = 30.0
+METADATA_FIELDS = [('profile_id', '<i8'), ('float_id', '<i8'), ('time', '<i8'),
+                   ('latitude', '<f8'), ('longitude', '<f8')]
+OPTIONAL_FIELDS = ['mld_temp', 'thermocline_depth', 'max_temp_gradient', 'surface_temperature', 'surface_salinity']
+
+_store = None
+_store_lock = threading.Lock()
+_last_check = 0.0
+
+def write_store(profiles, version, root=None, batch_size=WRITE_BATCH_SIZE):
+    """
+    Write argo_profiles rows (JSON TEXT measurement columns) as a new store
+    version and make it current. Arrays are decoded and appended in batches,
+    so memory stays bounded by batch_size profiles. Returns the directory.
+    """
+    root = root or PROFILE_STORE_DIR
+    profiles = profiles.sort_values('profile_id', ignore_index=True)
+    n = len(profiles)
+    final_dir = os.path.join(root, version)
+    tmp_dir = final_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    counts = np.zeros((len(profile_data.VARIABLES), n), dtype=np.int64)
+    files = {var: open(os.path.join(tmp_dir, f"{var}.f32"), 'wb') for var in profile_data.VARIABLES}
+    try:
+        for start in range(0, n, batch_size):
+            stop = min(start + batch_size, n)
+            for j, var in enumerate(profile_data.VARIABLES):
+                arrays = [profile_data.decode_array(v) for v in profiles[profile_data.COLUMNS[var]].iloc[start:stop]]
+                counts[j, start:stop] = [len(a) for a in arrays]
+                if counts[j, start:stop].sum():
+                    np.concatenate(arrays).astype('<f4').tofile(files[var])
+    finally:
+        for f in files.values():
+            f.close()
+
+    offsets = np.zeros((len(profile_data.VARIABLES), n + 1), dtype='<i8')
+    np.cumsum(counts, axis=1, out=offsets[:, 1:])
+    offsets.tofile(os.path.join(tmp_dir, 'offsets.bin'))
+
+    fields = METADATA_FIELDS + [(col, '<f4') for col in OPTIONAL_FIELDS if col in profiles.columns]
+    metadata = np.zeros(n, dtype=fields)
+    times, _ = to_epoch_seconds(profiles['profile_date'])
+    metadata['time'] = times
+    for name, dtype in fields:
+        if name == 'time':
+            continue
+        if dtype == '<i8':
+            metadata[name] = profiles[name].to_numpy(dtype=np.int64)
+        else:
+            metadata[name] = profiles[name].to_numpy(dtype=np.float64, na_value=np.nan)
+    metadata.tofile(os.path.join(tmp_dir, 'metadata.bin'))
+
+    manifest = {
+        'format_version': STORE_FORMAT_VERSION,
+        'dataset_version': version,
+        'n_profiles': n,
+        'variables': list(profile_data.VARIABLES),
+        'metadata_dtype': fields,
+        'values': {var: int(offsets[j, -1]) for j, var in enumerate(profile_data.VARIABLES)},
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    }
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Publish: rename the directory, then atomically repoint CURRENT
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+    pointer = os.path.join(root, 'CURRENT.tmp')
+    with open(pointer, 'w') as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(root, 'CURRENT'))
+
+    # Older versions can go; readers that still map them keep their pages
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name != version and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+    return final_dir
+
+class ProfileStore:
+    """
+    Read-only view of a store version. Per-profile arrays are zero-copy
+    slices of the memory-mapped value files; values[var] and offsets support
+    vectorized scans over every profile without touching the database.
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        if self.manifest['format_version'] != STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported profile store format {self.manifest['format_version']}")
+        self.path = path
+        self.version = self.manifest['dataset_version']
+        self.variables = tuple(self.manifest['variables'])
+        n = self.manifest['n_profiles']
+
+        self.metadata = self._map('metadata.bin', np.dtype([tuple(f) for f in self.manifest['metadata_dtype']]), (n,))
+        self.offsets = self._map('offsets.bin', np.dtype('<i8'), (len(self.variables), n + 1))
+        self.values = {var: self._map(f"{var}.f32", np.dtype('<f4'), (self.manifest['values'][var],))
+                       for var in self.variables}
+        self.profile_ids = self.metadata['profile_id']
+        self._counts = {}
+
+    def _map(self, name, dtype, shape):
+        # numpy.memmap cannot map an empty file
+        if int(np.prod(shape)) == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode='r', shape=shape)
+
+    def __len__(self):
+        return len(self.profile_ids)
+
+    def positions(self, profile_ids):
+        """Row positions for profile ids, -1 where the id is not in the store"""
+        ids = np.asarray(profile_ids, dtype=np.int64)
+        if len(self) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.profile_ids, ids), len(self) - 1)
+        return np.where(self.profile_ids[pos] == ids, pos, -1)
+
+    def profile(self, position):
+        """{variable: float32 view} for the profile at a row position"""
+        return {var: self.values[var][self.offsets[j, position]:self.offsets[j, position + 1]]
+                for j, var in enumerate(self.variables)}
+
+    def arrays(self, profile_ids):
+        """{profile_id: {variable: view}} for the ids present, like profile_data.fetch_profile_arrays"""
+        return {int(pid): self.profile(pos) for pid, pos in zip(profile_ids, self.positions(profile_ids)) if pos >= 0}
+
+    def counts(self, variable):
+        """Number of stored values per profile for one variable"""
+        if variable not in self._counts:
+            self._counts[variable] = np.diff(self.offsets[self.variables.index(variable)])
+        return self._counts[variable]
+
+    def reduce(self, variable, ufunc=np.maximum, empty=np.nan):
+        """
+        Per-profile reduction of one variable over the whole store in a single
+        ufunc.reduceat pass (e.g. np.maximum for the deepest pressure); empty
+        profiles get the empty value.
+        """
+        j = self.variables.index(variable)
+        starts, counts = self.offsets[j, :-1], self.counts(variable)
+        result = np.full(len(self), empty, dtype=np.float64)
+        has = counts > 0
+        if has.any():
+            result[has] = ufunc.reduceat(self.values[variable], starts[has])
+        return result
+
+def open_store(root=None):
+    """The current store under root, or None when none has been written"""
+    root = root or PROFILE_STORE_DIR
+    try:
+        with open(os.path.join(root, 'CURRENT')) as f:
+            version = f.read().strip()
+        return ProfileStore(os.path.join(root, version))
+    except FileNotFoundError:
+        return None
+
+def current(engine, root=None):
+    """
+    The current store if it was written for the database's dataset version,
+    else None. Checked at most every VERSION_CHECK_INTERVAL seconds.
+    """
+    global _store, _last_check
+    if time.monotonic() - _last_check < VERSION_CHECK_INTERVAL:
+        return _store
+    with _store_lock:
+        if time.monotonic() - _last_check < VERSION_CHECK_INTERVAL:
+            return _store
+        _last_check = time.monotonic()
+        try:
+            version = dataset_meta.read_version(engine)
+        except Exception as e:
+            logger.error(f"Could not read dataset version: {e}")
+            return _store
+        if _store is None or _store.version != version:
+            try:
+                store = open_store(root)
+            except Exception as e:
+                logger.error(f"Could not open profile store: {e}")
+                store = None
+            if store is not None and store.version != version:
+                logger.warning(f"Profile store is for dataset {store.version}, database is {version}; not using it")
+                store = None
+            _store = store
+    return _store
+
+def fetch_profile_arrays(engine, profile_ids):
+    """
+    profile_data.fetch_profile_arrays served from the memory-mapped store when
+    it matches the database; ids it does not hold are loaded from the database.
+    """
+    store = current(engine)
+    if store is None:
+        return profile_data.fetch_profile_arrays(engine, profile_ids)
+    arrays = store.arrays(profile_ids)
+    missing = [pid for pid in profile_ids if int(pid) not in arrays]
+    if missing:
+        arrays.update(profile_data.fetch_profile_arrays(engine, missing))
+    return arrays
+
+def build_from_database(engine, root=None):
+    """Write a store for the database as it is now (for databases loaded before the store existed)"""
+    version = dataset_meta.read_version(engine)
+    profiles = pd.read_sql("SELECT * FROM argo_profiles", engine)
+    return write_store(profiles, version, root)
+
+# --- To run this script ---
+if __name__ == '__main__':
+    engine = create_engine(DATABASE_URL)
+    print("Writing memory-mapped profile store...")
+    path = build_from_database(engine)
+    store = open_store()
+    print(f"Profile store for dataset {store.version}: {len(store)} profiles, "
+          f"{sum(len(v) for v in store.values.values())} values in {path}")
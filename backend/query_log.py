@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from flask import request, g, has_app_context, has_request_context
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- Query log configuration ---
+# One JSON object per answered query, appended to QUERY_LOG_PATH. Set
+# QUERY_LOG_PATH to an empty string to turn the log off.
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "query_log.jsonl")
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_lock = threading.Lock()
+_file = None
+
+def note(**fields):
+    """Attach fields (parse source, SQL, params, ...) to the current request's record"""
+    if has_app_context():
+        g.setdefault('query_log', {}).update(fields)
+
+@contextmanager
+def collect():
+    """
+    Send the fields noted inside the block to a fresh dict instead of the
+    request's record, e.g. for one item of a batch. Yields that dict.
+    """
+    if not has_app_context():
+        yield {}
+        return
+    saved = g.pop('query_log', None)
+    notes = g.query_log = {}
+    try:
+        yield notes
+    finally:
+        g.pop('query_log', None)
+        if saved is not None:
+            g.query_log = saved
+
+def request_id():
+    """Id shared by every record of the current request (X-Request-ID if the client sent one)"""
+    if not has_request_context():
+        return uuid.uuid4().hex
+    if 'request_id' not in g:
+        g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    return g.request_id
+
+def _write(line):
+    global _file
+    with _lock:
+        if _file is None:
+            _file = open(QUERY_LOG_PATH, 'a', buffering=1, encoding='utf-8')
+        _file.write(line + '\n')
+
+def record(**fields):
+    """
+    Append one record: request context (id, endpoint, stage timings, elapsed
+    time), the fields noted during the request, then the given fields.
+    """
+    if not QUERY_LOG_PATH:
+        return
+    entry = {'ts': round(time.time(), 3), 'request_id': request_id()}
+    if has_request_context():
+        entry['endpoint'] = request.endpoint
+        entry.update(g.get('query_log', {}))
+        entry['stage_ms'] = {stage: round(seconds * 1000, 3) for stage, seconds in metrics.request_timings().items()}
+        if 'request_start' in g:
+            entry['duration_ms'] = round((time.perf_counter() - g.request_start) * 1000, 3)
+    entry.update(fields)
+    try:
+        _write(json.dumps(entry, default=str))
+    except Exception as e:
+        logger.error(f"Could not write query log: {e}")
+
+def read(path):
+    """Records from a query log, skipping lines that are not valid JSON (e.g. a torn last line)"""
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
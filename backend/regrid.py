@@ -0,0 +1,199 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import dataset_meta
+import profile_store
+
+logger = logging.getLogger(__name__)
+
+# --- Standard levels ---
+# World Ocean Atlas standard depth levels down to the ARGO core limit (dbar ~ m)
+WOA_LEVELS = np.array(
+    list(range(0, 100, 5)) + list(range(100, 500, 25)) + list(range(500, 2001, 50)),
+    dtype=np.float64
+)
+STANDARD_LEVELS = WOA_LEVELS
+
+# --- Regridded matrix cache ---
+# Rows are keyed by profile_id, so the cache is dropped whenever the dataset
+# version changes (checked at most every VERSION_CHECK_INTERVAL seconds, like
+# the profile store and the in-memory indexes).
+CACHE_MAX_ROWS = 200000
+VERSION_CHECK_INTERVAL = 30.0
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_version = None
+_last_check = 0.0
+
+def regrid_profiles(pressures, values, levels=STANDARD_LEVELS, max_gap=None):
+    """
+    Linearly interpolate many ragged profiles onto common pressure levels.
+
+    pressures and values are sequences of 1-D arrays (one pair per profile).
+    NaNs are dropped, levels outside a profile's sampled range are NaN (no
+    extrapolation), and with max_gap set, levels that fall in a gap wider than
+    max_gap dbar are NaN too. Returns an (n_profiles, n_levels) float64 matrix.
+
+    All profiles are interpolated in one pass: each profile's pressures are
+    shifted by profile_index * span so the whole batch forms a single sorted
+    key array that one searchsorted call can bracket.
+    """
+    levels = np.asarray(levels, dtype=np.float64)
+    n_profiles, n_levels = len(pressures), len(levels)
+    if n_profiles == 0 or n_levels == 0:
+        return np.empty((n_profiles, n_levels))
+
+    clean_p, clean_v = [], []
+    for p, v in zip(pressures, values):
+        p = np.asarray(p, dtype=np.float64)
+        v = np.asarray(v, dtype=np.float64)
+        # Unaligned arrays cannot be paired level by level
+        if len(p) != len(v):
+            p = v = np.empty(0)
+        ok = ~(np.isnan(p) | np.isnan(v))
+        clean_p.append(p[ok])
+        clean_v.append(v[ok])
+
+    lengths = np.array([len(p) for p in clean_p], dtype=np.int64)
+    if lengths.sum() == 0:
+        return np.full((n_profiles, n_levels), np.nan)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    profile_index = np.repeat(np.arange(n_profiles), lengths)
+    p_all = np.concatenate(clean_p)
+    v_all = np.concatenate(clean_v)
+
+    # Sort by (profile, pressure) so every segment is ascending in pressure
+    order = np.lexsort((p_all, profile_index))
+    p_all, v_all = p_all[order], v_all[order]
+
+    low = min(p_all.min(), levels.min())
+    span = max(p_all.max(), levels.max()) - low + 1.0
+    keys = profile_index * span + (p_all - low)
+    targets = (np.arange(n_profiles)[:, None] * span + (levels[None, :] - low)).ravel()
+    j = np.searchsorted(keys, targets, side='right')
+
+    # Bracketing points, clamped to each profile's own segment
+    start = np.repeat(starts, n_levels)
+    last = np.minimum(np.maximum(np.repeat(ends, n_levels) - 1, start), len(p_all) - 1)
+    start = np.minimum(start, last)
+    left = np.clip(j - 1, start, last)
+    right = np.clip(j, start, last)
+
+    target_p = np.tile(levels, n_profiles)
+    p_left, p_right = p_all[left], p_all[right]
+    dp = p_right - p_left
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where(dp > 0, (target_p - p_left) / dp, 0.0)
+    result = v_all[left] + weight * (v_all[right] - v_all[left])
+
+    inside = np.repeat(lengths > 0, n_levels) & (target_p >= p_all[start]) & (target_p <= p_all[last])
+    if max_gap is not None:
+        inside &= dp <= max_gap
+    result[~inside] = np.nan
+    return result.reshape(n_profiles, n_levels)
+
+def check_version(engine):
+    """Clear the cache if the dataset version changed since it was filled"""
+    global _cache_version, _last_check
+    if time.monotonic() - _last_check < VERSION_CHECK_INTERVAL:
+        return
+    with _cache_lock:
+        if time.monotonic() - _last_check < VERSION_CHECK_INTERVAL:
+            return
+        _last_check = time.monotonic()
+        try:
+            version = dataset_meta.read_version(engine)
+        except Exception as e:
+            # Without a version nothing cached can be trusted
+            logger.error(f"Could not read dataset version: {e}")
+            version = None
+        if version is None or version != _cache_version:
+            _cache.clear()
+        _cache_version = version
+
+def regridded_matrix(engine, profile_ids, variable='temperature', levels=STANDARD_LEVELS):
+    """
+    Regridded (n_profiles, n_levels) matrix for the given profiles, in order.
+    Rows are cached per (profile, variable, levels) for the current dataset
+    version; only misses are loaded (from the profile store, else the
+    database) and they are regridded together in one call.
+    """
+    levels = np.asarray(levels, dtype=np.float64)
+    check_version(engine)
+    levels_key = levels.tobytes()
+    keys = [(int(pid), variable, levels_key) for pid in profile_ids]
+
+    rows = {}
+    with _cache_lock:
+        for key in keys:
+            if key in _cache:
+                _cache.move_to_end(key)
+                rows[key] = _cache[key]
+
+    missing = [key[0] for key in dict.fromkeys(keys) if key not in rows]
+    if missing:
+        arrays = profile_store.fetch_profile_arrays(engine, missing)
+        empty = np.empty(0, dtype=np.float32)
+        matrix = regrid_profiles(
+            [arrays.get(pid, {}).get('pressure', empty) for pid in missing],
+            [arrays.get(pid, {}).get(variable, empty) for pid in missing],
+            levels
+        )
+        with _cache_lock:
+            for pid, row in zip(missing, matrix):
+                key = (pid, variable, levels_key)
+                rows[key] = row
+                _cache[key] = row
+            while len(_cache) > CACHE_MAX_ROWS:
+                _cache.popitem(last=False)
+
+    if not keys:
+        return np.empty((0, len(levels)))
+    return np.vstack([rows[key] for key in keys])
+
+def clear_cache():
+    """Drop cached rows, e.g. after the dataset has been reloaded"""
+    global _cache_version, _last_check
+    with _cache_lock:
+        _cache.clear()
+        _cache_version = None
+        _last_check = 0.0
+
+def level_statistics(matrix, levels=STANDARD_LEVELS):
+    """
+    NaN-aware per-level count, mean, std, min, max and the vertical gradient
+    of the mean. With no profiles every level has count 0 and NaN statistics.
+    """
+    levels = np.asarray(levels, dtype=np.float64)
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.size == 0:
+        nan = np.full(len(levels), np.nan)
+        return {'levels': levels, 'count': np.zeros(len(levels), dtype=np.int64), 'mean': nan,
+                'std': nan.copy(), 'min': nan.copy(), 'max': nan.copy(), 'mean_gradient': nan.copy()}
+    valid = ~np.isnan(matrix)
+    count = valid.sum(axis=0)
+    filled = np.where(valid, matrix, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(count > 0, filled.sum(axis=0) / count, np.nan)
+        var = np.where(count > 0, (np.where(valid, matrix - mean, 0.0) ** 2).sum(axis=0) / count, np.nan)
+    minimum = np.where(count > 0, np.where(valid, matrix, np.inf).min(axis=0), np.nan)
+    maximum = np.where(count > 0, np.where(valid, matrix, -np.inf).max(axis=0), np.nan)
+
+    gradient = np.full(len(levels), np.nan)
+    ok = ~np.isnan(mean)
+    if ok.sum() >= 2:
+        gradient[ok] = np.gradient(mean[ok], levels[ok])
+
+    return {
+        'levels': levels,
+        'count': count,
+        'mean': mean,
+        'std': np.sqrt(var),
+        'min': minimum,
+        'max': maximum,
+        'mean_gradient': gradient
+    }
@@ -0,0 +1,108 @@
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from flask import request, g, has_app_context, make_response
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- Profiler configuration ---
+# Disabled unless PROFILER_ENABLED=1. When PROFILER_TOKEN is set the trigger
+# header must carry that token; at most one request per PROFILER_MIN_INTERVAL
+# seconds is profiled.
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILER_MIN_INTERVAL = float(os.getenv("PROFILER_MIN_INTERVAL", "60"))
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")
+PROFILE_HEADER = "X-Profile"
+TOP_FUNCTIONS = 25
+
+_rate_lock = threading.Lock()
+_last_profiled = 0.0
+
+def record_sql(sql, params=None):
+    """Remember SQL executed by the current request so a profile can include it"""
+    if has_app_context():
+        g.setdefault('executed_sql', []).append({'sql': sql, 'params': params})
+
+def _requested():
+    header = request.headers.get(PROFILE_HEADER)
+    if PROFILER_TOKEN:
+        return header == PROFILER_TOKEN
+    return header in ('1', 'true') or request.args.get('profile') in ('1', 'true')
+
+def _acquire_slot():
+    global _last_profiled
+    with _rate_lock:
+        now = time.monotonic()
+        if _last_profiled and now - _last_profiled < PROFILER_MIN_INTERVAL:
+            return False
+        _last_profiled = now
+        return True
+
+def _save(profiler, request_id, elapsed):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    base = os.path.join(PROFILE_DIR, f"{stamp}_{request_id}")
+    profiler.dump_stats(base + ".prof")
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    body = request.get_json(silent=True) or {}
+    with open(base + ".json", "w") as f:
+        json.dump({
+            'request_id': request_id,
+            'timestamp': stamp,
+            'endpoint': request.endpoint,
+            'path': request.full_path,
+            'query': body.get('query') if isinstance(body, dict) else None,
+            'duration_seconds': elapsed,
+            'stage_timings': metrics.request_timings(),
+            'sql': g.get('executed_sql', []),
+            'top_functions': summary.getvalue()
+        }, f, indent=2, default=str)
+    return base + ".prof"
+
+def profiled(view):
+    """
+    Opt-in deterministic profiling for a Flask view. Triggered by the X-Profile
+    header (or ?profile=1 when no token is configured); the .prof file and a
+    JSON sidecar with request id, SQL and stage timings go to PROFILE_DIR.
+    Streaming responses are profiled up to the point the response is returned.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not PROFILER_ENABLED or not _requested():
+            return view(*args, **kwargs)
+        if not _acquire_slot():
+            response = make_response(view(*args, **kwargs))
+            response.headers['X-Profile-Skipped'] = 'rate-limited'
+            return response
+
+        request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            result = view(*args, **kwargs)
+        finally:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+
+        response = make_response(result)
+        try:
+            path = _save(profiler, request_id, elapsed)
+            logger.info(f"Saved request profile {path}")
+            response.headers['X-Profile-Id'] = request_id
+        except Exception as e:
+            logger.error(f"Could not save request profile: {e}")
+        return response
+    return wrapper
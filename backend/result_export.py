@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+import dataset_meta
+import derived
+import profile_data
+import profile_store
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# --- Export configuration ---
+EXPORT_MAX_QUERIES = int(os.getenv("EXPORT_MAX_QUERIES", "1000"))   # query ids cached in memory per process
+EXPORT_TTL = float(os.getenv("EXPORT_TTL", "3600"))                 # seconds a query id stays exportable
+EXPORT_TABLE = 'export_queries'
+EXPORT_PRUNE_INTERVAL = 300.0    # seconds between deletes of expired ids from EXPORT_TABLE
+EXPORT_BATCH_SIZE = 500          # profiles per CSV chunk / Parquet row group
+METADATA_COLUMNS = ['profile_id', 'float_id', 'profile_date', 'latitude', 'longitude']
+LEVEL_COLUMNS = ['level'] + list(profile_data.VARIABLES)
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+_queries = OrderedDict()
+_lock = threading.Lock()
+_table_ready = False
+_last_prune = 0.0
+
+# --- Query registry ---
+# Registered queries are written to EXPORT_TABLE, so /export works on any
+# backend process (e.g. another gunicorn worker) than the one that answered
+# the query. Each process also keeps its recent ids in memory; when the
+# database write fails, the id can only be exported from that process.
+def _store(engine, query_id, entry):
+    global _table_ready, _last_prune
+    with engine.begin() as conn:
+        if not _table_ready:
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {EXPORT_TABLE} ("
+                              "query_id VARCHAR(32) PRIMARY KEY, query TEXT, sql TEXT, planned_sql TEXT, "
+                              "params TEXT, version TEXT, created DOUBLE PRECISION)"))
+            _table_ready = True
+        conn.execute(text(f"INSERT INTO {EXPORT_TABLE} (query_id, query, sql, planned_sql, params, version, created) "
+                          "VALUES (:query_id, :query, :sql, :planned_sql, :params, :version, :created)"),
+                     {**entry, 'query_id': query_id, 'params': json.dumps(entry['params'], default=str)})
+        if entry['created'] - _last_prune > EXPORT_PRUNE_INTERVAL:
+            conn.execute(text(f"DELETE FROM {EXPORT_TABLE} WHERE created < :cutoff"),
+                         {'cutoff': entry['created'] - EXPORT_TTL})
+            _last_prune = entry['created']
+
+def _load(engine, query_id):
+    with engine.connect() as conn:
+        row = conn.execute(text(f"SELECT query, sql, planned_sql, params, version, created FROM {EXPORT_TABLE} "
+                                "WHERE query_id = :query_id"), {'query_id': query_id}).mappings().first()
+    if row is None:
+        return None
+    return {**row, 'params': json.loads(row['params'])}
+
+def register(query, plan, engine=None):
+    """
+    Remember a planned query so its full result can be exported later by id,
+    in memory and, when an engine is given, in EXPORT_TABLE. The
+    index-narrowed SQL is only reused while the dataset version it was
+    planned against is current. Returns the query id.
+    """
+    query_id = uuid.uuid4().hex
+    entry = {
+        'query': query,
+        'sql': plan['sql'],
+        'planned_sql': plan.get('planned_sql', plan['sql']),
+        'params': plan['params'],
+        'version': plan.get('index_version'),
+        'created': time.time()
+    }
+    with _lock:
+        _queries[query_id] = entry
+        while len(_queries) > EXPORT_MAX_QUERIES:
+            _queries.popitem(last=False)
+    if engine is not None:
+        try:
+            _store(engine, query_id, entry)
+        except Exception as e:
+            logger.error(f"Could not store export query {query_id}; only this process can export it: {e}")
+    return query_id
+
+def lookup(query_id, engine=None):
+    """
+    The registered query from this process's memory, else EXPORT_TABLE when
+    an engine is given; None when the id is unknown or expired.
+    """
+    with _lock:
+        entry = _queries.get(query_id)
+    if entry is None and engine is not None:
+        try:
+            entry = _load(engine, query_id)
+        except Exception as e:
+            logger.error(f"Could not read export query {query_id}: {e}")
+    if entry is not None and time.time() - entry['created'] > EXPORT_TTL:
+        with _lock:
+            _queries.pop(query_id, None)
+        entry = None
+    return entry
+
+def export_sql(entry, engine):
+    """(sql, params) to re-run for an export; sql is None when nothing can match"""
+    if entry['sql'] != entry['planned_sql']:
+        try:
+            if entry['version'] is not None and dataset_meta.read_version(engine) == entry['version']:
+                return entry['sql'], entry['params']
+        except Exception as e:
+            logger.error(f"Could not read dataset version: {e}")
+    return entry['planned_sql'], entry['params']
+
+# --- Rows to measurement levels ---
+def batches(rows, size=EXPORT_BATCH_SIZE):
+    """Lists of up to size rows from an iterator of result mappings"""
+    batch = []
+    for row in rows:
+        batch.append(dict(row))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def batch_arrays(engine, batch):
+    """
+    {profile_id: arrays} for a batch of rows: from the profile store when it
+    matches the database, else decoded from the rows' JSON columns, else
+    loaded from the database.
+    """
+    ids = [int(row['profile_id']) for row in batch if row.get('profile_id') is not None]
+    store = profile_store.current(engine)
+    arrays = store.arrays(ids) if store is not None else {}
+    missing = []
+    for row in batch:
+        pid = row.get('profile_id')
+        if pid is None or int(pid) in arrays:
+            continue
+        if all(col in row for col in profile_data.COLUMNS.values()):
+            arrays[int(pid)] = {var: profile_data.decode_array(row[col]) for var, col in profile_data.COLUMNS.items()}
+        else:
+            missing.append(int(pid))
+    if missing:
+        arrays.update(profile_data.fetch_profile_arrays(engine, missing))
+    return arrays
+
+def level_frame(engine, batch):
+    """
+    One row per measurement level for a batch of argo_profiles rows: profile
+    metadata and derived columns repeated, then level index, pressure,
+    temperature and salinity. Profiles without levels keep one row of NaNs.
+    """
+    profiles = pd.DataFrame(batch)
+    for col in METADATA_COLUMNS:
+        if col not in profiles.columns:
+            profiles[col] = None
+    profiles['profile_date'] = profiles['profile_date'].map(lambda v: None if v is None else str(v))
+    arrays = batch_arrays(engine, batch)
+    empty = {var: np.full(1, np.nan, dtype=np.float32) for var in profile_data.VARIABLES}
+    aligned = []
+    for pid in profiles['profile_id']:
+        profile = profile_data.slice_profile(arrays[int(pid)]) if pd.notna(pid) and int(pid) in arrays else empty
+        aligned.append(profile if len(profile['pressure']) else empty)
+    lengths = np.array([len(a['pressure']) for a in aligned], dtype=np.int64)
+
+    columns = METADATA_COLUMNS + [col for col in derived.DERIVED_COLUMNS if col in profiles.columns]
+    frame = {col: np.repeat(profiles[col].to_numpy(), lengths) for col in columns}
+    frame['level'] = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    for var in profile_data.VARIABLES:
+        frame[var] = np.concatenate([a[var] for a in aligned])
+    return pd.DataFrame(frame, columns=METADATA_COLUMNS + LEVEL_COLUMNS + columns[len(METADATA_COLUMNS):])
+
+# --- Streaming writers ---
+def stream_csv(engine, rows):
+    """CSV text, one chunk per batch of profiles, header first"""
+    header = True
+    for batch in batches(rows):
+        frame = level_frame(engine, batch)
+        for var in profile_data.VARIABLES:
+            # float32 values printed through float64 would show spurious digits
+            frame[var] = frame[var].astype(np.float64).round(4)
+        yield frame.to_csv(index=False, header=header)
+        header = False
+    if header:
+        yield ','.join(METADATA_COLUMNS + LEVEL_COLUMNS) + '\n'
+
+class _ChunkSink:
+    """
+    Write-only file object that collects what the Parquet writer emits so it
+    can be sent and dropped after each row group. tell() keeps counting from
+    the start of the file, which the writer needs for the footer offsets.
+    """
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def parquet_schema(columns):
+    """Fixed column types, so every row group matches whatever the first batch happened to hold"""
+    types = {'profile_id': pa.int64(), 'float_id': pa.int64(), 'profile_date': pa.string(),
+             'latitude': pa.float64(), 'longitude': pa.float64(), 'level': pa.int32()}
+    return pa.schema([(col, types.get(col, pa.float32() if col in profile_data.VARIABLES else pa.float64()))
+                      for col in columns])
+
+def stream_parquet(engine, rows):
+    """Parquet file bytes, one row group per batch of profiles"""
+    if pq is None:
+        raise RuntimeError("Parquet export requires pyarrow to be installed")
+    sink = _ChunkSink()
+    writer = None
+    for batch in batches(rows):
+        frame = level_frame(engine, batch)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, parquet_schema(frame.columns), compression='zstd')
+        writer.write_table(pa.Table.from_pandas(frame, schema=writer.schema, preserve_index=False))
+        yield sink.drain()
+    if writer is None:
+        writer = pq.ParquetWriter(sink, parquet_schema(METADATA_COLUMNS + LEVEL_COLUMNS), compression='zstd')
+    writer.close()
+    yield sink.drain()
@@ -1,8 +1,7 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
 import pandas as pd
 from sqlalchemy import create_engine
 import json
+import time
 
 # Database configuration
 DB_USER = 'postgres'
@@ -12,19 +11,12 @@ DB_PORT = '5432'
 DB_NAME = 'floatchat_db'
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-# Initialize Chroma and embedding model
-client = chromadb.PersistentClient(path="./chroma_db")
-collection = client.get_or_create_collection("argo_profiles")
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Profiles are encoded and added to Chroma in batches
+EMBED_BATCH_SIZE = 256
+ADD_BATCH_SIZE = 1000
 
-# Load profiles from DB
-engine = create_engine(DATABASE_URL)
-profiles = pd.read_sql("SELECT * FROM argo_profiles", engine)
-
-# Generate embeddings
-print("Generating embeddings for profiles...")
-for idx, row in profiles.iterrows():
-    # Create text representation
+def profile_text(row):
+    """Text representation of one profile used for its embedding"""
     temp = json.loads(row['temperature_values'])
     pres = json.loads(row['pressure_levels'])
     psal = json.loads(row['salinity_values'])
@@ -33,21 +25,59 @@ for idx, row in profiles.iterrows():
             f"temperature {temp[:5] if temp else 'none'}, "
             f"pressure {pres[:5] if pres else 'none'}, "
             f"salinity {psal[:5] if psal else 'none'}")
-    embedding = model.encode(text).tolist()
-    
-    # Add to Chroma
-    collection.add(
-        ids=[str(idx)],
-        embeddings=[embedding],
-        metadatas=[{
-            'float_id': str(row['float_id']),
-            'profile_date': row['profile_date'],
-            'latitude': float(row['latitude']),
-            'longitude': float(row['longitude']),
-            'temp_count': len(temp),
-            'pres_count': len(pres),
-            'psal_count': len(psal)
-        }]
-    )
-
-print(f"Populated Chroma with {collection.count()} profiles!")
\ No newline at end of file
+    metadata = {
+        'profile_id': int(row['profile_id']),
+        'float_id': str(row['float_id']),
+        'profile_date': row['profile_date'],
+        'latitude': float(row['latitude']),
+        'longitude': float(row['longitude']),
+        'temp_count': len(temp),
+        'pres_count': len(pres),
+        'psal_count': len(psal)
+    }
+    return text, metadata
+
+def index_profiles(profiles, collection, model, timings=None):
+    """
+    Embed profiles and add them to the collection. Pass a dict as timings to
+    collect wall time for the 'embed' and 'vector_insert' stages.
+    """
+    timings = timings if timings is not None else {}
+    for start in range(0, len(profiles), ADD_BATCH_SIZE):
+        batch = profiles.iloc[start:start + ADD_BATCH_SIZE]
+        texts, metadatas = zip(*(profile_text(row) for _, row in batch.iterrows()))
+
+        t0 = time.perf_counter()
+        embeddings = model.encode(list(texts), batch_size=EMBED_BATCH_SIZE)
+        t1 = time.perf_counter()
+        collection.add(
+            ids=[str(m['profile_id']) for m in metadatas],
+            embeddings=embeddings.tolist(),
+            metadatas=list(metadatas)
+        )
+        t2 = time.perf_counter()
+
+        timings['embed'] = timings.get('embed', 0.0) + t1 - t0
+        timings['vector_insert'] = timings.get('vector_insert', 0.0) + t2 - t1
+        print(f"Indexed {min(start + ADD_BATCH_SIZE, len(profiles))}/{len(profiles)} profiles")
+    return timings
+
+# --- To run this script ---
+if __name__ == '__main__':
+    import chromadb
+    from sentence_transformers import SentenceTransformer
+
+    # Initialize Chroma and embedding model
+    client = chromadb.PersistentClient(path="./chroma_db")
+    collection = client.get_or_create_collection("argo_profiles")
+    model = SentenceTransformer('all-MiniLM-L6-v2')
+
+    # Load profiles from DB
+    engine = create_engine(DATABASE_URL)
+    profiles = pd.read_sql("SELECT * FROM argo_profiles", engine)
+
+    # Generate embeddings
+    print("Generating embeddings for profiles...")
+    index_profiles(profiles, collection, model)
+
+    print(f"Populated Chroma with {collection.count()} profiles!")
@@ -0,0 +1,190 @@
+import logging
+import re
+import threading
+import time
+import numpy as np
+import pandas as pd
+import dataset_meta
+
+logger = logging.getLogger(__name__)
+
+# --- Index configuration ---
+CELL_DEGREES = 1.0
+VERSION_CHECK_INTERVAL = 30.0    # seconds between dataset version checks
+TIME_SLACK = 86400               # seconds; text and timestamp date comparisons differ within a day
+
+_index = None
+_index_lock = threading.Lock()
+_last_check = 0.0
+
+def to_epoch_seconds(values):
+    """Epoch seconds (int64) for profile_date strings; unparseable values are NaT"""
+    stamps = pd.to_datetime(pd.Series(values), utc=True, errors='coerce', format='mixed')
+    seconds = (stamps - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+    return seconds.fillna(0).astype(np.int64).to_numpy(), stamps.isna().to_numpy()
+
+class ProfileIndex:
+    """
+    Profile metadata (profile id, float id, time, latitude, longitude) as
+    NumPy columns with two sorted keys: time, and (1-degree grid cell, time).
+    A bbox/time query binary-searches one time slice per cell covering the
+    box (or one slice of the time order when that is smaller) and applies the
+    exact bounds to those rows only.
+    """
+    def __init__(self, profile_ids, float_ids, times, latitudes, longitudes, version=None,
+                 cell_degrees=CELL_DEGREES, has_time=True):
+        self.profile_id = np.asarray(profile_ids, dtype=np.int64)
+        self.float_id = np.asarray(float_ids, dtype=np.int64)
+        self.time = np.asarray(times, dtype=np.int64)
+        self.latitude = np.asarray(latitudes, dtype=np.float64)
+        self.longitude = np.asarray(longitudes, dtype=np.float64)
+        self.version = version
+        self.has_time = has_time
+        self.cell_degrees = cell_degrees
+        self.n_lat = int(np.ceil(180 / cell_degrees))
+        self.n_lon = int(np.ceil(360 / cell_degrees))
+
+        self.by_time = np.argsort(self.time, kind='stable')
+        self.sorted_time = self.time[self.by_time]
+
+        # Composite key cell * span + (time - t0): sorted by cell, then time
+        cells = self._row(self.latitude) * self.n_lon + self._col(self.longitude)
+        self.t0 = int(self.time.min()) if len(self.time) else 0
+        self.span = int(self.time.max()) - self.t0 + 1 if len(self.time) else 1
+        key = cells * self.span + (self.time - self.t0)
+        self.by_cell = np.argsort(key, kind='stable')
+        self.cell_key = key[self.by_cell]
+
+    @classmethod
+    def from_engine(cls, engine, version=None):
+        profiles = pd.read_sql(
+            "SELECT profile_id, float_id, profile_date, latitude, longitude FROM argo_profiles", engine)
+        times, missing = to_epoch_seconds(profiles['profile_date'])
+        return cls(profiles['profile_id'], profiles['float_id'], times, profiles['latitude'], profiles['longitude'],
+                   version=version, has_time=not missing.any())
+
+    def __len__(self):
+        return len(self.profile_id)
+
+    # Clipping is monotonic, so out-of-range coordinates land in edge cells and
+    # range queries over cells stay correct
+    def _row(self, lat):
+        return np.clip(np.floor((np.nan_to_num(lat) + 90) / self.cell_degrees), 0, self.n_lat - 1).astype(np.int64)
+
+    def _col(self, lon):
+        return np.clip(np.floor((np.nan_to_num(lon) + 180) / self.cell_degrees), 0, self.n_lon - 1).astype(np.int64)
+
+    def query(self, lat_min=None, lat_max=None, lon_min=None, lon_max=None, start=None, end=None, max_rows=None):
+        """
+        Row positions of profiles inside the bounds (inclusive; None means
+        unbounded; times in epoch seconds). Returns None instead when more
+        than max_rows rows would have to be scanned.
+        """
+        if not self.has_time:
+            start = end = None
+        n = len(self)
+        t_lo = 0 if start is None else int(np.searchsorted(self.sorted_time, start, 'left'))
+        t_hi = n if end is None else int(np.searchsorted(self.sorted_time, end, 'right'))
+        candidates = self.by_time[t_lo:t_hi]
+
+        if any(v is not None for v in (lat_min, lat_max, lon_min, lon_max)):
+            rows = np.arange(self._row(-90.0 if lat_min is None else lat_min),
+                             self._row(90.0 if lat_max is None else lat_max) + 1)
+            cols = np.arange(self._col(-180.0 if lon_min is None else lon_min),
+                             self._col(180.0 if lon_max is None else lon_max) + 1)
+            cells = (rows[:, None] * self.n_lon + cols[None, :]).ravel()
+            low = 0 if start is None else min(max(start - self.t0, 0), self.span)
+            high = self.span - 1 if end is None else min(max(end - self.t0, -1), self.span - 1)
+            starts = np.searchsorted(self.cell_key, cells * self.span + low, 'left')
+            lengths = np.maximum(np.searchsorted(self.cell_key, cells * self.span + high, 'right') - starts, 0)
+            if lengths.sum() < len(candidates):
+                # Concatenate the per-cell ranges without a Python loop
+                offsets = np.cumsum(lengths) - lengths
+                positions = np.arange(lengths.sum()) - np.repeat(offsets - starts, lengths)
+                candidates = self.by_cell[positions]
+
+        if max_rows is not None and len(candidates) > max_rows:
+            return None
+        mask = np.ones(len(candidates), dtype=bool)
+        for column, low, high in ((self.latitude, lat_min, lat_max), (self.longitude, lon_min, lon_max),
+                                  (self.time, start, end)):
+            if low is not None:
+                mask &= column[candidates] >= low
+            if high is not None:
+                mask &= column[candidates] <= high
+        return candidates[mask]
+
+    def candidate_floats(self, max_rows=None, **bounds):
+        """Distinct float ids with a profile inside the bounds (None past max_rows, as in query)"""
+        positions = self.query(max_rows=max_rows, **bounds)
+        return None if positions is None else np.unique(self.float_id[positions])
+
+# --- Bounds from profile SQL ---
+# Only plain AND-ed comparisons on argo_profiles columns are trusted; any OR,
+# NOT or UNION means the bounds might not be necessary conditions. IS NOT NULL
+# only narrows the rows further, so it does not count as a NOT.
+_UNSAFE = re.compile(r'\b(OR|NOT|UNION)\b', re.IGNORECASE)
+_IS_NOT_NULL = re.compile(r'\bIS\s+NOT\s+NULL\b', re.IGNORECASE)
+_COLUMNS = {'latitude': ('lat_min', 'lat_max'), 'longitude': ('lon_min', 'lon_max'), 'profile_date': ('start', 'end')}
+
+def _param_value(column, value):
+    try:
+        if column == 'profile_date':
+            stamp = pd.Timestamp(value)
+            return None if pd.isna(stamp) else int(stamp.value // 10**9)
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def bounds_from_sql(sql, params):
+    """
+    {lat_min, lat_max, lon_min, lon_max, start, end} implied by the SQL's
+    comparisons on latitude, longitude and profile_date (BETWEEN, >=, >, <=,
+    <) with bound parameters, or None when nothing usable is found. Date
+    bounds are widened by TIME_SLACK, so the result is a superset filter.
+    """
+    if not sql or 'argo_profiles' not in sql or _UNSAFE.search(_IS_NOT_NULL.sub('', sql)):
+        return None
+    bounds = {}
+    for column, (low_key, high_key) in _COLUMNS.items():
+        col = rf'\b{column}(?:::\w+)?'
+        lows = re.findall(rf'{col}\s+BETWEEN\s+:(\w+)', sql, re.IGNORECASE) \
+            + re.findall(rf'{col}\s*>=?\s*:(\w+)', sql, re.IGNORECASE)
+        highs = re.findall(rf'{col}\s+BETWEEN\s+:\w+\s+AND\s+:(\w+)', sql, re.IGNORECASE) \
+            + re.findall(rf'{col}\s*<=?\s*:(\w+)', sql, re.IGNORECASE)
+        lows = [v for v in (_param_value(column, params.get(name)) for name in lows) if v is not None]
+        highs = [v for v in (_param_value(column, params.get(name)) for name in highs) if v is not None]
+        if lows:
+            bounds[low_key] = max(lows) - (TIME_SLACK if column == 'profile_date' else 0)
+        if highs:
+            bounds[high_key] = min(highs) + (TIME_SLACK if column == 'profile_date' else 0)
+    return bounds or None
+
+# --- Shared index ---
+def get_index(engine):
+    """
+    The process-wide index, rebuilt when the dataset version written by
+    load_data.py changes. The version is checked at most every
+    VERSION_CHECK_INTERVAL seconds; other requests keep using the current
+    index while a rebuild runs.
+    """
+    global _index, _last_check
+    if _index is not None and time.monotonic() - _last_check < VERSION_CHECK_INTERVAL:
+        return _index
+    with _index_lock:
+        if _index is not None and time.monotonic() - _last_check < VERSION_CHECK_INTERVAL:
+            return _index
+        _last_check = time.monotonic()
+        version = dataset_meta.read_version(engine)
+        if _index is None or _index.version != version:
+            start = time.perf_counter()
+            _index = ProfileIndex.from_engine(engine, version)
+            logger.info(f"Built profile index for dataset {version}: {len(_index)} profiles "
+                        f"in {time.perf_counter() - start:.2f}s")
+    return _index
+
+def clear():
+    global _index, _last_check
+    with _index_lock:
+        _index = None
+        _last_check = 0.0
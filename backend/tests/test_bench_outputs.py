@@ -0,0 +1,41 @@
+import importlib
+import logging
+import os
+import re
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))
+
+import stand_ins
+
+PATH_SETTING = re.compile(r'^([A-Z_]+(?:PATH|DIR)) = os\.getenv\(', re.MULTILINE)
+
+def configured_paths():
+    """(module, attribute) for every module-level *_PATH / *_DIR setting in backend/"""
+    for name in sorted(os.listdir(BACKEND_DIR)):
+        if name.endswith('.py'):
+            with open(os.path.join(BACKEND_DIR, name)) as f:
+                for attribute in PATH_SETTING.findall(f.read()):
+                    yield name[:-3], attribute
+
+def test_isolate_outputs_redirects_every_output_path(tmp_path):
+    root_handlers = logging.root.handlers[:]
+    try:
+        work_dir = stand_ins.isolate_outputs(str(tmp_path))
+        paths = list(configured_paths())
+        assert paths
+        for module, attribute in paths:
+            if f"{module}.{attribute}" in stand_ins.INPUT_PATHS:
+                continue
+            value = getattr(importlib.import_module(module), attribute)
+            assert os.path.dirname(value) == work_dir, f"{module}.{attribute} is {value}"
+        log_files = [h.baseFilename for h in logging.root.handlers if isinstance(h, logging.FileHandler)]
+        assert log_files == [os.path.join(work_dir, 'chatbot.log')]
+    finally:
+        for handler in logging.root.handlers[:]:
+            logging.root.removeHandler(handler)
+            handler.close()
+        for handler in root_handlers:
+            logging.root.addHandler(handler)
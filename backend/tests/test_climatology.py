@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import climatology
+
+# A 90-degree grid keeps the cube small: 2 x 4 cells x 12 months
+CELL_DEGREES = 90.0
+N_CELLS = 2 * 4 * 12
+LEVELS = np.array([10.0, 20.0])
+JAN = int(pd.Timestamp('2025-01-15').value // 10**9)
+JUL = int(pd.Timestamp('2025-07-15').value // 10**9)
+
+def profile(temperature, salinity=35.0):
+    """Arrays sampled exactly on LEVELS, so regridding returns them unchanged"""
+    return {'pressure': LEVELS.astype(np.float32),
+            'temperature': np.full(len(LEVELS), temperature, dtype=np.float32),
+            'salinity': np.full(len(LEVELS), salinity, dtype=np.float32)}
+
+def cube_for(arrays, latitudes, longitudes, times, batch_size=climatology.BUILD_BATCH_SIZE):
+    ids = list(arrays)
+    cells = climatology.cell_index(latitudes, longitudes, times, cell_degrees=CELL_DEGREES)
+    fetched = []
+
+    def fetch(batch):
+        fetched.extend(batch)
+        return {pid: arrays[pid] for pid in batch}
+    mean, std, count = climatology.compute_cube(ids, cells, fetch, levels=LEVELS, n_cells=N_CELLS,
+                                                batch_size=batch_size)
+    return cells, mean, std, count, fetched
+
+def test_cell_index():
+    cells = climatology.cell_index([-45.0, 45.0, 45.0, np.nan], [-135.0, 135.0, 180.0, 0.0], [JAN, JUL, JAN, JAN],
+                                   missing=[False, False, False, False], cell_degrees=CELL_DEGREES)
+    # (row * 4 + column) * 12 + month; longitude 180 wraps to -180
+    assert cells.tolist() == [0, (1 * 4 + 3) * 12 + 6, (1 * 4 + 0) * 12, -1]
+    assert climatology.cell_index([0.0], [0.0], [JAN], missing=[True], cell_degrees=CELL_DEGREES).tolist() == [-1]
+
+@pytest.mark.parametrize('batch_size', [1, 2, 100])
+def test_accumulation_by_cell_month_and_level(batch_size):
+    arrays = {1: profile(10.0), 2: profile(12.0), 3: profile(14.0), 4: profile(20.0), 5: profile(30.0)}
+    # Three profiles share a January cell, one is in July, one has no position
+    _, mean, std, count, fetched = cube_for(arrays, [-45.0, -40.0, -30.0, -45.0, np.nan], [-135.0] * 5,
+                                            [JAN, JAN, JAN, JUL, JAN], batch_size=batch_size)
+    t = climatology.VARIABLES.index('temperature')
+    assert count[t, 0].tolist() == [3, 3]
+    np.testing.assert_allclose(mean[t, 0], [12.0, 12.0])
+    np.testing.assert_allclose(std[t, 0], [2.0, 2.0], rtol=1e-6)
+    # Below MIN_COUNT the count is kept but mean and std are NaN
+    assert count[t, 6].tolist() == [1, 1]
+    assert np.isnan(mean[t, 6]).all() and np.isnan(std[t, 6]).all()
+    assert count.sum() == 2 * 4 * len(LEVELS)
+    # Profiles without a cell are never fetched
+    assert sorted(fetched) == [1, 2, 3, 4]
+
+def test_single_sample_cells(monkeypatch):
+    monkeypatch.setattr(climatology, 'MIN_COUNT', 1)
+    _, mean, std, count, _ = cube_for({1: profile(15.0)}, [-45.0], [-135.0], [JAN])
+    t = climatology.VARIABLES.index('temperature')
+    assert count[t, 0].tolist() == [1, 1]
+    np.testing.assert_allclose(mean[t, 0], [15.0, 15.0])
+    # The sample standard deviation of one value is undefined
+    assert np.isnan(std[t, 0]).all()
+
+def test_identical_samples_have_zero_std():
+    arrays = {pid: profile(17.3) for pid in range(1, 5)}
+    _, mean, std, count, _ = cube_for(arrays, [-45.0] * 4, [-135.0] * 4, [JAN] * 4)
+    t = climatology.VARIABLES.index('temperature')
+    assert (std[t, 0] == 0).all()
+
+def write_cube(root, mean, std, count):
+    os.makedirs(root)
+    mean.astype('<f4').tofile(os.path.join(root, 'mean.f32'))
+    std.astype('<f4').tofile(os.path.join(root, 'std.f32'))
+    count.astype('<i4').tofile(os.path.join(root, 'count.i32'))
+    manifest = {'dataset_version': 'v1', 'cell_degrees': CELL_DEGREES, 'levels': LEVELS.tolist(),
+                'variables': list(climatology.VARIABLES), 'shape': [len(climatology.VARIABLES), 2, 4, 12, len(LEVELS)]}
+    with open(os.path.join(root, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    return climatology.open_climatology(root)
+
+def test_anomalies_outside_populated_cells(tmp_path):
+    arrays = {1: profile(10.0), 2: profile(12.0), 3: profile(14.0), 4: profile(20.0)}
+    _, mean, std, count, _ = cube_for(arrays, [-45.0, -40.0, -30.0, -45.0], [-135.0] * 4, [JAN, JAN, JAN, JUL])
+    cube = write_cube(str(tmp_path / 'climatology'), mean, std, count)
+    values = np.array([[13.0, 14.0]] * 4)
+    # Populated cell; sparse cell; never sampled cell; missing date
+    result = cube.anomalies('temperature', values, [-45.0, -45.0, 45.0, -45.0], [-135.0] * 4, [JAN, JUL, JAN, JAN],
+                            missing=[False, False, False, True])
+    np.testing.assert_allclose(result['anomaly'][0], [1.0, 2.0])
+    np.testing.assert_allclose(result['zscore'][0], [0.5, 1.0], rtol=1e-6)
+    assert result['count'][:, 0].tolist() == [3, 1, 0, 0]
+    for key in ('anomaly', 'zscore', 'mean', 'std'):
+        assert np.isnan(result[key][1:]).all()
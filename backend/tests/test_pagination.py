@@ -0,0 +1,65 @@
+import os
+import sys
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chatbot
+
+@pytest.fixture
+def engine(tmp_path):
+    # Several profiles share (float_id, profile_date)
+    profiles = pd.DataFrame({
+        'profile_id': range(1, 11),
+        'float_id': [1, 1, 1, 1, 2, 2, 2, 3, 3, 3],
+        'profile_date': ['2025-01-01'] * 3 + ['2025-01-02'] + ['2025-01-05'] * 3 + ['2025-02-01'] * 3,
+        'latitude': [float(i) for i in range(10)],
+        'longitude': [60.0 + i for i in range(10)],
+    })
+    engine = create_engine(f"sqlite:///{tmp_path / 'argo.db'}")
+    profiles.to_sql('argo_profiles', engine, index=False)
+    chatbot._components['engine'] = engine
+    chatbot._columns_cache.clear()
+    yield engine
+    chatbot._components.pop('engine', None)
+    chatbot._columns_cache.clear()
+
+def page_through(engine, sql, limit):
+    """Every row of sql fetched page by page, as the /ask handler does"""
+    rows, cursor = [], None
+    for _ in range(20):
+        paged, params = chatbot.paginate_sql(sql, {}, cursor, limit + 1)
+        with engine.connect() as conn:
+            page = [dict(row) for row in conn.execute(text(paged), params).mappings()]
+        rows.extend(page[:limit])
+        if len(page) <= limit:
+            return rows
+        last = page[limit - 1]
+        cursor = chatbot.encode_cursor({'float_id': last['float_id'], 'date': last['profile_date'],
+                                        'profile_id': last.get('profile_id')}, chatbot.page_offset(cursor) + limit)
+    raise AssertionError('pagination did not finish')
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 4])
+def test_keyset_pages_with_duplicate_keys(engine, limit):
+    rows = page_through(engine, "SELECT * FROM argo_profiles", limit)
+    assert [row['profile_id'] for row in rows] == list(range(1, 11))
+
+@pytest.mark.parametrize('limit', [1, 2, 3])
+def test_offset_pages_without_profile_id(engine, limit):
+    rows = page_through(engine, "SELECT float_id, profile_date, latitude, longitude FROM argo_profiles", limit)
+    assert sorted(row['latitude'] for row in rows) == [float(i) for i in range(10)]
+
+def test_cursor_round_trip():
+    keyset = chatbot.encode_cursor({'float_id': 5, 'date': '2025-01-01', 'profile_id': 7})
+    assert chatbot.decode_cursor(keyset) == {'float_id': 5, 'profile_date': '2025-01-01', 'profile_id': 7}
+    assert chatbot.page_offset(keyset) == 0
+    offset = chatbot.encode_cursor({'float_id': 5, 'date': '2025-01-01', 'profile_id': None}, 40)
+    assert chatbot.decode_cursor(offset) == {'offset': 40}
+    assert chatbot.page_offset(offset) == 40
+
+def test_keyset_cursor_needs_profile_id(engine):
+    cursor = chatbot.encode_cursor({'float_id': 1, 'date': '2025-01-01', 'profile_id': 2})
+    with pytest.raises(ValueError):
+        chatbot.paginate_sql("SELECT float_id, profile_date FROM argo_profiles", {}, cursor, 3)
@@ -0,0 +1,48 @@
+import importlib.util
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profile_data
+import profile_payload
+
+def test_round_trip():
+    profiles = [
+        (19219071736595607, {'pressure': np.array([1.0, 10.0], dtype=np.float32),
+                             'temperature': np.array([25.5, 24.0], dtype=np.float32),
+                             'salinity': np.array([35.1, np.nan], dtype=np.float32)}),
+        (19219071737419485, {var: np.empty(0, dtype=np.float32) for var in profile_payload.VARIABLES})
+    ]
+    decoded = profile_payload.unpack_profiles(profile_data.pack_profiles(profiles))
+    assert list(decoded) == [pid for pid, _ in profiles]
+    for pid, arrays in profiles:
+        for var in profile_payload.VARIABLES:
+            np.testing.assert_array_equal(decoded[pid][var], arrays[var])
+
+def test_rejects_other_payloads():
+    with pytest.raises(ValueError):
+        profile_payload.unpack_profiles(b'{"error": "x"}')
+
+def load_frontend_decoder():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                        'frontend', 'profile_payload.py')
+    spec = importlib.util.spec_from_file_location('frontend_profile_payload', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_frontend_decoder_matches():
+    frontend = load_frontend_decoder()
+    assert (frontend.MAGIC, frontend.FORMAT_VERSION, frontend.VARIABLES) == \
+        (profile_payload.MAGIC, profile_payload.FORMAT_VERSION, profile_payload.VARIABLES)
+    arrays = {'pressure': np.array([5.0], dtype=np.float32), 'temperature': np.array([20.0], dtype=np.float32),
+              'salinity': np.array([34.5], dtype=np.float32)}
+    decoded = frontend.unpack_profiles(profile_payload.pack_profiles([(7, arrays)]))
+    assert list(decoded) == [7]
+    for var in profile_payload.VARIABLES:
+        np.testing.assert_array_equal(decoded[7][var], arrays[var])
+    with pytest.raises(ValueError):
+        frontend.unpack_profiles(b'{"error": "x"}')
@@ -0,0 +1,28 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import regrid
+
+def test_level_statistics_without_profiles():
+    levels = np.array([5.0, 10.0, 20.0])
+    stats = regrid.level_statistics(np.empty((0, len(levels))), levels)
+    assert stats['count'].tolist() == [0, 0, 0]
+    for key in ('mean', 'std', 'min', 'max', 'mean_gradient'):
+        assert len(stats[key]) == len(levels)
+        assert np.isnan(stats[key]).all()
+
+def test_level_statistics_without_levels():
+    matrix = regrid.regrid_profiles([[0.0, 10.0]], [[20.0, 10.0]], levels=[])
+    assert matrix.shape == (1, 0)
+    stats = regrid.level_statistics(matrix, [])
+    assert all(len(values) == 0 for values in stats.values())
+
+def test_level_statistics():
+    matrix = regrid.regrid_profiles([[0.0, 10.0], [0.0, 20.0]], [[20.0, 10.0], [10.0, 10.0]], levels=[0.0, 10.0, 20.0])
+    stats = regrid.level_statistics(matrix, [0.0, 10.0, 20.0])
+    assert stats['count'].tolist() == [2, 2, 1]
+    assert stats['mean'][:2].tolist() == [15.0, 10.0]
+    assert stats['min'][2] == stats['max'][2] == 10.0
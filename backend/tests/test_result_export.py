@@ -0,0 +1,41 @@
+import os
+import sys
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import result_export
+
+PLAN = {'sql': "SELECT * FROM argo_profiles WHERE latitude > :lat", 'params': {'lat': 5, 'start': '2025-01-01'}}
+
+@pytest.fixture
+def engine(tmp_path):
+    result_export._queries.clear()
+    result_export._table_ready = False
+    yield create_engine(f"sqlite:///{tmp_path / 'argo.db'}")
+    result_export._queries.clear()
+
+def test_lookup_from_another_process(engine):
+    query_id = result_export.register('warm water', PLAN, engine)
+    # Another worker has nothing in memory and reads the table
+    result_export._queries.clear()
+    entry = result_export.lookup(query_id, engine)
+    assert entry['query'] == 'warm water'
+    assert entry['sql'] == entry['planned_sql'] == PLAN['sql']
+    assert entry['params'] == PLAN['params']
+    assert result_export.lookup('0' * 32, engine) is None
+
+def test_expired_ids(engine, monkeypatch):
+    query_id = result_export.register('warm water', PLAN, engine)
+    monkeypatch.setattr(result_export, 'EXPORT_TTL', -1.0)
+    assert result_export.lookup(query_id, engine) is None
+    result_export._queries.clear()
+    assert result_export.lookup(query_id, engine) is None
+
+def test_memory_only_without_the_table(engine):
+    query_id = result_export.register('warm water', PLAN)
+    assert result_export.lookup(query_id, engine)['params'] == PLAN['params']
+    result_export._queries.clear()
+    # The table was never created: the id is unknown, not an error
+    assert result_export.lookup(query_id, engine) is None
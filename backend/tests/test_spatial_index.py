@@ -0,0 +1,88 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chatbot
+import dataset_meta
+import spatial_index
+
+DAY = spatial_index.TIME_SLACK
+JAN_1 = int(pd.Timestamp('2025-01-01').value // 10**9)
+MAR_31 = int(pd.Timestamp('2025-03-31').value // 10**9)
+
+@pytest.mark.parametrize('sql, params, expected', [
+    ("SELECT * FROM argo_profiles WHERE latitude BETWEEN :lat_min AND :lat_max "
+     "AND longitude BETWEEN :lon_min AND :lon_max",
+     {'lat_min': -10, 'lat_max': 10, 'lon_min': 60, 'lon_max': 90},
+     {'lat_min': -10.0, 'lat_max': 10.0, 'lon_min': 60.0, 'lon_max': 90.0}),
+    ("SELECT * FROM argo_profiles WHERE latitude >= :south AND latitude <= :north AND longitude > :west",
+     {'south': 5, 'north': 25, 'west': 50},
+     {'lat_min': 5.0, 'lat_max': 25.0, 'lon_min': 50.0}),
+    # The tightest of several bounds on a column wins
+    ("SELECT * FROM argo_profiles WHERE latitude >= :a AND latitude >= :b",
+     {'a': 0, 'b': 12}, {'lat_min': 12.0}),
+    # Dates are widened by a day either side
+    ("SELECT * FROM argo_profiles WHERE profile_date BETWEEN :start AND :end",
+     {'start': '2025-01-01', 'end': '2025-03-31'}, {'start': JAN_1 - DAY, 'end': MAR_31 + DAY}),
+    ("SELECT * FROM argo_profiles WHERE profile_date::date >= :start", {'start': '2025-01-01'}, {'start': JAN_1 - DAY}),
+    # Across the dateline an AND-ed box is empty, as it is in the SQL
+    ("SELECT * FROM argo_profiles WHERE longitude >= :west AND longitude <= :east",
+     {'west': 170, 'east': -170}, {'lon_min': 170.0, 'lon_max': -170.0}),
+    ("SELECT * FROM argo_profiles WHERE latitude > :lat_min AND surface_salinity IS NOT NULL",
+     {'lat_min': 0}, {'lat_min': 0.0}),
+    # OR, NOT and UNION may make the bounds unnecessary, so nothing is trusted
+    ("SELECT * FROM argo_profiles WHERE longitude >= :west OR longitude <= :east", {'west': 170, 'east': -170}, None),
+    ("SELECT * FROM argo_profiles WHERE NOT latitude BETWEEN :lat_min AND :lat_max", {'lat_min': 0, 'lat_max': 10}, None),
+    ("SELECT * FROM argo_profiles WHERE latitude > :a UNION SELECT * FROM argo_profiles", {'a': 0}, None),
+    # No usable parameter, or no comparison at all
+    ("SELECT * FROM argo_profiles WHERE latitude > :a", {'a': 'north'}, None),
+    ("SELECT * FROM argo_profiles LIMIT 10", {}, None),
+])
+def test_bounds_from_sql(sql, params, expected):
+    assert spatial_index.bounds_from_sql(sql, params) == expected
+
+def test_dateline_box_matches_nothing():
+    index = spatial_index.ProfileIndex([1, 2], [1, 2], [0, 0], [0.0, 0.0], [175.0, -175.0])
+    assert len(index.query(lon_min=170.0, lon_max=-170.0)) == 0
+
+@pytest.fixture
+def engine(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 2000
+    dates = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 200 * 86400, n), unit='s')
+    profiles = pd.DataFrame({
+        'profile_id': np.arange(n),
+        'float_id': rng.integers(1, 200, n),
+        'profile_date': dates.strftime('%Y-%m-%d %H:%M:%S'),
+        'latitude': rng.uniform(-40, 40, n),
+        'longitude': rng.uniform(20, 140, n),
+    })
+    engine = create_engine(f"sqlite:///{tmp_path / 'argo.db'}")
+    profiles.to_sql('argo_profiles', engine, index=False)
+    dataset_meta.write_version(engine, n)
+    chatbot._components['engine'] = engine
+    spatial_index.clear()
+    yield engine
+    chatbot._components.pop('engine', None)
+    spatial_index.clear()
+
+@pytest.mark.parametrize('params', [
+    {'lat_min': -5, 'lat_max': 5, 'lon_min': 60, 'lon_max': 80, 'start': '2025-02-01', 'end': '2025-03-31'},
+    {'lat_min': 10, 'lat_max': 30, 'lon_min': 20, 'lon_max': 140, 'start': '2025-01-01', 'end': '2025-01-15'},
+    {'lat_min': 50, 'lat_max': 60, 'lon_min': 20, 'lon_max': 140, 'start': '2025-01-01', 'end': '2025-12-31'},
+])
+def test_narrowing_returns_the_same_rows(engine, params):
+    sql = ("SELECT float_id, profile_id, profile_date FROM argo_profiles "
+           "WHERE latitude BETWEEN :lat_min AND :lat_max AND longitude BETWEEN :lon_min AND :lon_max "
+           "AND profile_date BETWEEN :start AND :end")
+    plan = chatbot.narrow_with_index({'sql': sql, 'params': params})
+    assert plan['sql'] != sql
+    with engine.connect() as conn:
+        expected = sorted(conn.execute(text(sql), params).fetchall())
+        narrowed = sorted(conn.execute(text(plan['sql']), params).fetchall()) if plan['sql'] else []
+    assert narrowed == expected
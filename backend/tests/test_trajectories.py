@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import trajectories
+
+@pytest.mark.parametrize('x, y, tolerance, expected', [
+    # Straight lines keep only their endpoints
+    ([0, 1, 2, 3, 4], [0, 0, 0, 0, 0], 0.1, [0, 4]),
+    ([0, 1, 2, 3], [0, 0.05, -0.05, 0], 0.1, [0, 3]),
+    # Zero tolerance, or nothing between the endpoints, keeps everything
+    ([0, 1, 2, 3], [0, 0, 0, 0], 0.0, [0, 1, 2, 3]),
+    ([0, 5], [0, 5], 1.0, [0, 1]),
+    ([0], [0], 1.0, [0]),
+    ([0, 1, 2, 3, 4], [0, 0, 3, 0, 0], 1.0, [0, 2, 4]),
+    # Doubling back along the same line: distances are to the segment, so the turns are kept
+    ([0, 3, 1, 2], [0, 0, 0, 0], 0.5, [0, 1, 2, 3]),
+    # A closed loop (first point == last) is measured from that point
+    ([0, 1, 2, 1, 0], [0, 0, 0, 0, 0], 0.5, [0, 2, 4]),
+])
+def test_douglas_peucker(x, y, tolerance, expected):
+    assert trajectories.douglas_peucker(np.array(x, dtype=float), np.array(y, dtype=float),
+                                        tolerance).tolist() == expected
+
+def test_douglas_peucker_keeps_points_beyond_tolerance():
+    rng = np.random.default_rng(0)
+    x, y = np.cumsum(rng.normal(size=500)), np.cumsum(rng.normal(size=500))
+    keep = trajectories.douglas_peucker(x, y, 0.5)
+    assert keep[0] == 0 and keep[-1] == 499
+    # Every dropped point lies within tolerance of the simplified line around it
+    for start, end in zip(keep[:-1], keep[1:]):
+        for i in range(start + 1, end):
+            dx, dy = x[end] - x[start], y[end] - y[start]
+            t = np.clip(((x[i] - x[start]) * dx + (y[i] - y[start]) * dy) / (dx * dx + dy * dy), 0, 1)
+            assert np.hypot(x[i] - x[start] - t * dx, y[i] - y[start] - t * dy) <= 0.5 + 1e-9
+
+def test_trajectory_across_the_dateline():
+    profiles = pd.DataFrame({
+        'profile_id': [1, 2, 3, 4, 5],
+        'float_id': [7] * 5,
+        'profile_date': pd.date_range('2025-01-01', periods=5, freq='10D').astype(str),
+        'latitude': [0.0] * 5,
+        'longitude': [178.0, 179.0, 180.0, -179.0, -178.0],
+    })
+    frame = trajectories.trajectory_frame(profiles).set_index('level')
+    # Unwrapped, the track is a straight line east, so coarse levels keep only its ends
+    coarse = frame.loc[1]
+    assert json.loads(coarse['profile_ids']) == [1, 5]
+    # Points are returned in their original, wrapped longitudes
+    assert json.loads(coarse['longitudes']) == [178.0, -178.0]
+    assert frame.loc[0, 'n_points'] == 5
+
+@pytest.mark.parametrize('zoom, level', [
+    (None, 0),
+    (-5, len(trajectories.TRAJECTORY_TOLERANCES) - 1),
+    (0, len(trajectories.TRAJECTORY_TOLERANCES) - 1),
+    (trajectories.MAX_ZOOM, 0),
+    (10**6, 0),
+])
+def test_level_for_zoom(zoom, level):
+    assert trajectories.level_for_zoom(zoom) == level
+
+def test_level_for_zoom_is_monotonic():
+    levels = [trajectories.level_for_zoom(zoom) for zoom in range(trajectories.MAX_ZOOM + 1)]
+    assert levels == sorted(levels, reverse=True)
+    assert all(trajectories.TRAJECTORY_TOLERANCES[level] <= 360.0 / (trajectories.TILE_SIZE * 2 ** zoom)
+               for zoom, level in enumerate(levels))
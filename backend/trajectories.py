@@ -0,0 +1,167 @@
+import json
+import logging
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text, bindparam
+
+logger = logging.getLogger(__name__)
+
+# Database configuration
+DB_USER = 'postgres'
+DB_PASSWORD = 'anushka'
+DB_HOST = 'localhost'
+DB_PORT = '5432'
+DB_NAME = 'floatchat_db'
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# --- Trajectory table ---
+# argo_trajectories holds one row per (float_id, level): the float's
+# positions in date order, simplified with Douglas-Peucker at
+# TRAJECTORY_TOLERANCES[level] degrees (level 0 keeps every profile). Point
+# arrays are JSON TEXT like the measurement columns; a unique index on
+# (float_id, level) makes every trajectory request one indexed read.
+TRAJECTORY_TABLE = 'argo_trajectories'
+TRAJECTORY_TOLERANCES = [0.0, 0.005, 0.02, 0.1, 0.5]
+TILE_SIZE = 256                  # web map tile width in pixels
+MAX_ZOOM = 22                    # deepest web map zoom; larger zooms are clamped
+COORDINATE_DECIMALS = 4          # ~11 m, well below the finest tolerance
+POINT_COLUMNS = ['profile_ids', 'dates', 'latitudes', 'longitudes']
+
+def douglas_peucker(x, y, tolerance):
+    """
+    Indices of the points Douglas-Peucker keeps for the polyline (x, y): every
+    point further than tolerance from the segment between the kept points
+    around it. First and last points are always kept.
+    """
+    n = len(x)
+    if n <= 2 or tolerance <= 0:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    # Explicit stack: floats with thousands of cycles would exhaust recursion
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length2 = dx * dx + dy * dy
+        # Distance to the segment, not the line, so a float doubling back is not cut off
+        t = np.clip((px * dx + py * dy) / length2, 0.0, 1.0) if length2 > 0 else np.zeros(len(px))
+        distance = np.hypot(px - t * dx, py - t * dy)
+        i = int(np.argmax(distance))
+        if distance[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return np.flatnonzero(keep)
+
+def level_for_zoom(zoom):
+    """Coarsest level whose tolerance is below one map pixel at the zoom; no zoom means full detail"""
+    if zoom is None:
+        return 0
+    pixel = 360.0 / (TILE_SIZE * 2 ** min(max(zoom, 0), MAX_ZOOM))
+    return max(i for i, tolerance in enumerate(TRAJECTORY_TOLERANCES) if tolerance <= pixel)
+
+# --- Building the table ---
+def trajectory_frame(profiles):
+    """
+    argo_trajectories rows for argo_profiles rows (profile_id, float_id,
+    profile_date, latitude, longitude). Longitudes are unwrapped before
+    simplifying, so a float crossing the dateline is not treated as jumping
+    across the map.
+    """
+    positions = profiles[['profile_id', 'float_id', 'profile_date', 'latitude', 'longitude']]
+    positions = positions.dropna(subset=['latitude', 'longitude'])
+    positions = positions.sort_values(['float_id', 'profile_date'], kind='stable', ignore_index=True)
+    float_ids = positions['float_id'].to_numpy()
+    bounds = np.flatnonzero(float_ids[1:] != float_ids[:-1]) + 1 if len(positions) else np.empty(0, dtype=np.int64)
+    starts = np.concatenate([[0], bounds]) if len(positions) else np.empty(0, dtype=np.int64)
+    ends = np.append(starts[1:], len(positions))
+
+    profile_ids = positions['profile_id'].to_numpy(dtype=np.int64)
+    dates = positions['profile_date'].astype(str).to_numpy()
+    lat = positions['latitude'].to_numpy(dtype=np.float64).round(COORDINATE_DECIMALS)
+    lon = positions['longitude'].to_numpy(dtype=np.float64).round(COORDINATE_DECIMALS)
+    rows = []
+    for start, end in zip(starts, ends):
+        track_lat, track_lon = lat[start:end], lon[start:end]
+        unwrapped = np.rad2deg(np.unwrap(np.deg2rad(track_lon)))
+        for level, tolerance in enumerate(TRAJECTORY_TOLERANCES):
+            keep = douglas_peucker(unwrapped, track_lat, tolerance)
+            rows.append({
+                'float_id': float_ids[start],
+                'level': level,
+                'tolerance': tolerance,
+                'n_points': len(keep),
+                'total_points': int(end - start),
+                'first_date': dates[start],
+                'last_date': dates[end - 1],
+                'lat_min': float(track_lat.min()),
+                'lat_max': float(track_lat.max()),
+                'lon_min': float(track_lon.min()),
+                'lon_max': float(track_lon.max()),
+                'profile_ids': json.dumps(profile_ids[start:end][keep].tolist()),
+                'dates': json.dumps(dates[start:end][keep].tolist()),
+                'latitudes': json.dumps(track_lat[keep].tolist()),
+                'longitudes': json.dumps(track_lon[keep].tolist())
+            })
+    return pd.DataFrame(rows, columns=['float_id', 'level', 'tolerance', 'n_points', 'total_points', 'first_date',
+                                       'last_date', 'lat_min', 'lat_max', 'lon_min', 'lon_max'] + POINT_COLUMNS)
+
+def write_trajectories(engine, profiles=None):
+    """
+    Rebuild argo_trajectories from the ingested DataFrame (when given) or the
+    database. Returns the number of floats.
+    """
+    if profiles is None:
+        profiles = pd.read_sql("SELECT profile_id, float_id, profile_date, latitude, longitude FROM argo_profiles",
+                               engine)
+    frame = trajectory_frame(profiles)
+    frame.to_sql(TRAJECTORY_TABLE, engine, if_exists='replace', index=False, chunksize=10000)
+    with engine.connect() as conn:
+        conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_trajectory_float_level "
+                          f"ON {TRAJECTORY_TABLE}(float_id, level);"))
+        conn.commit()
+    n_floats = int(frame['float_id'].nunique())
+    logger.info(f"Wrote {len(frame)} trajectory rows for {n_floats} floats")
+    return n_floats
+
+# --- Reading ---
+def fetch_trajectories(engine, float_ids, level=0):
+    """{float_id: trajectory} at one level of detail for the floats found, in one indexed query"""
+    sql = text(f"""
+        SELECT float_id, level, tolerance, n_points, total_points, first_date, last_date,
+               lat_min, lat_max, lon_min, lon_max, {', '.join(POINT_COLUMNS)}
+        FROM {TRAJECTORY_TABLE}
+        WHERE level = :level AND float_id IN :ids
+    """).bindparams(bindparam('ids', expanding=True))
+    with engine.connect() as conn:
+        rows = conn.execute(sql, {'level': level, 'ids': list(float_ids)}).mappings().all()
+    trajectories = {}
+    for row in rows:
+        trajectory = {key: row[key] for key in row.keys() if key not in POINT_COLUMNS}
+        trajectory['float_id'] = int(row['float_id'])
+        trajectory['profile_id'] = json.loads(row['profile_ids'])
+        trajectory['date'] = json.loads(row['dates'])
+        trajectory['latitude'] = json.loads(row['latitudes'])
+        trajectory['longitude'] = json.loads(row['longitudes'])
+        trajectories[trajectory['float_id']] = trajectory
+    return trajectories
+
+# --- To run this script ---
+if __name__ == '__main__':
+    engine = create_engine(DATABASE_URL)
+    print("Building float trajectories...")
+    start = time.perf_counter()
+    n_floats = write_trajectories(engine)
+    counts = pd.read_sql(f"SELECT level, SUM(n_points) AS points FROM {TRAJECTORY_TABLE} GROUP BY level ORDER BY level",
+                         engine)
+    print(f"Trajectories for {n_floats} floats in {time.perf_counter() - start:.1f}s")
+    for level, points in zip(counts['level'], counts['points']):
+        print(f"  level {level} (tolerance {TRAJECTORY_TOLERANCES[level]} deg): {int(points)} points")
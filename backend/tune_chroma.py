@@ -0,0 +1,305 @@
+"""
+Vector index lifecycle for the argo_profiles Chroma collection.
+
+    python tune_chroma.py tune --m 8,16,32 --ef-construction 100,200 --ef-search 10,50,100
+    python tune_chroma.py rebuild --m 16 --ef-construction 200 --ef-search 50
+    python tune_chroma.py compact
+
+tune copies the stored embeddings into scratch collections, one per
+(M, ef_construction), and reports recall@k against brute-force NumPy kNN and
+query latency for each ef_search. Held-out profiles (left out of the scratch
+build) serve as queries, plus logged /ask queries with --query-log.
+
+rebuild rewrites the persisted collection with the given HNSW parameters and
+records them, with the measured recall, in the collection metadata; restart
+the backend afterwards, since Chroma reads ef_search when it loads the index.
+compact rebuilds with the current parameters, which drops the space left in
+the HNSW files by repeated adds and deletes, then vacuums Chroma's SQLite file.
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+COLLECTION_NAME = "argo_profiles"
+READ_BATCH_SIZE = 5000
+ADD_BATCH_SIZE = 1000
+RECALL_K = 50                    # chatbot.CHROMA_N_RESULTS
+KNN_QUERY_BATCH = 256            # queries per brute-force distance matrix
+
+# --- Reading and writing collections ---
+def read_collection(collection, batch_size=READ_BATCH_SIZE):
+    """(ids, float32 embeddings, metadatas) of every record, read page by page"""
+    ids, embeddings, metadatas = [], [], []
+    for offset in itertools.count(0, batch_size):
+        page = collection.get(limit=batch_size, offset=offset, include=['embeddings', 'metadatas'])
+        if not page['ids']:
+            break
+        ids.extend(page['ids'])
+        embeddings.append(np.asarray(page['embeddings'], dtype=np.float32))
+        metadatas.extend(page['metadatas'])
+    if not embeddings:
+        return [], np.empty((0, 0), dtype=np.float32), []
+    return ids, np.concatenate(embeddings), metadatas
+
+def hnsw_configuration(m, ef_construction, ef_search, space='l2'):
+    return {'hnsw': {'space': space, 'max_neighbors': int(m), 'ef_construction': int(ef_construction),
+                     'ef_search': int(ef_search)}}
+
+def current_hnsw(collection):
+    """The collection's HNSW parameters (Chroma's defaults when it was created without any)"""
+    hnsw = (collection.configuration or {}).get('hnsw') or {}
+    return {'m': hnsw.get('max_neighbors', 16), 'ef_construction': hnsw.get('ef_construction', 100),
+            'ef_search': hnsw.get('ef_search', 100), 'space': hnsw.get('space', 'l2')}
+
+def fill_collection(collection, ids, embeddings, metadatas, batch_size=ADD_BATCH_SIZE):
+    for start in range(0, len(ids), batch_size):
+        stop = start + batch_size
+        collection.add(ids=ids[start:stop], embeddings=embeddings[start:stop],
+                       metadatas=metadatas[start:stop] if metadatas else None)
+
+def rebuild_collection(client, name, m, ef_construction, ef_search, space='l2', record=None):
+    """
+    Rewrite a collection with new HNSW parameters: copy it into a fresh
+    collection, rename the old one aside, give the new one its name and only
+    then drop the old one, so the name always resolves to a complete
+    collection. The parameters (and any extra record fields) are stored in
+    the new collection's metadata.
+    """
+    old = client.get_collection(name)
+    ids, embeddings, metadatas = read_collection(old)
+    params = {'m': int(m), 'ef_construction': int(ef_construction), 'ef_search': int(ef_search), 'space': space}
+    metadata = dict(old.metadata or {})
+    # A rewrite with unchanged parameters (compaction) keeps the earlier tuning record
+    if record or params != current_hnsw(old):
+        metadata = {key: value for key, value in metadata.items()
+                    if not key.startswith(('hnsw:', 'hnsw_', 'tuning_'))}
+        metadata['tuned_at'] = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        metadata.update({f"tuning_{key}": value for key, value in (record or {}).items()})
+    metadata.update({'hnsw_m': params['m'], 'hnsw_ef_construction': params['ef_construction'],
+                     'hnsw_ef_search': params['ef_search']})
+
+    staging, retired = f"{name}_rebuild", f"{name}_retired"
+    for leftover in (staging, retired):
+        try:
+            client.delete_collection(leftover)
+        except Exception:
+            pass
+    new = client.create_collection(staging, configuration=hnsw_configuration(m, ef_construction, ef_search, space),
+                                   metadata=metadata)
+    fill_collection(new, ids, embeddings, metadatas)
+    if new.count() != len(ids):
+        client.delete_collection(staging)
+        raise RuntimeError(f"Rebuild wrote {new.count()} of {len(ids)} records; kept the old collection")
+    old.modify(name=retired)
+    try:
+        new.modify(name=name)
+    except Exception:
+        old.modify(name=name)
+        client.delete_collection(staging)
+        raise
+    client.delete_collection(retired)
+    return client.get_collection(name)
+
+def vacuum(path=CHROMA_PATH):
+    """
+    Reclaim disk space after a rebuild: remove HNSW segment directories that
+    no collection refers to any more (Chroma leaves them behind when a
+    collection is deleted), then VACUUM the SQLite file. Closes this
+    process's clients first.
+    """
+    from chromadb.api.client import SharedSystemClient
+    SharedSystemClient.clear_system_cache()
+    db = os.path.join(path, 'chroma.sqlite3')
+    if not os.path.exists(db):
+        return
+    conn = sqlite3.connect(db)
+    try:
+        live = {row[0] for row in conn.execute("SELECT id FROM segments")}
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    for name in os.listdir(path):
+        if os.path.isdir(os.path.join(path, name)) and len(name) == 36 and name.count('-') == 4 and name not in live:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+# --- Recall and latency ---
+def exact_knn(embeddings, queries, k):
+    """Ground-truth neighbour positions by squared L2 distance (Chroma's default space), nearest first"""
+    k = min(k, len(embeddings))
+    norms = np.einsum('ij,ij->i', embeddings, embeddings)
+    result = np.empty((len(queries), k), dtype=np.int64)
+    for start in range(0, len(queries), KNN_QUERY_BATCH):
+        q = queries[start:start + KNN_QUERY_BATCH]
+        distances = norms[None, :] - 2.0 * (q @ embeddings.T)
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1)
+        result[start:start + len(q)] = np.take_along_axis(nearest, order, axis=1)
+    return result
+
+def measure(collection, queries, truth_ids, k):
+    """Mean recall@k and single-query latency percentiles of a collection against exact neighbours"""
+    latencies, recalls = [], []
+    for query, truth in zip(queries, truth_ids):
+        start = time.perf_counter()
+        found = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])['ids'][0]
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len(set(found) & truth) / len(truth))
+    latencies = np.array(latencies) * 1000
+    return {'recall': float(np.mean(recalls)), 'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)), 'mean_ms': float(latencies.mean())}
+
+def logged_query_embeddings(path, limit):
+    """Embeddings of distinct /ask queries from a query log, with the production model"""
+    from sentence_transformers import SentenceTransformer
+    queries = []
+    with open(path) as f:
+        for line in f:
+            query = json.loads(line).get('query')
+            if query and query not in queries:
+                queries.append(query)
+            if len(queries) == limit:
+                break
+    if not queries:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.asarray(SentenceTransformer('all-MiniLM-L6-v2').encode(queries), dtype=np.float32)
+
+def reopen_collection(path, name):
+    """
+    A fresh handle on a persisted collection. Chroma applies ef_search when it
+    loads an index, so a changed value only takes effect in a new client
+    (in the backend: after a restart).
+    """
+    import chromadb
+    from chromadb.api.client import SharedSystemClient
+    SharedSystemClient.clear_system_cache()
+    return chromadb.PersistentClient(path=path).get_collection(name)
+
+def tune(ids, embeddings, metadatas, ms, ef_constructions, ef_searches, n_queries=200, k=RECALL_K,
+         extra_queries=None, seed=0):
+    """
+    One result per (M, ef_construction, ef_search). Each (M, ef_construction)
+    is built once in a scratch Chroma directory from all but the held-out
+    query profiles, then reopened with each ef_search.
+    """
+    import chromadb
+    rng = np.random.default_rng(seed)
+    held_out = rng.choice(len(ids), min(n_queries, len(ids) // 10 or 1), replace=False)
+    keep = np.setdiff1d(np.arange(len(ids)), held_out)
+    build_ids = [ids[i] for i in keep]
+    build_embeddings = embeddings[keep]
+    build_metadatas = [metadatas[i] for i in keep] if metadatas else None
+    queries = embeddings[held_out]
+    if extra_queries is not None and len(extra_queries):
+        queries = np.concatenate([queries, extra_queries])
+    truth = [set(build_ids[j] for j in row) for row in exact_knn(build_embeddings, queries, k)]
+
+    scratch = tempfile.mkdtemp(prefix='floatchat_tune_')
+    results = []
+    try:
+        for m, ef_construction in itertools.product(ms, ef_constructions):
+            name = f"tune_m{m}_efc{ef_construction}"
+            start = time.perf_counter()
+            collection = chromadb.PersistentClient(path=scratch).create_collection(
+                name, configuration=hnsw_configuration(m, ef_construction, ef_searches[0]))
+            fill_collection(collection, build_ids, build_embeddings, build_metadatas)
+            build_seconds = time.perf_counter() - start
+            for ef_search in ef_searches:
+                collection.modify(configuration={'hnsw': {'ef_search': int(ef_search)}})
+                collection = reopen_collection(scratch, name)
+                # The first query loads the index from disk; keep it out of the latencies
+                collection.query(query_embeddings=[queries[0].tolist()], n_results=k, include=[])
+                result = {'m': m, 'ef_construction': ef_construction, 'ef_search': ef_search,
+                          'build_s': build_seconds, **measure(collection, queries, truth, k)}
+                results.append(result)
+                print(f"M={m:<3} ef_construction={ef_construction:<4} ef_search={ef_search:<4} "
+                      f"recall@{k}={result['recall']:.4f}  p50={result['p50_ms']:.2f}ms  "
+                      f"p95={result['p95_ms']:.2f}ms  build={build_seconds:.1f}s")
+    finally:
+        from chromadb.api.client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+        shutil.rmtree(scratch, ignore_errors=True)
+    return results
+
+def parse_ints(value):
+    return [int(v) for v in str(value).split(',')]
+
+# --- To run this script ---
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--path', default=CHROMA_PATH, help='persisted Chroma directory')
+    parser.add_argument('--collection', default=COLLECTION_NAME)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    tune_parser = commands.add_parser('tune', help='recall/latency sweep on scratch copies of the collection')
+    tune_parser.add_argument('--m', default='8,16,32', help='comma-separated hnsw M (max_neighbors) values')
+    tune_parser.add_argument('--ef-construction', default='100,200')
+    tune_parser.add_argument('--ef-search', default='10,20,50,100,200')
+    tune_parser.add_argument('--queries', type=int, default=200, help='held-out profiles used as queries')
+    tune_parser.add_argument('--query-log', help='also query with the /ask queries in this query log')
+    tune_parser.add_argument('--k', type=int, default=RECALL_K)
+    tune_parser.add_argument('--min-recall', type=float, default=0.95,
+                             help='recommend the fastest setting with at least this recall')
+    tune_parser.add_argument('--output', help='write results as JSON')
+
+    rebuild_parser = commands.add_parser('rebuild', help='rewrite the collection with new HNSW parameters')
+    rebuild_parser.add_argument('--m', type=int, required=True)
+    rebuild_parser.add_argument('--ef-construction', type=int, required=True)
+    rebuild_parser.add_argument('--ef-search', type=int, required=True)
+    rebuild_parser.add_argument('--tuning-results', help='JSON from tune; the matching row is recorded too')
+
+    commands.add_parser('compact', help='rewrite the collection with its current parameters and vacuum')
+    args = parser.parse_args()
+
+    import chromadb
+    client = chromadb.PersistentClient(path=args.path)
+    collection = client.get_collection(args.collection)
+
+    if args.command == 'tune':
+        print(f"Reading {collection.count()} embeddings from '{args.collection}'...")
+        ids, embeddings, metadatas = read_collection(collection)
+        extra = logged_query_embeddings(args.query_log, args.queries) if args.query_log else None
+        results = tune(ids, embeddings, metadatas, parse_ints(args.m), parse_ints(args.ef_construction),
+                       parse_ints(args.ef_search), args.queries, args.k, extra)
+        good = [r for r in results if r['recall'] >= args.min_recall]
+        best = min(good, key=lambda r: r['p50_ms']) if good else max(results, key=lambda r: r['recall'])
+        print(f"Current: {current_hnsw(collection)}")
+        print(f"Suggested: python tune_chroma.py rebuild --m {best['m']} --ef-construction {best['ef_construction']} "
+              f"--ef-search {best['ef_search']}   (recall@{args.k}={best['recall']:.4f}, p50={best['p50_ms']:.2f}ms)")
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'collection': args.collection, 'profiles': len(ids), 'k': args.k,
+                           'current': current_hnsw(collection), 'results': results}, f, indent=2)
+            print(f"Results written to {args.output}")
+    else:
+        if args.command == 'rebuild':
+            params = {'m': args.m, 'ef_construction': args.ef_construction, 'ef_search': args.ef_search,
+                      'space': current_hnsw(collection)['space']}
+        else:
+            params = current_hnsw(collection)
+        record = {}
+        if getattr(args, 'tuning_results', None):
+            with open(args.tuning_results) as f:
+                tuning = json.load(f)
+            for row in tuning['results']:
+                if (row['m'], row['ef_construction'], row['ef_search']) == (params['m'], params['ef_construction'], params['ef_search']):
+                    record = {f"recall_at_{tuning['k']}": row['recall'], 'p50_ms': row['p50_ms']}
+        size_before = directory_size(args.path)
+        start = time.perf_counter()
+        rebuilt = rebuild_collection(client, args.collection, params['m'], params['ef_construction'],
+                                     params['ef_search'], params['space'], record)
+        count = rebuilt.count()
+        vacuum(args.path)
+        print(f"Rebuilt '{args.collection}' ({count} records) with {params} "
+              f"in {time.perf_counter() - start:.1f}s; {args.path}: "
+              f"{size_before / 1e6:.1f} MB -> {directory_size(args.path) / 1e6:.1f} MB")
@@ -0,0 +1,151 @@
+"""
+Result-plot rendering benchmark.
+
+Builds the chat/dashboard result figures (trajectory map, measurements over
+time, per-float comparison) for synthetic /ask results of increasing size and
+reports, per figure: build time, JSON serialization time (what Streamlit does
+before sending a figure to the browser), payload size and trace/point counts.
+The previous one-trace-per-float, every-point implementation is measured
+alongside as the baseline. With --render each figure is also drawn by
+plotly.js in headless Chromium through kaleido.
+
+    python benchmarks/bench_plots.py --points 1000,10000,100000
+    python benchmarks/bench_plots.py --points 10000 --render --output plots.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+import pandas as pd
+import plotly
+import plotly.graph_objects as go
+
+FRONTEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, FRONTEND_DIR)
+import plots
+
+def synthetic_results(n_points, profiles_per_float=100, seed=0):
+    """An /ask-shaped response with n_points profiles spread over n_points / profiles_per_float floats"""
+    rng = np.random.default_rng(seed)
+    n_floats = max(1, n_points // profiles_per_float)
+    float_ids = rng.choice(np.arange(1000000, 9999999), n_floats, replace=False)[rng.integers(0, n_floats, n_points)]
+    start = rng.uniform(-20, 20, (n_floats, 2))
+    codes = np.searchsorted(np.sort(np.unique(float_ids)), float_ids)
+    dates = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 240 * 86400, n_points), unit='s')
+    df = pd.DataFrame({
+        'profile_id': np.arange(n_points),
+        'float_id': float_ids,
+        'date': dates.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'latitude': start[codes % n_floats, 0] + rng.normal(0, 1, n_points),
+        'longitude': 70 + start[codes % n_floats, 1] + rng.normal(0, 1, n_points),
+        'temperature_count': rng.integers(50, 500, n_points),
+        'pressure_count': rng.integers(50, 500, n_points),
+    })
+    return {'results': df.to_dict(orient='records'), 'count': n_points}
+
+# --- Baseline: the per-float, every-point figures these replaced (styling omitted) ---
+def baseline_trajectory_map(data):
+    df = pd.DataFrame(data['results'])
+    fig = go.Figure()
+    for float_id in df['float_id'].unique():
+        float_data = df[df['float_id'] == float_id].copy()
+        float_data['date'] = pd.to_datetime(float_data['date'])
+        float_data = float_data.sort_values('date')
+        fig.add_trace(plots.MAP_TRACE(
+            lon=float_data['longitude'], lat=float_data['latitude'], mode='markers+lines', name=f'Float {float_id}',
+            text=[f"Float {float_id}<br>Date: {date}<br>Lat: {lat:.3f}<br>Lon: {lon:.3f}<br>Temp points: {t}<br>Pressure points: {p}"
+                  for date, lat, lon, t, p in zip(float_data['date'], float_data['latitude'], float_data['longitude'],
+                                                 float_data['temperature_count'], float_data['pressure_count'])],
+            hovertemplate='%{text}<extra></extra>'))
+    fig.update_layout(**{plots.MAP_LAYOUT: dict(style="open-street-map", zoom=3)}, height=500)
+    return fig
+
+def baseline_time_series(data):
+    df = pd.DataFrame(data['results'])
+    df['date'] = pd.to_datetime(df['date'])
+    df = df.sort_values('date')
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=df['date'], y=df['temperature_count'], mode='lines+markers'))
+    fig.add_trace(go.Scatter(x=df['date'], y=df['pressure_count'], mode='lines+markers'))
+    return fig
+
+def baseline_comparison(data):
+    df = pd.DataFrame(data['results'])
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=df['float_id'].astype(str), y=df['temperature_count'], text=df['temperature_count']))
+    fig.add_trace(go.Bar(x=df['float_id'].astype(str), y=df['pressure_count'], text=df['pressure_count']))
+    fig.add_hline(y=df['temperature_count'].mean(), line_dash="dash", annotation_text="Avg Temperature")
+    fig.add_hline(y=df['pressure_count'].mean(), line_dash="dash", annotation_text="Avg Pressure")
+    return fig
+
+FIGURES = {
+    'trajectory_map': (plots.create_float_trajectory_map, baseline_trajectory_map),
+    'time_series': (plots.create_time_series_plot, baseline_time_series),
+    'comparison': (plots.create_comparison_plot, baseline_comparison),
+}
+
+# --- Measurement ---
+def point_count(fig):
+    total = 0
+    for trace in fig.data:
+        for axis in ('x', 'lat'):
+            values = getattr(trace, axis, None)
+            if values is not None:
+                total += len(values)
+                break
+    return total
+
+def measure(build, data, render):
+    start = time.perf_counter()
+    fig = build(data)
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    payload = fig.to_json()
+    json_s = time.perf_counter() - start
+    result = {'build_ms': build_s * 1000, 'json_ms': json_s * 1000, 'payload_kb': len(payload) / 1024,
+              'traces': len(fig.data), 'points': point_count(fig)}
+    if render:
+        start = time.perf_counter()
+        fig.to_image(format='png', width=1000, height=500)
+        result['render_ms'] = (time.perf_counter() - start) * 1000
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--points', default='1000,10000,100000', help='comma-separated profile counts')
+    parser.add_argument('--profiles-per-float', type=int, default=100)
+    parser.add_argument('--figures', default=','.join(FIGURES), help='comma-separated figures to measure')
+    parser.add_argument('--skip-baseline', action='store_true', help='only measure the current figures')
+    parser.add_argument('--render', action='store_true', help='also render each figure to PNG with kaleido')
+    parser.add_argument('--output', help='write results as JSON')
+    args = parser.parse_args()
+
+    # First use of each trace type loads Plotly's validators; keep that out of the timings
+    warmup = synthetic_results(200, args.profiles_per_float)
+    for current, baseline in FIGURES.values():
+        current(warmup)
+        baseline(warmup)
+
+    rows = []
+    for n_points in [int(n) for n in args.points.split(',')]:
+        data = synthetic_results(n_points, args.profiles_per_float)
+        for name in args.figures.split(','):
+            current, baseline = FIGURES[name]
+            for variant, build in (('current', current), ('baseline', baseline)):
+                if variant == 'baseline' and args.skip_baseline:
+                    continue
+                result = {'points_in': n_points, 'figure': name, 'variant': variant, **measure(build, data, args.render)}
+                rows.append(result)
+                render = f"  render={result['render_ms']:.0f}ms" if 'render_ms' in result else ''
+                print(f"{n_points:>7} {name:<15} {variant:<9} build={result['build_ms']:8.1f}ms  "
+                      f"json={result['json_ms']:8.1f}ms  payload={result['payload_kb']:9.1f}KB  "
+                      f"traces={result['traces']:<5} points={result['points']}{render}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'python': platform.python_version(), 'plotly': plotly.__version__,
+                       'results': rows}, f, indent=2)
+        print(f"Results written to {args.output}")
@@ -6,8 +6,15 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import json
 import io
+import os
+import tempfile
+import uuid
+from collections import OrderedDict
+import numpy as np
 from datetime import datetime
 import time
+from profile_payload import unpack_profiles
+from plots import MAP_TRACE, MAP_LAYOUT, create_float_trajectory_map, create_depth_pressure_plot, create_time_series_plot, create_comparison_plot
 
 # Page configuration
 st.set_page_config(
@@ -175,15 +182,53 @@ st.markdown("""
 # Initialize session state
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
+if 'chat_artifacts' not in st.session_state:
+    st.session_state.chat_artifacts = OrderedDict()
 
 # Backend API configuration
 BACKEND_URL = "http://localhost:5000"
+PLOT_MAX_LEVELS = 500
+# (lat_min, lat_max, lon_min, lon_max) for the dashboard region filter
+REGION_BOUNDS = {
+    "Indian Ocean": (-30, 30, 20, 120),
+    "Arabian Sea": (0, 25, 50, 77),
+    "Bay of Bengal": (5, 23, 80, 95)
+}
+
+# Cache lifetimes (seconds). Stats and dashboard results are shared across
+# reruns and sessions; chat queries are never cached.
+STATS_TTL = 300
+DASHBOARD_TTL = 600
+HTTP_POOL_SIZE = 16
+TRAJECTORY_MAX_FLOATS = 200   # larger results draw paths from the matched profiles only
+
+# Chat history limits: only the newest results stay in session state (older
+# ones are written to CHAT_SPILL_DIR and read back when expanded), and only
+# the most recently shown messages keep their built figures and exports.
+CHAT_RESULTS_IN_MEMORY = 3
+CHAT_ARTIFACT_CACHE_SIZE = 5
+CHAT_SPILL_DIR = os.path.join(tempfile.gettempdir(), "floatchat_results")
 
 # Helper functions
+@st.cache_resource
+def get_session():
+    """One pooled HTTP session per server process, so reruns reuse connections to the backend"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def backend_error(e):
+    """The {"error": ...} dict for a failed backend request"""
+    if isinstance(e, requests.exceptions.HTTPError):
+        return {"error": f"Backend error: {e.response.status_code}"}
+    return {"error": f"Connection error: {str(e)}"}
+
 def query_backend(user_query):
     """Send query to Flask backend"""
     try:
-        response = requests.post(
+        response = get_session().post(
             f"{BACKEND_URL}/ask",
             json={"query": user_query},
             timeout=30
@@ -195,58 +240,170 @@ def query_backend(user_query):
     except requests.exceptions.RequestException as e:
         return {"error": f"Connection error: {str(e)}"}
 
+# The cached fetchers raise on failure, so an error is retried on the next
+# rerun instead of being served from the cache until the TTL runs out
+@st.cache_data(ttl=STATS_TTL, show_spinner=False)
+def fetch_stats():
+    response = get_session().get(f"{BACKEND_URL}/stats", timeout=10)
+    response.raise_for_status()
+    return response.json()
+
 def get_stats():
     """Get statistics from backend"""
     try:
-        response = requests.get(f"{BACKEND_URL}/stats", timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"error": f"Backend error: {response.status_code}"}
+        return fetch_stats()
     except requests.exceptions.RequestException as e:
-        return {"error": f"Connection error: {str(e)}"}
+        return backend_error(e)
+
+@st.cache_data(ttl=DASHBOARD_TTL, show_spinner=False)
+def fetch_dashboard_query(region, start, end, parameters):
+    """/ask response for the dashboard filters, keyed on the filter values"""
+    filter_query = f"Show profiles in {region} from {start} to {end} with {', '.join(parameters)}"
+    response = get_session().post(f"{BACKEND_URL}/ask", json={"query": filter_query}, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+def map_zoom(bounds):
+    """Map zoom level that fits a (lat_min, lat_max, lon_min, lon_max) box; world view without bounds"""
+    if bounds is None:
+        return 1
+    span = max(bounds[1] - bounds[0], bounds[3] - bounds[2], 1e-3)
+    return int(np.clip(np.log2(360 / span) + 1, 0, 8))
+
+@st.cache_data(ttl=DASHBOARD_TTL, show_spinner=False)
+def fetch_grid(bounds=None, start=None, end=None, zoom=3, time_bin="none"):
+    params = {'zoom': zoom, 'time_bin': time_bin}
+    if bounds is not None:
+        params.update(zip(('lat_min', 'lat_max', 'lon_min', 'lon_max'), bounds))
+    if start is not None:
+        params['start'] = str(start)
+    if end is not None:
+        params['end'] = str(end)
+    response = get_session().get(f"{BACKEND_URL}/profiles/grid", params=params, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+def get_grid(bounds=None, start=None, end=None, zoom=3, time_bin="none"):
+    """Profile counts and surface temperature pre-binned into lat/lon cells by the backend"""
+    try:
+        return fetch_grid(bounds, start, end, zoom, time_bin)
+    except requests.exceptions.RequestException as e:
+        return backend_error(e)
+
+@st.cache_data(ttl=DASHBOARD_TTL, show_spinner=False)
+def fetch_trajectories(float_ids, zoom):
+    response = get_session().post(f"{BACKEND_URL}/floats/trajectories",
+                                  json={'ids': list(float_ids), 'zoom': zoom}, timeout=30)
+    response.raise_for_status()
+    return response.json()['trajectories']
+
+def get_trajectories(results):
+    """
+    (tracks, zoom) for the map of an /ask result: each matched float's whole
+    path, simplified by the backend for the zoom that fits the matches.
+    tracks is None when there are too many floats or the backend has none.
+    """
+    df = pd.DataFrame([r for r in results.get('results', []) if 'warning' not in r])
+    if df.empty or not {'float_id', 'latitude', 'longitude'} <= set(df.columns):
+        return None, 3
+    df = df.dropna(subset=['float_id', 'latitude', 'longitude'])
+    if df.empty:
+        return None, 3
+    zoom = map_zoom((df['latitude'].min(), df['latitude'].max(), df['longitude'].min(), df['longitude'].max()))
+    try:
+        float_ids = tuple(sorted(int(f) for f in df['float_id'].unique()))
+        if len(float_ids) > TRAJECTORY_MAX_FLOATS:
+            return None, zoom
+        return fetch_trajectories(float_ids, zoom) or None, zoom
+    except (requests.exceptions.RequestException, KeyError, ValueError):
+        return None, zoom
+
+def get_dashboard_data(region, start, end, parameters):
+    """
+    Grid and /ask results for the dashboard filters. They are kept in session
+    state and only fetched again when a filter changes, so chat reruns never
+    re-query the backend for the dashboard.
+    """
+    filters = (region, start, end, tuple(parameters))
+    cached = st.session_state.get('dashboard')
+    if cached is not None and cached['filters'] == filters:
+        return cached['grid'], cached['response']
+    
+    bounds = REGION_BOUNDS.get(region)
+    grid = get_grid(bounds, start, end, zoom=map_zoom(bounds))
+    try:
+        response = fetch_dashboard_query(region, start, end, tuple(parameters))
+    except requests.exceptions.RequestException as e:
+        response = backend_error(e)
+    # Failures are not kept, so the next rerun tries again
+    if "error" not in grid and "error" not in response:
+        st.session_state.dashboard = {'filters': filters, 'grid': grid, 'response': response}
+    return grid, response
+
+def decode_profile_payload(payload):
+    """Decode the backend's float32 + offsets profile payload into {profile_id: {variable: array}}"""
+    try:
+        return unpack_profiles(payload)
+    except ValueError:
+        return {}
+
+@st.cache_data(ttl=DASHBOARD_TTL, show_spinner=False)
+def fetch_profile_payload(profile_ids, max_levels=None, min_pressure=None, max_pressure=None):
+    """Binary /profiles/data payload, keyed on the profile ids and level options"""
+    params = {'ids': ','.join(str(pid) for pid in profile_ids)}
+    if max_levels:
+        params['max_levels'] = max_levels
+    if min_pressure is not None:
+        params['min_pressure'] = min_pressure
+    if max_pressure is not None:
+        params['max_pressure'] = max_pressure
+    response = get_session().get(f"{BACKEND_URL}/profiles/data", params=params, timeout=30)
+    response.raise_for_status()
+    return response.content
+
+def get_profile_measurements(profile_ids, max_levels=None, min_pressure=None, max_pressure=None):
+    """Fetch pressure/temperature/salinity arrays for profiles from the binary endpoint"""
+    if not profile_ids:
+        return {}
+    try:
+        return decode_profile_payload(fetch_profile_payload(tuple(profile_ids), max_levels, min_pressure, max_pressure))
+    except requests.exceptions.RequestException:
+        return {}
 
 # Visualization functions
-def create_float_trajectory_map(data, key_suffix=""):
-    """Create a trajectory map using Plotly"""
-    if not data or 'results' not in data:
+def create_grid_map(grid, bounds=None, key_suffix=""):
+    """Gridded profile density map: one marker per cell, coloured by mean surface temperature"""
+    if not grid or not grid.get('cells'):
         return go.Figure()
     
-    profile_data = [r for r in data['results'] if 'warning' not in r]
-    if not profile_data:
-        return go.Figure()
-    
-    df = pd.DataFrame(profile_data)
-    
-    fig = go.Figure()
-    
-    # Group by float_id and create trajectories
-    for float_id in df['float_id'].unique():
-        float_data = df[df['float_id'] == float_id].copy()
-        float_data['date'] = pd.to_datetime(float_data['date'])
-        float_data = float_data.sort_values('date')
-        
-        fig.add_trace(go.Scattermapbox(
-            lon=float_data['longitude'],
-            lat=float_data['latitude'],
-            mode='markers+lines',
-            name=f'Float {float_id}',
-            marker=dict(size=8),
-            line=dict(width=2),
-            text=[f"Float {float_id}<br>Date: {date}<br>Lat: {lat:.3f}<br>Lon: {lon:.3f}<br>Temp points: {temp_count}<br>Pressure points: {pres_count}" 
-                  for date, lat, lon, temp_count, pres_count in zip(
-                      float_data['date'], float_data['latitude'], float_data['longitude'],
-                      float_data['temperature_count'], float_data['pressure_count'])],
-            hovertemplate='%{text}<extra></extra>'
-        ))
+    counts = np.asarray(grid['profile_count'], dtype=float)
+    resolution = grid['resolution']
+    fig = go.Figure(MAP_TRACE(
+        lat=grid['latitude'],
+        lon=grid['longitude'],
+        mode='markers',
+        marker=dict(
+            size=6 + 14 * np.sqrt(counts / counts.max()),
+            color=[np.nan if t is None else t for t in grid['mean_surface_temperature']],
+            colorscale='Turbo',
+            colorbar=dict(title='Mean SST (°C)'),
+            opacity=0.8
+        ),
+        customdata=np.column_stack([grid['profile_count'], grid['float_count'],
+                                    [np.nan if t is None else t for t in grid['max_surface_temperature']]]),
+        hovertemplate=(f"Cell {resolution:g}°: %{{lat:.2f}}, %{{lon:.2f}}<br>Profiles: %{{customdata[0]}}"
+                       "<br>Floats: %{customdata[1]}<br>Mean SST: %{marker.color:.2f} °C"
+                       "<br>Max SST: %{customdata[2]:.2f} °C<extra></extra>")
+    ))
     
+    if bounds is not None:
+        center = dict(lat=(bounds[0] + bounds[1]) / 2, lon=(bounds[2] + bounds[3]) / 2)
+    else:
+        center = dict(lat=float(np.average(grid['latitude'], weights=counts)),
+                      lon=float(np.average(grid['longitude'], weights=counts)))
     fig.update_layout(
-        mapbox=dict(
-            style="open-street-map",
-            center=dict(lat=df['latitude'].mean(), lon=df['longitude'].mean()),
-            zoom=3
-        ),
-        title='Float Trajectories',
+        **{MAP_LAYOUT: dict(style="open-street-map", center=center, zoom=map_zoom(bounds))},
+        title=f"{grid['total_profiles']} profiles in {grid['cells']} cells of {resolution:g}°",
         height=500,
         plot_bgcolor='rgba(0,0,0,0)',
         paper_bgcolor='rgba(0,0,0,0)',
@@ -266,33 +423,43 @@ def create_depth_temperature_plot(data, key_suffix=""):
     
     fig = go.Figure()
     
-    for idx, row in enumerate(profile_data[:5]):  # Limit to first 5 floats
+    rows = profile_data[:5]  # Limit to first 5 floats
+    measurements = get_profile_measurements(
+        [row['profile_id'] for row in rows if row.get('profile_id') is not None],
+        max_levels=PLOT_MAX_LEVELS
+    )
+    
+    for idx, row in enumerate(rows):
         try:
+            if row.get('profile_id') in measurements:
+                arrays = measurements[row['profile_id']]
+                valid = ~(np.isnan(arrays['temperature']) | np.isnan(arrays['pressure']))
+                temp_vals = arrays['temperature'][valid].tolist()
+                pres_vals = arrays['pressure'][valid].tolist()
             # Handle the case where temperature_values and pressure_levels might be missing
-            if 'temperature_values' not in row or 'pressure_levels' not in row:
+            elif 'temperature_values' not in row or 'pressure_levels' not in row:
                 continue
+            else:
+                temps = json.loads(row['temperature_values']) if row['temperature_values'] else []
+                pressures = json.loads(row['pressure_levels']) if row['pressure_levels'] else []
                 
-            temps = json.loads(row['temperature_values']) if row['temperature_values'] else []
-            pressures = json.loads(row['pressure_levels']) if row['pressure_levels'] else []
-            
-            if temps and pressures:
                 # Parse temperature and pressure values
                 temp_vals = [float(t.get('value', 0)) if isinstance(t, dict) else float(t) for t in temps]
                 pres_vals = [float(p.get('value', 0)) if isinstance(p, dict) else float(p) for p in pressures]
-                
-                # Take minimum length to avoid index errors
-                min_len = min(len(temp_vals), len(pres_vals))
-                if min_len > 0:
-                    fig.add_trace(go.Scatter(
-                        x=temp_vals[:min_len],
-                        y=pres_vals[:min_len],
-                        mode='lines+markers',
-                        name=f"Float {row['float_id']}",
-                        line=dict(width=2),
-                        marker=dict(size=6),
-                        text=[f"Depth: {p:.1f} dbar<br>Temp: {t:.2f}°C" for t, p in zip(temp_vals[:min_len], pres_vals[:min_len])],
-                        hovertemplate='%{text}<extra></extra>'
-                    ))
+            
+            # Take minimum length to avoid index errors
+            min_len = min(len(temp_vals), len(pres_vals))
+            if min_len > 0:
+                fig.add_trace(go.Scatter(
+                    x=temp_vals[:min_len],
+                    y=pres_vals[:min_len],
+                    mode='lines+markers',
+                    name=f"Float {row['float_id']}",
+                    line=dict(width=2),
+                    marker=dict(size=6),
+                    text=[f"Depth: {p:.1f} dbar<br>Temp: {t:.2f}°C" for t, p in zip(temp_vals[:min_len], pres_vals[:min_len])],
+                    hovertemplate='%{text}<extra></extra>'
+                ))
         except (json.JSONDecodeError, KeyError, ValueError) as e:
             continue
     
@@ -308,195 +475,6 @@ def create_depth_temperature_plot(data, key_suffix=""):
     )
     return fig
 
-def create_depth_pressure_plot(data, key_suffix=""):
-    """Create depth vs pressure profile plot (redundant but kept for consistency)"""
-    if not data or 'results' not in data:
-        return go.Figure()
-    
-    profile_data = [r for r in data['results'] if 'warning' not in r]
-    if not profile_data:
-        return go.Figure()
-    
-    fig = go.Figure()
-    
-    # Create a simple pressure distribution plot instead
-    pressure_counts = [row.get('pressure_count', 0) for row in profile_data]
-    float_ids = [str(row['float_id']) for row in profile_data]
-    
-    fig.add_trace(go.Bar(
-        x=float_ids,
-        y=pressure_counts,
-        marker_color='#10b981',
-        text=pressure_counts,
-        textposition='auto',
-    ))
-    
-    fig.update_layout(
-        title='Pressure Measurements per Float',
-        xaxis_title='Float ID',
-        yaxis_title='Number of Pressure Measurements',
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        font=dict(color='white'),
-        height=500
-    )
-    return fig
-
-def create_time_series_plot(data, key_suffix=""):
-    """Create time series plot"""
-    if not data or 'results' not in data:
-        return go.Figure()
-    
-    profile_data = [r for r in data['results'] if 'warning' not in r]
-    if not profile_data:
-        return go.Figure()
-    
-    df = pd.DataFrame(profile_data)
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.sort_values('date')
-    
-    fig = go.Figure()
-    
-    fig.add_trace(go.Scatter(
-        x=df['date'],
-        y=df['temperature_count'],
-        mode='lines+markers',
-        name='Temperature Measurements',
-        marker=dict(size=8, color='#60a5fa'),
-        line=dict(width=2)
-    ))
-    
-    fig.add_trace(go.Scatter(
-        x=df['date'],
-        y=df['pressure_count'],
-        mode='lines+markers',
-        name='Pressure Measurements',
-        marker=dict(size=8, color='#10b981'),
-        line=dict(width=2)
-    ))
-    
-    fig.update_layout(
-        title='Measurements Over Time',
-        xaxis_title='Date',
-        yaxis_title='Number of Measurements',
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        font=dict(color='white'),
-        height=500
-    )
-    return fig
-
-def create_comparison_plot(data, key_suffix=""):
-    """Create enhanced comparison plot of measurements by float"""
-    if not data or 'results' not in data:
-        return go.Figure()
-    
-    profile_data = [r for r in data['results'] if 'warning' not in r]
-    if not profile_data:
-        return go.Figure()
-    
-    df = pd.DataFrame(profile_data)
-    
-    fig = go.Figure()
-    
-    # Enhanced temperature bars
-    fig.add_trace(go.Bar(
-        x=df['float_id'].astype(str),
-        y=df['temperature_count'],
-        name='Temperature Measurements',
-        marker=dict(
-            color='rgba(0, 212, 170, 0.8)',
-            line=dict(color='rgba(0, 212, 170, 1)', width=2),
-            pattern=dict(shape="", size=8)
-        ),
-        text=df['temperature_count'],
-        textposition='outside',
-        textfont=dict(color='white', size=11),
-        hovertemplate='<b>Float %{x}</b><br>Temperature: %{y} measurements<extra></extra>',
-        offsetgroup=1
-    ))
-    
-    # Enhanced pressure bars
-    fig.add_trace(go.Bar(
-        x=df['float_id'].astype(str),
-        y=df['pressure_count'],
-        name='Pressure Measurements',
-        marker=dict(
-            color='rgba(255, 107, 107, 0.8)',
-            line=dict(color='rgba(255, 107, 107, 1)', width=2),
-            pattern=dict(shape="x", size=8)
-        ),
-        text=df['pressure_count'],
-        textposition='outside',
-        textfont=dict(color='white', size=11),
-        hovertemplate='<b>Float %{x}</b><br>Pressure: %{y} measurements<extra></extra>',
-        offsetgroup=2
-    ))
-    
-    # Add summary statistics
-    avg_temp = df['temperature_count'].mean()
-    avg_press = df['pressure_count'].mean()
-    
-    # Add average lines
-    fig.add_hline(
-        y=avg_temp, 
-        line_dash="dash", 
-        line_color="#00D4AA",
-        annotation_text=f"Avg Temperature: {avg_temp:.1f}",
-        annotation_position="top left",
-        annotation_font_color="white"
-    )
-    
-    fig.add_hline(
-        y=avg_press, 
-        line_dash="dash", 
-        line_color="#FF6B6B",
-        annotation_text=f"Avg Pressure: {avg_press:.1f}",
-        annotation_position="bottom left",
-        annotation_font_color="white"
-    )
-    
-    fig.update_layout(
-        title=dict(
-            text='Measurement Comparison by Float',
-            font=dict(size=20, color='white'),
-            x=0.5
-        ),
-        xaxis_title='Float ID',
-        yaxis_title='Number of Measurements',
-        barmode='group',
-        bargap=0.15,
-        bargroupgap=0.1,
-        plot_bgcolor='rgba(0,0,0,0.1)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        font=dict(color='white', size=12),
-        height=500,
-        showlegend=True,
-        legend=dict(
-            bgcolor='rgba(255,255,255,0.1)',
-            bordercolor='rgba(255,255,255,0.3)',
-            borderwidth=1,
-            font=dict(color='white'),
-            orientation='h',
-            x=0.5,
-            y=1.02,
-            xanchor='center'
-        ),
-        xaxis=dict(
-            gridcolor='rgba(255,255,255,0.2)',
-            zerolinecolor='rgba(255,255,255,0.3)',
-            tickfont=dict(color='white'),
-            showgrid=True
-        ),
-        yaxis=dict(
-            gridcolor='rgba(255,255,255,0.2)',
-            zerolinecolor='rgba(255,255,255,0.3)',
-            tickfont=dict(color='white'),
-            showgrid=True
-        )
-    )
-    return fig
-
 # Export functions
 def export_data_as_csv(data):
     if not data or 'results' not in data:
@@ -525,6 +503,131 @@ def export_data_as_ascii(data):
                      f"{r.get('temperature_count', 0)},{r.get('pressure_count', 0)}\n")
     return output.getvalue().encode('utf-8')
 
+def render_exports(data, artifacts, key, name):
+    """
+    Download buttons for a result. With a query id the full result (every
+    measurement level) is streamed from the backend's /export endpoint, so
+    nothing is buffered here; otherwise the shown rows are exported locally.
+    """
+    query_id = data.get("query_id")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if query_id:
+            st.link_button("📊 Download as CSV", f"{BACKEND_URL}/export/{query_id}?format=csv")
+        elif artifacts["csv"]:
+            st.download_button(label="📊 Download as CSV", data=artifacts["csv"], file_name=f"argo_{name}_{artifacts['created']}.csv", mime="text/csv", key=f"csv_{key}")
+    with col2:
+        if query_id:
+            st.link_button("🧱 Download as Parquet", f"{BACKEND_URL}/export/{query_id}?format=parquet")
+    with col3:
+        if artifacts["ascii"]:
+            st.download_button(label="📝 Download as ASCII", data=artifacts["ascii"], file_name=f"argo_{name}_{artifacts['created']}.txt", mime="text/plain", key=f"ascii_{key}")
+
+# Chat history
+def spill_old_results(history):
+    """Move the results of all but the newest CHAT_RESULTS_IN_MEMORY answers out of session state"""
+    answers = [m for m in history if m["role"] == "assistant" and "results" in m.get("results", {})]
+    for message in answers[:-CHAT_RESULTS_IN_MEMORY]:
+        path = os.path.join(CHAT_SPILL_DIR, f"{message['id']}.json")
+        try:
+            os.makedirs(CHAT_SPILL_DIR, exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(message["results"], f)
+        except OSError:
+            continue
+        message["results"] = {"count": message["results"].get("count", 0), "spilled": path}
+
+def clear_chat_history():
+    for message in st.session_state.chat_history:
+        spilled = message.get("results", {}).get("spilled")
+        if spilled:
+            try:
+                os.remove(spilled)
+            except OSError:
+                pass
+    st.session_state.chat_history = []
+    st.session_state.chat_artifacts = OrderedDict()
+
+def message_results(message):
+    """A message's /ask response, read back from disk if it was spilled"""
+    results = message.get("results", {})
+    if "spilled" not in results:
+        return results
+    try:
+        with open(results["spilled"]) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"error": "These results are no longer available. Ask again to reload them."}
+
+def message_artifacts(message):
+    """
+    Table, exports and figures for one answer, built the first time it is
+    shown and reused on later reruns. Kept for the CHAT_ARTIFACT_CACHE_SIZE
+    most recently shown messages.
+    """
+    cache = st.session_state.chat_artifacts
+    if message["id"] in cache:
+        cache.move_to_end(message["id"])
+        return cache[message["id"]]
+    
+    results = message_results(message)
+    if "error" in results:
+        return results
+    display_df = pd.DataFrame([r for r in results.get('results', []) if 'warning' not in r])
+    # Remove the JSON columns for display
+    for col in ['temperature_values', 'pressure_levels']:
+        if col in display_df.columns:
+            display_df = display_df.drop(col, axis=1)
+    key = message["id"]
+    tracks, zoom = get_trajectories(results)
+    artifacts = {
+        "table": display_df,
+        "csv": None if results.get("query_id") else export_data_as_csv(results),
+        "ascii": export_data_as_ascii(results),
+        "temp": create_depth_temperature_plot(results, f"chat_temp_{key}"),
+        "press": create_depth_pressure_plot(results, f"chat_press_{key}"),
+        "time": create_time_series_plot(results, f"chat_time_{key}"),
+        "map": create_float_trajectory_map(results, f"chat_map_{key}", tracks, zoom),
+        "comp": create_comparison_plot(results, f"chat_comp_{key}"),
+        "created": datetime.now().strftime('%Y%m%d_%H%M%S')
+    }
+    cache[message["id"]] = artifacts
+    while len(cache) > CHAT_ARTIFACT_CACHE_SIZE:
+        cache.popitem(last=False)
+    return artifacts
+
+def render_message_results(message):
+    """Result tabs for one assistant message"""
+    results = message["results"]
+    if "error" in results:
+        st.error(f"❌ Error: {results['error']}")
+        return
+    if results.get('count', 0) == 0:
+        return
+    artifacts = message_artifacts(message)
+    if "error" in artifacts:
+        st.error(f"❌ Error: {artifacts['error']}")
+        return
+    if artifacts["table"].empty:
+        return
+    
+    key = message["id"]
+    st.markdown("---")
+    tab_data, tab_temp, tab_press, tab_time, tab_map, tab_comp = st.tabs(["Data Table", "🌡️ Temperature", "📊 Pressure", "⏳ Time", "🗺️ Map", "📈 Compare"])
+    with tab_data:
+        st.dataframe(artifacts["table"], use_container_width=True, hide_index=True)
+        render_exports(message_results(message), artifacts, f"chat_{key}", "data")
+    with tab_temp:
+        st.plotly_chart(artifacts["temp"], use_container_width=True, key=f"temp_chart_chat_{key}")
+    with tab_press:
+        st.plotly_chart(artifacts["press"], use_container_width=True, key=f"press_chart_chat_{key}")
+    with tab_time:
+        st.plotly_chart(artifacts["time"], use_container_width=True, key=f"time_chart_chat_{key}")
+    with tab_map:
+        st.plotly_chart(artifacts["map"], use_container_width=True, key=f"map_chart_chat_{key}")
+    with tab_comp:
+        st.plotly_chart(artifacts["comp"], use_container_width=True, key=f"comp_chart_chat_{key}")
+
 # Main function
 def main():
     with st.sidebar:
@@ -563,7 +666,7 @@ def main():
 
         st.markdown("---")
         if st.button("🗑️ Clear Chat History", use_container_width=True):
-            st.session_state.chat_history = []
+            clear_chat_history()
             st.rerun()
 
     tab1, tab2 = st.tabs(["💬 Chatbot", "📊 Dashboard"])
@@ -584,52 +687,26 @@ def main():
             </div>
             """, unsafe_allow_html=True)
 
-        for idx, message in enumerate(st.session_state.chat_history):
+        history = st.session_state.chat_history
+        latest_answer = next((m["id"] for m in reversed(history) if m["role"] == "assistant"), None)
+        for message in history:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
                 if message["role"] == "assistant" and "results" in message:
-                    results = message["results"]
-                    if "error" in results:
-                        st.error(f"❌ Error: {results['error']}")
-                    elif results.get('count', 0) > 0 and 'results' in results and results['results']:
-                        st.markdown("---")
-                        profile_data = [r for r in results['results'] if 'warning' not in r]
-                        if profile_data:
-                            tab_data, tab_temp, tab_press, tab_time, tab_map, tab_comp = st.tabs(["Data Table", "🌡️ Temperature", "📊 Pressure", "⏳ Time", "🗺️ Map", "📈 Compare"])
-                            with tab_data:
-                                display_df = pd.DataFrame(profile_data)
-                                # Remove the JSON columns for display
-                                for col in ['temperature_values', 'pressure_levels']:
-                                    if col in display_df.columns:
-                                        display_df = display_df.drop(col, axis=1)
-                                st.dataframe(display_df, use_container_width=True, hide_index=True)
-                                col1, col2 = st.columns(2)
-                                with col1:
-                                    csv_data = export_data_as_csv(results)
-                                    if csv_data:
-                                        st.download_button(label="📊 Download as CSV", data=csv_data, file_name=f"argo_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv", mime="text/csv", key=f"csv_chat_{idx}")
-                                with col2:
-                                    ascii_data = export_data_as_ascii(results)
-                                    if ascii_data:
-                                        st.download_button(label="📝 Download as ASCII", data=ascii_data, file_name=f"argo_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt", mime="text/plain", key=f"ascii_chat_{idx}")
-                            with tab_temp:
-                                st.plotly_chart(create_depth_temperature_plot(results, f"chat_temp_{idx}"), use_container_width=True, key=f"temp_chart_chat_{idx}")
-                            with tab_press:
-                                st.plotly_chart(create_depth_pressure_plot(results, f"chat_press_{idx}"), use_container_width=True, key=f"press_chart_chat_{idx}")
-                            with tab_time:
-                                st.plotly_chart(create_time_series_plot(results, f"chat_time_{idx}"), use_container_width=True, key=f"time_chart_chat_{idx}")
-                            with tab_map:
-                                st.plotly_chart(create_float_trajectory_map(results, f"chat_map_{idx}"), use_container_width=True, key=f"map_chart_chat_{idx}")
-                            with tab_comp:
-                                st.plotly_chart(create_comparison_plot(results, f"chat_comp_{idx}"), use_container_width=True, key=f"comp_chart_chat_{idx}")
+                    # Older answers stay collapsed; nothing is built or sent until they are opened
+                    if message["id"] == latest_answer or "error" in message["results"]:
+                        render_message_results(message)
+                    elif message["results"].get("count", 0) > 0 and st.toggle("Show results", key=f"show_{message['id']}"):
+                        render_message_results(message)
 
         st.markdown('</div>', unsafe_allow_html=True)
 
         if prompt := st.chat_input("Ask about ARGO data..."):
-            st.session_state.chat_history.append({"role": "user", "content": prompt})
+            st.session_state.chat_history.append({"id": uuid.uuid4().hex, "role": "user", "content": prompt})
             with st.spinner("🤔 Thinking..."):
                 response = query_backend(prompt)
                 assistant_message = {
+                    "id": uuid.uuid4().hex,
                     "role": "assistant",
                     "results": response
                 }
@@ -639,26 +716,30 @@ def main():
                     count = response.get('count', 0)
                     assistant_message["content"] = f"✅ I found {count} ARGO profiles matching your query. Here are the results:" if count > 0 else "🤷‍♂️ I couldn't find any ARGO profiles matching your query. Please try rephrasing it."
                 st.session_state.chat_history.append(assistant_message)
+                spill_old_results(st.session_state.chat_history)
             st.rerun()
 
     with tab2:
         st.markdown("### 📊 ARGO Data Dashboard")
-        filter_query = f"Show profiles in {region} from {date_range[0]} to {date_range[1]} with {', '.join(parameters)}"
+        bounds = REGION_BOUNDS.get(region)
+        start, end = (date_range[0], date_range[-1]) if date_range else (None, None)
         with st.spinner("Loading dashboard data..."):
-            response = query_backend(filter_query)
+            grid, response = get_dashboard_data(region, start, end, parameters)
+        st.markdown("#### 🌍 Profile Density")
+        if "error" in grid:
+            st.error(f"❌ Error: {grid['error']}")
+        elif grid.get('cells'):
+            st.plotly_chart(create_grid_map(grid, bounds, "dashboard_map"), use_container_width=True, key="dashboard_map_chart")
+        else:
+            st.info("No profiles in the selected region and dates.")
         
         if "error" in response:
             st.error(f"❌ Error: {response['error']}")
         elif response.get('count', 0) > 0 and 'results' in response and response['results']:
             profile_data = [r for r in response['results'] if 'warning' not in r]
             if profile_data:
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.markdown("#### 🌍 Float Trajectories")
-                    st.plotly_chart(create_float_trajectory_map(response, "dashboard_map"), use_container_width=True, key="dashboard_map_chart")
-                with col2:
-                    st.markdown("#### 📈 Measurement Counts")
-                    st.plotly_chart(create_comparison_plot(response, "dashboard_comp"), use_container_width=True, key="dashboard_comp_chart")
+                st.markdown("#### 📈 Measurement Counts")
+                st.plotly_chart(create_comparison_plot(response, "dashboard_comp"), use_container_width=True, key="dashboard_comp_chart")
                 
                 st.markdown("#### 📉 Depth Profiles")
                 tab_temp, tab_press, tab_time = st.tabs(["🌡️ Temperature", "📊 Pressure", "⏳ Time"])
@@ -676,15 +757,11 @@ def main():
                     if col in display_df.columns:
                         display_df = display_df.drop(col, axis=1)
                 st.dataframe(display_df, use_container_width=True, hide_index=True)
-                col1, col2 = st.columns(2)
-                with col1:
-                    csv_data = export_data_as_csv(response)
-                    if csv_data:
-                        st.download_button(label="📊 Download as CSV", data=csv_data, file_name=f"argo_dashboard_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv", mime="text/csv", key="dashboard_csv")
-                with col2:
-                    ascii_data = export_data_as_ascii(response)
-                    if ascii_data:
-                        st.download_button(label="📝 Download as ASCII", data=ascii_data, file_name=f"argo_dashboard_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt", mime="text/plain", key="dashboard_ascii")
+                render_exports(response, {
+                    "csv": None if response.get("query_id") else export_data_as_csv(response),
+                    "ascii": export_data_as_ascii(response),
+                    "created": datetime.now().strftime('%Y%m%d_%H%M%S')
+                }, "dashboard", "dashboard")
         else:
             st.warning("No data available for the selected filters. Try adjusting the parameters.")
 
@@ -0,0 +1,390 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Point budgets for result plots. Larger results are decimated before they
+# reach Plotly, so the figure sent to the browser stays the same size at any
+# profile count.
+MAX_MAP_POINTS = 5000
+MAX_SERIES_POINTS = 2000
+MAX_BAR_FLOATS = 60
+MARKERS_UP_TO = 500            # lines only past this many points
+# Plotly 5.24+ draws maps with MapLibre (Scattermap, layout.map); Scattermapbox
+# is gone in Plotly 7
+MAP_TRACE = go.Scattermap if hasattr(go, 'Scattermap') else go.Scattermapbox
+MAP_LAYOUT = 'map' if hasattr(go, 'Scattermap') else 'mapbox'
+FLOAT_COLORS = ['#60a5fa', '#10b981', '#f59e0b', '#ef4444', '#a78bfa',
+                '#f472b6', '#22d3ee', '#84cc16', '#fb923c', '#e5e7eb']
+
+# --- Decimation ---
+def lttb_indices(x, y, n_out):
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps when reducing
+    (x, y) to n_out points. x must be sorted; first and last points are kept.
+    Bucket centroids and per-candidate area terms are computed for all buckets
+    at once; only the argmax, which depends on the previous bucket's pick,
+    runs per bucket.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Triangle areas only get compared within a bucket, so each axis can be
+    # rescaled to [0, 1]; that keeps the expanded area formula below exact
+    # enough for datetime64 nanoseconds
+    x = (x - x[0]) / ((x[-1] - x[0]) or 1.0)
+    y = (y - y.min()) / ((y.max() - y.min()) or 1.0)
+    # n_out - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    # Each bucket's successor centroid: the next bucket's mean, or the last point
+    cx = np.append(np.add.reduceat(x[1:n - 1], edges[:-1] - 1)[1:] / counts[1:], x[-1])
+    cy = np.append(np.add.reduceat(y[1:n - 1], edges[:-1] - 1)[1:] / counts[1:], y[-1])
+    # Buckets as rows of a matrix; short rows repeat their last point, which
+    # never wins argmax over its first occurrence
+    columns = np.arange(counts.max())
+    index = np.minimum(edges[:-1, None] + columns, edges[1:, None] - 1)
+    bx, by = x[index], y[index]
+    # Twice the triangle area between point a, a candidate and the centroid is
+    # |x_a * (y - cy) + y_a * (cx - x) + (x * cy - cx * y)|
+    p, q, r = by - cy[:, None], cx[:, None] - bx, bx * cy[:, None] - cx[:, None] * by
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        a = index[i, np.argmax(np.abs(p[i] * x[a] + q[i] * y[a] + r[i]))]
+        keep[i + 1] = a
+    return keep
+
+def decimate_series(x, y, max_points=MAX_SERIES_POINTS):
+    """(x, y) sorted by x, without missing values, reduced to at most max_points with LTTB"""
+    series = pd.DataFrame({'x': x, 'y': y}).dropna().sort_values('x', kind='stable')
+    keep = lttb_indices(series['x'].astype(np.int64) if pd.api.types.is_datetime64_any_dtype(series['x'])
+                        else series['x'], series['y'], max_points)
+    series = series.iloc[keep]
+    return series['x'], series['y']
+
+def thin_tracks(df, max_points=MAX_MAP_POINTS):
+    """
+    Every k-th position of each float (plus its last) so the total stays near
+    max_points; df must be sorted by float_id and date.
+    """
+    step = int(np.ceil(len(df) / max_points))
+    if step <= 1:
+        return df
+    groups = df.groupby('float_id', sort=False)
+    position = groups.cumcount().to_numpy()
+    size = groups['float_id'].transform('size').to_numpy()
+    return df[(position % step == 0) | (position == size - 1)]
+
+def with_breaks(values, codes):
+    """values with a NaN after each run of equal codes, so one line trace draws separate segments"""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values) + (codes[-1] + 1 if len(codes) else 0), np.nan)
+    out[np.arange(len(values)) + codes] = values
+    return out
+
+def per_float_counts(profile_data, max_floats=MAX_BAR_FLOATS):
+    """
+    Mean temperature/pressure counts per float for the floats with the most
+    profiles (at most max_floats), and the total number of floats.
+    """
+    df = pd.DataFrame(profile_data)
+    per_float = df.groupby('float_id').agg(
+        profiles=('float_id', 'size'),
+        temperature_count=('temperature_count', 'mean'),
+        pressure_count=('pressure_count', 'mean'))
+    shown = per_float.nlargest(max_floats, 'profiles').sort_index()
+    return df, shown, len(per_float)
+
+def track_frame(tracks):
+    """Positions of whole-float paths from the backend's /floats/trajectories, already in date order"""
+    lengths = [len(t['latitude']) for t in tracks]
+    return pd.DataFrame({
+        'float_id': np.repeat([t['float_id'] for t in tracks], lengths),
+        'date': pd.to_datetime(pd.Series([d for t in tracks for d in t['date']], dtype=object), errors='coerce'),
+        'latitude': np.concatenate([np.asarray(t['latitude'], dtype=np.float64) for t in tracks]),
+        'longitude': np.concatenate([np.asarray(t['longitude'], dtype=np.float64) for t in tracks])
+    })
+
+def broken_dates(dates, codes):
+    """Hover date strings aligned with with_breaks output"""
+    out = np.full(len(dates) + (codes[-1] + 1 if len(codes) else 0), '', dtype=object)
+    out[np.arange(len(dates)) + codes] = dates.dt.strftime('%Y-%m-%d %H:%M').to_numpy()
+    return out
+
+# --- Figures ---
+def create_float_trajectory_map(data, key_suffix="", tracks=None, zoom=3):
+    """
+    Trajectories of every float as one map trace, coloured by float, with gaps
+    between floats. With tracks (whole-float paths from the backend) the line
+    follows each float's full path and the matched profiles are markers on
+    top; without them the path is rebuilt from the matched profiles alone.
+    """
+    if not data or 'results' not in data:
+        return go.Figure()
+
+    profile_data = [r for r in data['results'] if 'warning' not in r]
+    if not profile_data:
+        return go.Figure()
+
+    df = pd.DataFrame(profile_data)
+    df['date'] = pd.to_datetime(df['date'])
+    df = thin_tracks(df.sort_values(['float_id', 'date'], kind='stable'))
+    palette = [[i / (len(FLOAT_COLORS) - 1), color] for i, color in enumerate(FLOAT_COLORS)]
+    hover_counts = '<br>Temp points: %{customdata[1]:.0f}<br>Pressure points: %{customdata[2]:.0f}'
+    traces = []
+
+    if tracks:
+        paths = track_frame(tracks)
+        path_codes = pd.factorize(paths['float_id'])[0]
+        # Colours follow the path order, so a float's markers match its line
+        order = {f: i for i, f in enumerate(pd.unique(paths['float_id']))}
+        for f in pd.unique(df['float_id']):
+            order.setdefault(f, len(order))
+        n_floats = len(order)
+        traces.append(MAP_TRACE(
+            lon=with_breaks(paths['longitude'], path_codes),
+            lat=with_breaks(paths['latitude'], path_codes),
+            mode='lines',
+            line=dict(width=2, color='rgba(96, 165, 250, 0.6)'),
+            customdata=with_breaks(paths['float_id'], path_codes),
+            text=broken_dates(paths['date'], path_codes),
+            hovertemplate='Float %{customdata:.0f}<br>Date: %{text}<br>Lat: %{lat:.3f}<br>Lon: %{lon:.3f}<extra></extra>',
+            showlegend=False
+        ))
+        colors = df['float_id'].map(order).to_numpy() % len(FLOAT_COLORS)
+        customdata = np.column_stack([df[column].to_numpy(dtype=np.float64) if column in df else np.zeros(len(df))
+                                      for column in ('float_id', 'temperature_count', 'pressure_count')])
+        traces.append(MAP_TRACE(
+            lon=df['longitude'].to_numpy(dtype=np.float64),
+            lat=df['latitude'].to_numpy(dtype=np.float64),
+            mode='markers',
+            marker=dict(size=7, color=colors, colorscale=palette, cmin=0, cmax=len(FLOAT_COLORS) - 1),
+            customdata=customdata,
+            text=df['date'].dt.strftime('%Y-%m-%d %H:%M').to_numpy(),
+            hovertemplate=('Float %{customdata[0]:.0f} (matched)<br>Date: %{text}<br>Lat: %{lat:.3f}<br>Lon: %{lon:.3f}'
+                           + hover_counts + '<extra></extra>'),
+            showlegend=False
+        ))
+        center = dict(lat=paths['latitude'].mean(), lon=paths['longitude'].mean())
+    else:
+        codes = pd.factorize(df['float_id'])[0]
+        n_floats = int(codes.max()) + 1
+        # Numeric arrays throughout: Plotly validates object arrays element by element
+        customdata = np.column_stack([with_breaks(df[column], codes) if column in df else with_breaks(np.zeros(len(df)), codes)
+                                      for column in ('float_id', 'temperature_count', 'pressure_count')])
+        traces.append(MAP_TRACE(
+            lon=with_breaks(df['longitude'], codes),
+            lat=with_breaks(df['latitude'], codes),
+            mode='markers+lines',
+            marker=dict(size=7, color=with_breaks(codes % len(FLOAT_COLORS), codes), colorscale=palette,
+                        cmin=0, cmax=len(FLOAT_COLORS) - 1),
+            line=dict(width=2, color='rgba(96, 165, 250, 0.6)'),
+            customdata=customdata,
+            text=broken_dates(df['date'], codes),
+            hovertemplate='Float %{customdata[0]:.0f}<br>Date: %{text}<br>Lat: %{lat:.3f}<br>Lon: %{lon:.3f}'
+                          + hover_counts + '<extra></extra>',
+            showlegend=False
+        ))
+        center = dict(lat=df['latitude'].mean(), lon=df['longitude'].mean())
+
+    fig = go.Figure(traces)
+    fig.update_layout(
+        **{MAP_LAYOUT: dict(
+            style="open-street-map",
+            center=center,
+            zoom=zoom
+        )},
+        title=f'Float Trajectories ({n_floats} floats)',
+        height=500,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='white'),
+        margin=dict(l=0, r=0, t=40, b=0)
+    )
+    return fig
+
+def create_depth_pressure_plot(data, key_suffix=""):
+    """Create depth vs pressure profile plot (redundant but kept for consistency)"""
+    if not data or 'results' not in data:
+        return go.Figure()
+    
+    profile_data = [r for r in data['results'] if 'warning' not in r]
+    if not profile_data:
+        return go.Figure()
+    
+    # Mean pressure count per float, for the floats with the most profiles
+    _, shown, n_floats = per_float_counts(profile_data)
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=shown.index.astype(str),
+        y=shown['pressure_count'],
+        marker_color='#10b981',
+        text=shown['pressure_count'].round(1) if len(shown) <= 30 else None,
+        textposition='auto',
+    ))
+    
+    fig.update_layout(
+        title='Pressure Measurements per Float' + (f' (top {len(shown)} of {n_floats} floats)' if n_floats > len(shown) else ''),
+        xaxis_title='Float ID',
+        yaxis_title='Number of Pressure Measurements',
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='white'),
+        height=500
+    )
+    return fig
+
+def create_time_series_plot(data, key_suffix=""):
+    """Measurement counts over time as WebGL traces, LTTB-decimated past MAX_SERIES_POINTS"""
+    if not data or 'results' not in data:
+        return go.Figure()
+    
+    profile_data = [r for r in data['results'] if 'warning' not in r]
+    if not profile_data:
+        return go.Figure()
+    
+    # Only the plotted columns: building the frame from every result field costs more than the figure
+    df = pd.DataFrame(profile_data, columns=['date', 'temperature_count', 'pressure_count'])
+    df['date'] = pd.to_datetime(df['date'], utc=True).dt.tz_localize(None)
+    df = df.sort_values('date', kind='stable')
+    
+    fig = go.Figure()
+    for column, name, color in (('temperature_count', 'Temperature Measurements', '#60a5fa'),
+                                ('pressure_count', 'Pressure Measurements', '#10b981')):
+        x, y = decimate_series(df['date'], df[column])
+        fig.add_trace(go.Scattergl(
+            x=x,
+            y=y,
+            mode='lines+markers' if len(x) <= MARKERS_UP_TO else 'lines',
+            name=name,
+            marker=dict(size=8, color=color),
+            line=dict(width=2, color=color)
+        ))
+    
+    fig.update_layout(
+        title='Measurements Over Time' + (f' ({MAX_SERIES_POINTS} of {len(df)} points shown)' if len(df) > MAX_SERIES_POINTS else ''),
+        xaxis_title='Date',
+        yaxis_title='Number of Measurements',
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='white'),
+        height=500
+    )
+    return fig
+
+def create_comparison_plot(data, key_suffix=""):
+    """Create enhanced comparison plot of measurements by float"""
+    if not data or 'results' not in data:
+        return go.Figure()
+    
+    profile_data = [r for r in data['results'] if 'warning' not in r]
+    if not profile_data:
+        return go.Figure()
+    
+    # One bar pair per float (mean counts over its profiles), for the floats with the most profiles
+    df, shown, n_floats = per_float_counts(profile_data)
+    floats = shown.index.astype(str)
+    label_bars = len(shown) <= 30
+    
+    fig = go.Figure()
+    
+    # Enhanced temperature bars
+    fig.add_trace(go.Bar(
+        x=floats,
+        y=shown['temperature_count'],
+        name='Temperature Measurements',
+        marker=dict(
+            color='rgba(0, 212, 170, 0.8)',
+            line=dict(color='rgba(0, 212, 170, 1)', width=2),
+            pattern=dict(shape="", size=8)
+        ),
+        text=shown['temperature_count'].round(1) if label_bars else None,
+        textposition='outside',
+        textfont=dict(color='white', size=11),
+        hovertemplate='<b>Float %{x}</b><br>Temperature: %{y} measurements<extra></extra>',
+        offsetgroup=1
+    ))
+    
+    # Enhanced pressure bars
+    fig.add_trace(go.Bar(
+        x=floats,
+        y=shown['pressure_count'],
+        name='Pressure Measurements',
+        marker=dict(
+            color='rgba(255, 107, 107, 0.8)',
+            line=dict(color='rgba(255, 107, 107, 1)', width=2),
+            pattern=dict(shape="x", size=8)
+        ),
+        text=shown['pressure_count'].round(1) if label_bars else None,
+        textposition='outside',
+        textfont=dict(color='white', size=11),
+        hovertemplate='<b>Float %{x}</b><br>Pressure: %{y} measurements<extra></extra>',
+        offsetgroup=2
+    ))
+    
+    # Add summary statistics
+    avg_temp = df['temperature_count'].mean()
+    avg_press = df['pressure_count'].mean()
+    
+    # Add average lines
+    fig.add_hline(
+        y=avg_temp, 
+        line_dash="dash", 
+        line_color="#00D4AA",
+        annotation_text=f"Avg Temperature: {avg_temp:.1f}",
+        annotation_position="top left",
+        annotation_font_color="white"
+    )
+    
+    fig.add_hline(
+        y=avg_press, 
+        line_dash="dash", 
+        line_color="#FF6B6B",
+        annotation_text=f"Avg Pressure: {avg_press:.1f}",
+        annotation_position="bottom left",
+        annotation_font_color="white"
+    )
+    
+    fig.update_layout(
+        title=dict(
+            text='Measurement Comparison by Float' + (f' (top {len(shown)} of {n_floats})' if n_floats > len(shown) else ''),
+            font=dict(size=20, color='white'),
+            x=0.5
+        ),
+        xaxis_title='Float ID',
+        yaxis_title='Number of Measurements',
+        barmode='group',
+        bargap=0.15,
+        bargroupgap=0.1,
+        plot_bgcolor='rgba(0,0,0,0.1)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='white', size=12),
+        height=500,
+        showlegend=True,
+        legend=dict(
+            bgcolor='rgba(255,255,255,0.1)',
+            bordercolor='rgba(255,255,255,0.3)',
+            borderwidth=1,
+            font=dict(color='white'),
+            orientation='h',
+            x=0.5,
+            y=1.02,
+            xanchor='center'
+        ),
+        xaxis=dict(
+            gridcolor='rgba(255,255,255,0.2)',
+            zerolinecolor='rgba(255,255,255,0.3)',
+            tickfont=dict(color='white'),
+            showgrid=True
+        ),
+        yaxis=dict(
+            gridcolor='rgba(255,255,255,0.2)',
+            zerolinecolor='rgba(255,255,255,0.3)',
+            tickfont=dict(color='white'),
+            showgrid=True
+        )
+    )
+    return fig
@@ -0,0 +1,40 @@
+import struct
+import numpy as np
+
+# --- Binary payload layout ---
+# Decoder for the backend's /profiles/data payload. This is a copy of the
+# layout and unpack_profiles in backend/profile_payload.py, which writes it;
+# backend/tests/test_profile_payload.py checks the two stay in step.
+# All values are little-endian:
+#   magic b'ARGO', uint32 version, uint32 n_profiles, uint32 n_variables
+#   int64   profile_ids[n_profiles]
+#   int64   offsets[n_profiles + 1]        (shared by every variable)
+#   float32 values[offsets[-1]]            (one block per variable, in VARIABLES order)
+MAGIC = b'ARGO'
+FORMAT_VERSION = 1
+VARIABLES = ('pressure', 'temperature', 'salinity')
+
+def unpack_profiles(payload):
+    """Inverse of the backend's pack_profiles; returns {profile_id: {variable: array}} of zero-copy views"""
+    if payload[:4] != MAGIC:
+        raise ValueError("Not an ARGO profile payload")
+    version, n_profiles, n_variables = struct.unpack_from('<III', payload, 4)
+    if version != FORMAT_VERSION or n_variables != len(VARIABLES):
+        raise ValueError(f"Unsupported payload version {version}")
+
+    pos = 16
+    ids = np.frombuffer(payload, dtype='<i8', count=n_profiles, offset=pos)
+    pos += 8 * n_profiles
+    offsets = np.frombuffer(payload, dtype='<i8', count=n_profiles + 1, offset=pos)
+    pos += 8 * (n_profiles + 1)
+    total = int(offsets[-1])
+
+    blocks = {}
+    for var in VARIABLES:
+        blocks[var] = np.frombuffer(payload, dtype='<f4', count=total, offset=pos)
+        pos += 4 * total
+
+    return {
+        int(pid): {var: blocks[var][offsets[i]:offsets[i + 1]] for var in VARIABLES}
+        for i, pid in enumerate(ids)
+    }